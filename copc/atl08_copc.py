@@ -0,0 +1,278 @@
+"""Convert ICESat-2 ATL08 granules (HDF5) to COPC, in parallel.
+
+This is a native alternative to running the `atl08_hdf-to-las.json` PDAL pipeline
+once per granule.  The `land_segments` of all beams of a granule are read with
+h5py, filtered with vectorized array operations (by bounding box and/or AOI, and
+by the `h_canopy` fill value), and handed to PDAL as a single array, which is
+written to COPC (or LAS/LAZ).  Granules are converted concurrently by a process
+pool, so batch conversion scales with the number of cores, and no pipeline JSON
+needs to be templated per granule.
+
+Points have the same dimensions as those written by the PDAL pipeline (`X`, `Y`,
+`Z`, `HeightAboveGround`, `ElevationLow`, `OffsetTime`, and `GpsTime`), along
+with `PointSourceId`, the 1-based index of the point's beam in `BEAMS`.
+
+Usage (see `--help` for all options):
+
+    python atl08_copc.py -o /projects/copc ATL08_*.h5 --bbox 5.2 60.2 5.7 60.7
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import h5py
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+BEAMS = ("gt1l", "gt1r", "gt2l", "gt2r", "gt3l", "gt3r")
+
+# Point dimensions, and the datasets (within `<beam>/land_segments`) they come from
+DIMENSIONS = {
+    "X": "longitude",
+    "Y": "latitude",
+    "Z": "dem_h",
+    "HeightAboveGround": "canopy/h_canopy",
+    "ElevationLow": "terrain/h_te_best_fit",
+    "OffsetTime": "delta_time",
+}
+
+POINT_DTYPE = np.dtype(
+    [
+        ("X", "f8"),
+        ("Y", "f8"),
+        ("Z", "f8"),
+        ("HeightAboveGround", "f4"),
+        ("ElevationLow", "f4"),
+        ("OffsetTime", "f8"),
+        ("GpsTime", "f8"),
+        ("PointSourceId", "u2"),
+    ]
+)
+
+# GPS time (in seconds) of the ATLAS Standard Data Product epoch, from which
+# `delta_time` is measured (also given by `/ancillary_data/atlas_sdp_gps_epoch`)
+ATLAS_SDP_GPS_EPOCH = 1198800018.0
+
+# Fill value of `h_canopy` (the maximum float32 value)
+H_CANOPY_FILL = np.finfo(np.float32).max
+
+Bounds = Tuple[float, float, float, float]
+
+
+def gps_epoch(h5: h5py.File) -> float:
+    if "ancillary_data/atlas_sdp_gps_epoch" in h5:
+        return float(h5["ancillary_data/atlas_sdp_gps_epoch"][0])
+
+    return ATLAS_SDP_GPS_EPOCH
+
+
+def read_beam(
+    group: h5py.Group,
+    beam_id: int,
+    epoch: float,
+    bbox: Optional[Bounds] = None,
+    aoi=None,
+) -> np.ndarray:
+    """Read the points of the `land_segments` group of a beam, keeping only the
+    segments with a canopy height (i.e., not the fill value), within the bounding
+    box (`min_x, min_y, max_x, max_y`) and AOI (a shapely geometry), if given.
+    """
+    lon = group["longitude"][()]
+    lat = group["latitude"][()]
+    h_canopy = group["canopy/h_canopy"][()]
+    mask = np.isfinite(h_canopy) & (h_canopy < H_CANOPY_FILL)
+
+    if bbox is not None:
+        min_x, min_y, max_x, max_y = bbox
+        mask &= (lon >= min_x) & (lon <= max_x) & (lat >= min_y) & (lat <= max_y)
+
+    if aoi is not None and mask.any():
+        import shapely
+
+        (candidates,) = np.nonzero(mask)
+        mask[candidates] = shapely.intersects_xy(aoi, lon[candidates], lat[candidates])
+
+    points = np.empty(np.count_nonzero(mask), dtype=POINT_DTYPE)
+
+    for dimension, dataset in DIMENSIONS.items():
+        values = {"X": lon, "Y": lat, "HeightAboveGround": h_canopy}.get(dimension)
+        points[dimension] = (group[dataset][()] if values is None else values)[mask]
+
+    points["GpsTime"] = points["OffsetTime"] + epoch
+    points["PointSourceId"] = beam_id
+
+    return points
+
+
+def read_points(
+    path: os.PathLike, bbox: Optional[Bounds] = None, aoi=None
+) -> np.ndarray:
+    """Read the (filtered) points of all beams of an ATL08 granule (see
+    `read_beam`), skipping beams that are absent from the granule.
+    """
+    with h5py.File(path, "r") as h5:
+        epoch = gps_epoch(h5)
+
+        return np.concatenate(
+            [
+                read_beam(h5[f"{beam}/land_segments"], beam_id, epoch, bbox, aoi)
+                for beam_id, beam in enumerate(BEAMS, start=1)
+                if f"{beam}/land_segments" in h5
+            ]
+            or [np.empty(0, dtype=POINT_DTYPE)]
+        )
+
+
+def write_points(
+    points: np.ndarray, path: os.PathLike, color_ramp: Optional[str] = None
+) -> None:
+    """Write points to COPC (if the path ends with `.copc.laz`) or LAS/LAZ,
+    optionally coloring points by `Z`, using the named PDAL color ramp.
+    """
+    import pdal
+
+    pipeline = pdal.Pipeline(arrays=[points])
+
+    if color_ramp:
+        pipeline |= pdal.Filter.colorinterp(ramp=color_ramp, dimension="Z")
+
+    if str(path).endswith(".copc.laz"):
+        pipeline |= pdal.Writer.copc(filename=str(path), extra_dims="all")
+    else:
+        pipeline |= pdal.Writer.las(
+            filename=str(path), extra_dims="all", minor_version=4, dataformat_id=3
+        )
+
+    pipeline.execute()
+
+
+def output_path(path: os.PathLike, output_dir: os.PathLike, suffix: str) -> Path:
+    """Return the path of the output file of a granule.
+
+    >>> output_path("/data/ATL08_20211114213015_08161305_005_01.h5", "/out", ".laz")
+    PosixPath('/out/ATL08_20211114213015_08161305_005_01.laz')
+    """
+    return Path(output_dir) / f"{Path(path).stem}{suffix}"
+
+
+def convert_granule(
+    path: os.PathLike,
+    output_dir: os.PathLike,
+    suffix: str = ".copc.laz",
+    bbox: Optional[Bounds] = None,
+    aoi=None,
+    color_ramp: Optional[str] = None,
+) -> Tuple[Path, int]:
+    """Convert a granule, returning the path of its output file and its number of
+    points.  When no points remain after filtering, no file is written.
+    """
+    points = read_points(path, bbox, aoi)
+    output = output_path(path, output_dir, suffix)
+
+    if points.size:
+        write_points(points, output, color_ramp)
+
+    return output, points.size
+
+
+def _convert_granule(args: tuple) -> Tuple[Path, int]:
+    return convert_granule(*args)
+
+
+def convert_granules(
+    paths: Sequence[os.PathLike],
+    output_dir: os.PathLike,
+    suffix: str = ".copc.laz",
+    bbox: Optional[Bounds] = None,
+    aoi=None,
+    color_ramp: Optional[str] = None,
+    processes: Optional[int] = None,
+) -> Iterator[Tuple[Path, int]]:
+    """Convert granules concurrently (see `convert_granule`), with a pool of the
+    given number of processes (by default, the number of CPUs), yielding the
+    output path and number of points of every granule, in order.
+    """
+    args = [(path, output_dir, suffix, bbox, aoi, color_ramp) for path in paths]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        yield from pool.map(_convert_granule, args)
+
+
+def read_aoi(path: os.PathLike):
+    """Read the union of the geometries of a vector file (e.g., GeoJSON)."""
+    import geopandas as gpd
+
+    return gpd.read_file(path).to_crs("EPSG:4326").union_all()
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("granules", nargs="+", type=Path, help="ATL08 HDF5 files")
+    parser.add_argument(
+        "-o", "--output-dir", type=Path, default=Path("."), help="output directory"
+    )
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+        help="keep only segments within this bounding box",
+    )
+    parser.add_argument(
+        "--aoi",
+        type=Path,
+        help="keep only segments within the geometries of this vector file",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["copc", "las", "laz"],
+        default="copc",
+        help="output format (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--color-ramp",
+        default="pestel_shades",
+        help="PDAL color ramp for coloring points by Z, or '' for no colors"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="number of granules to convert concurrently (default: number of CPUs)",
+    )
+    args = parser.parse_args(argv)
+
+    suffix = {"copc": ".copc.laz", "las": ".las", "laz": ".laz"}[args.format]
+    aoi = read_aoi(args.aoi) if args.aoi else None
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    total = 0
+
+    for output, n_points in convert_granules(
+        args.granules,
+        args.output_dir,
+        suffix,
+        tuple(args.bbox) if args.bbox else None,
+        aoi,
+        args.color_ramp or None,
+        args.processes,
+    ):
+        total += n_points
+        logger.info(
+            f"wrote {n_points} points to {output}"
+            if n_points
+            else f"no points selected for {output}"
+        )
+
+    logger.info(f"converted {len(args.granules)} granules ({total} points)")
+
+
+if __name__ == "__main__":
+    main()
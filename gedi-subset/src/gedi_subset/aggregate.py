@@ -0,0 +1,260 @@
+"""Gridded aggregation of subsets, computed incrementally from partial aggregates.
+
+Rather than writing every selected shot to the output file, and aggregating the
+shots afterwards, shots may be aggregated into cells of a regular grid as they
+are subset.  Each worker computes *partial aggregates* for the shots of its
+granule, and the parent merges the partial aggregates of all granules, which
+are small, and can be merged in any order, into the final statistics per cell.
+
+A partial aggregate is a table with one row per (column, grid cell, bucket),
+containing the count, sum, sum of squares, minimum, and maximum of the values
+of the column within the cell that fall into the bucket.  Buckets are
+logarithmically spaced, such that the relative difference between values in the
+same bucket is bounded (as in DDSketch), which makes the table a mergeable
+quantile sketch, in addition to carrying the exact moments (summed over buckets).
+
+Functions:
+
+- merge_partials merges partial aggregates into a single partial aggregate
+- summarize computes per-cell statistics from a partial aggregate
+"""
+
+from __future__ import annotations
+
+import functools
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Sequence, Tuple
+
+from gedi_subset.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import numpy as np
+    import pandas as pd
+    import pyproj
+    import shapely
+    import shapely.geometry as shapely_geometry
+else:
+    gpd = lazy_import("geopandas", ignore_warnings=True)
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+    pyproj = lazy_import("pyproj")
+    shapely = lazy_import("shapely")
+    shapely_geometry = lazy_import("shapely.geometry")
+
+KEYS = ["column", "row", "col", "bucket"]
+MOMENTS = {"count": "sum", "sum": "sum", "sumsq": "sum", "min": "min", "max": "max"}
+
+#: Magnitude below which values are treated as zero by quantile sketches.
+MIN_MAGNITUDE = 1e-9
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer(crs: str) -> pyproj.Transformer:
+    return pyproj.Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+
+
+@dataclass(frozen=True)
+class Grid:
+    """Regular grid of square cells of the given size (in units of the CRS), with
+    cell `(row, col)` covering `[col, col + 1) * resolution` along x, and
+    `[row, row + 1) * resolution` along y.
+
+    The default is a grid of 1 km cells in the EASE-Grid 2.0 (global) equal-area
+    projection, as used by GEDI gridded products.
+    """
+
+    crs: str = "EPSG:6933"
+    resolution: float = 1000.0
+
+    def __post_init__(self) -> None:
+        if self.resolution <= 0:
+            raise ValueError(f"Grid resolution must be positive: {self.resolution}")
+
+    def cells(self, lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the rows and columns of the cells containing lon-lat points."""
+        x, y = _transformer(self.crs).transform(lon, lat)
+
+        return (
+            np.floor(np.asarray(y) / self.resolution).astype(np.int64),
+            np.floor(np.asarray(x) / self.resolution).astype(np.int64),
+        )
+
+    def cell_polygons(self, rows: np.ndarray, cols: np.ndarray) -> gpd.GeoSeries:
+        """Return the polygons of cells (in the grid's CRS)."""
+        rows, cols, size = np.asarray(rows), np.asarray(cols), self.resolution
+        bounds = (cols * size, rows * size, (cols + 1) * size, (rows + 1) * size)
+
+        if hasattr(shapely, "box"):
+            # Shapely 2 creates all of the polygons in a single (vectorized) call,
+            # which are then wrapped without (Python-level) validation of each one
+            polygons = gpd.array.GeometryArray(shapely.box(*bounds), crs=self.crs)
+            return gpd.GeoSeries(polygons)
+
+        return gpd.GeoSeries(
+            [shapely_geometry.box(*cell_bounds) for cell_bounds in zip(*bounds)],
+            crs=self.crs,
+        )
+
+
+def quantile_name(q: float) -> str:
+    """Return the name of the statistic of a quantile, as a percentile.
+
+    >>> [quantile_name(q) for q in (0.05, 0.5, 0.501, 0.999)]
+    ['q05', 'q50', 'q50_1', 'q99_9']
+    """
+    percentile = f"{q * 100:g}".replace(".", "_")
+
+    return f"q{percentile:0>2}"
+
+
+@dataclass(frozen=True)
+class Aggregation:
+    """Specification of the columns to aggregate, and how to aggregate them.
+
+    Quantiles are estimated to within the `relative_accuracy` of the true values.
+    """
+
+    columns: Sequence[str]
+    grid: Grid = Grid()
+    quantiles: Sequence[float] = (0.5,)
+    relative_accuracy: float = 0.01
+
+    def __post_init__(self) -> None:
+        names = list(map(quantile_name, self.quantiles))
+
+        if len(set(names)) < len(names):
+            raise ValueError(f"Quantiles must be distinct: {self.quantiles}")
+
+    @property
+    def gamma(self) -> float:
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    def buckets(self, values: np.ndarray) -> np.ndarray:
+        """Return the (signed) sketch buckets of values, where bucket 0 contains
+        values of (near) zero magnitude, and buckets are ordered as their values.
+        """
+        magnitude = np.abs(values) / MIN_MAGNITUDE
+        k = np.ceil(np.log(np.maximum(magnitude, 1)) / math.log(self.gamma))
+
+        return (np.sign(values) * np.where(magnitude > 1, np.maximum(k, 1), 0)).astype(
+            np.int64
+        )
+
+    def bucket_values(self, buckets: np.ndarray) -> np.ndarray:
+        """Return the representative values of sketch buckets."""
+        gamma = self.gamma
+        magnitude = MIN_MAGNITUDE * 2 * gamma ** np.abs(buckets) / (gamma + 1)
+
+        return np.where(buckets == 0, 0.0, np.sign(buckets) * magnitude)
+
+    def partial(self, gdf: gpd.GeoDataFrame) -> pd.DataFrame:
+        """Compute the partial aggregate of a subset (see the module docs)."""
+        rows, cols = self.grid.cells(
+            gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy()
+        )
+        frames = []
+
+        for column in self.columns:
+            values = gdf[column].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            values = values[valid]
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "column": column,
+                        "row": rows[valid],
+                        "col": cols[valid],
+                        "bucket": self.buckets(values),
+                        "count": np.ones_like(values, dtype=np.int64),
+                        "sum": values,
+                        "sumsq": values * values,
+                        "min": values,
+                        "max": values,
+                    }
+                )
+            )
+
+        return merge_partials(frames)
+
+
+def merge_partials(partials: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Merge partial aggregates (or rows of partial aggregates) into one."""
+    frames = [partial for partial in partials if not partial.empty]
+
+    if not frames:
+        columns = {**dict.fromkeys(KEYS, "int64"), "column": "object"}
+        return pd.DataFrame(
+            {name: pd.Series(dtype=dtype) for name, dtype in columns.items()}
+        ).assign(**{name: pd.Series(dtype=float) for name in MOMENTS})
+
+    return (
+        pd.concat(frames, ignore_index=True)
+        .groupby(KEYS, sort=False, as_index=False)
+        .agg(MOMENTS)
+    )
+
+
+def _cell_starts(partial: pd.DataFrame) -> np.ndarray:
+    """Return the indices of the first rows of the cells of a sorted partial."""
+    keys = [partial[name].to_numpy() for name in ("column", "row", "col")]
+    first = np.zeros(len(partial), dtype=bool)
+    first[:1] = True
+
+    for key in keys:
+        first[1:] |= key[1:] != key[:-1]
+
+    return np.flatnonzero(first)
+
+
+def _quantiles(
+    aggregation: Aggregation, partial: pd.DataFrame, starts: np.ndarray, q: float
+) -> np.ndarray:
+    """Estimate a quantile within every cell of a partial aggregate sorted by
+    `KEYS`, where `starts` are the indices of the first rows of the cells.
+    """
+    counts = partial["count"].to_numpy()
+    cumulative = np.cumsum(counts)
+    preceding = cumulative[starts] - counts[starts]
+    totals = np.diff(preceding, append=cumulative[-1:])
+    # The rank within each cell, offset by the counts of all preceding cells, so
+    # that a single search over all cells finds the bucket of every cell
+    i = np.searchsorted(cumulative, preceding + q * (totals - 1), side="right")
+    values = aggregation.bucket_values(partial["bucket"].to_numpy()[i])
+
+    # The extremes of the bucket's values bound the estimate
+    return np.clip(values, partial["min"].to_numpy()[i], partial["max"].to_numpy()[i])
+
+
+def summarize(aggregation: Aggregation, partial: pd.DataFrame) -> gpd.GeoDataFrame:
+    """Compute per-cell statistics from a partial aggregate.
+
+    Return a GeoDataFrame with one row per grid cell (with a polygon geometry in
+    the grid's CRS), with the `row` and `col` of the cell, along with the count,
+    mean, standard deviation, minimum, maximum, and quantiles (e.g., `agbd_q50`)
+    of every aggregated column (e.g., `agbd_count`, `agbd_mean`, etc.).
+    """
+    partial = partial.sort_values(KEYS, ignore_index=True)
+    cells = partial.groupby(["column", "row", "col"], sort=False)
+    stats = cells.agg(MOMENTS)
+    # The cells (groups) are in the order of their first rows
+    starts = _cell_starts(partial)
+    n = stats["count"]
+    stats["mean"] = stats["sum"] / n
+    variance = (stats["sumsq"] - n * stats["mean"] ** 2) / (n - 1).where(n > 1)
+    stats["std"] = np.sqrt(variance.clip(lower=0))
+
+    for q in aggregation.quantiles:
+        stats[quantile_name(q)] = _quantiles(aggregation, partial, starts, q)
+
+    stats = stats.drop(columns=["sum", "sumsq"])
+    wide = stats.unstack("column")
+    wide.columns = [f"{column}_{stat}" for stat, column in wide.columns]
+    ordered = [
+        f"{column}_{stat}" for column in aggregation.columns for stat in stats.columns
+    ]
+    wide = wide.reindex(columns=ordered).reset_index()
+    geometry = aggregation.grid.cell_polygons(wide["row"], wide["col"])
+
+    return gpd.GeoDataFrame(wide, geometry=geometry.values, crs=aggregation.grid.crs)
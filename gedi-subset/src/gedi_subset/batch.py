@@ -0,0 +1,179 @@
+"""Batches of AOI jobs that share granule downloads.
+
+Many subsetting jobs cover overlapping regions, and thus download and read many
+of the same granules.  A batch of AOI jobs is subset by searching for the union
+of the granules needed by the jobs, and downloading and reading each granule only
+once, routing the shots selected for each AOI to that AOI's own output.
+
+A batch is specified by either:
+
+- a vector file (e.g., GeoJSON) with one AOI per feature, where the optional
+  `name`, `columns`, and `query` properties of a feature override the defaults
+  for that AOI, or
+- a JSON file containing a list of objects, each with an `aoi` entry giving the
+  path of the AOI's vector file (relative to the JSON file), along with optional
+  `name`, `columns`, and `query` entries.
+
+Functions:
+
+- read_jobs reads the AOI jobs of a batch from a file
+- union_aoi returns the union of the AOIs of jobs (for granule searches)
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, List, Mapping, Optional, Sequence
+
+from gedi_subset.gedi_utils import split_columns
+from gedi_subset.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import shapely.ops as shapely_ops
+    from shapely.geometry.base import BaseGeometry
+
+    from gedi_subset.cover import AOICover
+else:
+    gpd = lazy_import("geopandas", ignore_warnings=True)
+    shapely_ops = lazy_import("shapely.ops")
+
+_NAME_PATTERN = re.compile(r"[\w.-]+")
+
+
+@dataclass(frozen=True)
+class AOIJob:
+    """An AOI to subset, along with the columns and query to subset it with.
+
+    The `name` of a job names its output file, and thus must contain only
+    letters, digits, underscores, periods, and hyphens.  The optional `cover` of
+    the AOI speeds up testing whether shots fall within the AOI.
+    """
+
+    name: str
+    aoi_gdf: gpd.GeoDataFrame
+    columns: Sequence[str]
+    query: str
+    cover: Optional[AOICover] = None
+
+    @property
+    def geometry(self) -> BaseGeometry:
+        return self.aoi_gdf.geometry[0]
+
+
+def _make_job(
+    spec: Mapping[str, Any],
+    aoi_gdf: gpd.GeoDataFrame,
+    default_name: str,
+    columns: Sequence[str],
+    query: str,
+) -> AOIJob:
+    name = spec.get("name") or default_name
+    job_columns = spec.get("columns") or columns
+
+    if not _NAME_PATTERN.fullmatch(name):
+        raise ValueError(f"Invalid AOI job name: {name!r}")
+
+    return AOIJob(
+        name,
+        aoi_gdf,
+        split_columns(job_columns) if isinstance(job_columns, str) else job_columns,
+        spec.get("query") or query,
+    )
+
+
+def _read_spec_job(
+    path: Path, n: int, spec: Any, columns: Sequence[str], query: str
+) -> AOIJob:
+    if not isinstance(spec, dict):
+        raise ValueError(f"AOI job {n}: expected an object, not {spec!r}")
+    if not isinstance(aoi := spec.get("aoi"), str) or not aoi:
+        raise ValueError(f"AOI job {n}: missing 'aoi' (the path of an AOI file)")
+
+    types = {"name": str, "columns": (str, list), "query": str}
+
+    if invalid := [
+        key for key, t in types.items() if not isinstance(spec.get(key, ""), t)
+    ]:
+        raise ValueError(f"AOI job {n}: invalid {', '.join(map(repr, invalid))}")
+
+    aoi_path = path.parent / aoi
+
+    if not aoi_path.is_file():
+        raise ValueError(f"AOI job {n}: AOI file not found: {aoi_path}")
+
+    # The errors of vector file readers vary by reader (fiona or pyogrio)
+    try:
+        aoi_gdf = gpd.read_file(aoi_path)
+    except Exception as e:
+        raise ValueError(f"AOI job {n}: cannot read {aoi_path}: {e}") from e
+
+    return _make_job(spec, aoi_gdf, aoi_path.stem, columns, query)
+
+
+def read_jobs(path: Path, columns: Sequence[str], query: str) -> List[AOIJob]:
+    """Read the AOI jobs of a batch from a file (see the module documentation).
+
+    Jobs that do not specify their own `columns` or `query` use the specified
+    defaults.  Jobs read from features are named `aoi_<n>` (where `n` is the
+    index of the feature) by default, and jobs read from AOI files are named by
+    the stems of their AOI files by default.
+
+    Raise `ValueError` if the file cannot be read, specifies no jobs, or
+    specifies invalid jobs (e.g., without an AOI file, or with invalid or
+    duplicate names), where jobs are numbered from 0 in error messages.
+    """
+    try:
+        specs = json.loads(path.read_text())
+    except (UnicodeDecodeError, ValueError):
+        specs = None
+
+    if isinstance(specs, list):
+        jobs = [
+            _read_spec_job(path, n, spec, columns, query)
+            for n, spec in enumerate(specs)
+        ]
+    else:
+        try:
+            features = gpd.read_file(path)
+        except Exception as e:
+            raise ValueError(f"Cannot read batch file {path}: {e}") from e
+
+        jobs = [
+            _make_job(
+                {
+                    key: value
+                    for key, value in feature.items()
+                    if key in ("name", "columns", "query") and isinstance(value, str)
+                },
+                features.iloc[[i]].reset_index(drop=True),
+                f"aoi_{i}",
+                columns,
+                query,
+            )
+            for i, feature in enumerate(
+                features.drop(columns="geometry").to_dict("records")
+            )
+        ]
+
+    if not jobs:
+        raise ValueError(f"No AOI jobs specified in {path}")
+
+    names = [job.name for job in jobs]
+
+    if duplicates := sorted({name for name in names if names.count(name) > 1}):
+        raise ValueError(f"Duplicate AOI job names: {', '.join(duplicates)}")
+
+    return jobs
+
+
+def union_aoi(jobs: Sequence[AOIJob]) -> gpd.GeoDataFrame:
+    """Return an AOI covering the AOIs of all of the jobs, for finding the granules
+    needed by any of the jobs with a single search.
+    """
+    geometry = shapely_ops.unary_union([job.geometry for job in jobs])
+
+    return gpd.GeoDataFrame(geometry=[geometry], crs="EPSG:4326")
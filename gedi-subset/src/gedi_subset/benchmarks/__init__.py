@@ -0,0 +1,5 @@
+"""Benchmarks of performance-sensitive parts of the subsetting pipeline.
+
+Each benchmark module is runnable (e.g., `python -m gedi_subset.benchmarks.startup`)
+and writes its results as JSON to standard output, for comparison across runs.
+"""
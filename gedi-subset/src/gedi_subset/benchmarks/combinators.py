@@ -0,0 +1,190 @@
+"""Micro-benchmarks of the iterable combinators of `gedi_subset.fp`.
+
+Reports the following, for tuning the stages of pipelines built from the
+combinators:
+
+- `overhead`: the time per item of mapping a trivial function with the builtin
+  `map`, with `Executor.map`, and with `parallel_map` (ordered and unordered),
+  for every number of workers
+- `scaling`: the throughput of `parallel_map` with increasing numbers of workers,
+  when every call waits (as for a request to a service) for the latency plus a
+  random jitter (up to the latency), ordered and unordered (unordered results
+  avoid waiting on slow calls when later calls are done)
+- `prefetch`: the time taken to consume items produced with the same latency
+  as consuming them takes, without and with `prefetch`
+- `rate_limited`: the rate of items achieved by `rate_limited`, given a rate
+
+Example:
+
+```plain
+python -m gedi_subset.benchmarks.combinators --items 200 --latency-ms 5 \\
+    --workers 1 --workers 4 --workers 16 --output combinators.json
+```
+"""
+
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import typer
+
+from gedi_subset.benchmarks.download import environment
+from gedi_subset.fp import parallel_map, prefetch, rate_limited
+
+
+@dataclass
+class CombinatorResult:
+    benchmark: str
+    variant: str
+    workers: int
+    items: int
+    seconds: float
+    items_per_second: float
+    microseconds_per_item: float
+
+
+def _timed(
+    benchmark: str,
+    variant: str,
+    workers: int,
+    items: int,
+    run: Callable[[], object],
+) -> CombinatorResult:
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+
+    return CombinatorResult(
+        benchmark=benchmark,
+        variant=variant,
+        workers=workers,
+        items=items,
+        seconds=seconds,
+        items_per_second=items / seconds,
+        microseconds_per_item=seconds / items * 1e6,
+    )
+
+
+def _consume(xs: Iterable[object]) -> None:
+    for _ in xs:
+        pass
+
+
+def measure_overhead(items: int, workers: int) -> Iterator[CombinatorResult]:
+    def identity(x: int) -> int:
+        return x
+
+    def executor_map() -> None:
+        with ThreadPoolExecutor(workers) as pool:
+            _consume(pool.map(identity, range(items)))
+
+    yield _timed(
+        "overhead", "map", 1, items, lambda: _consume(map(identity, range(items)))
+    )
+    yield _timed("overhead", "executor-map", workers, items, executor_map)
+
+    for ordered in (True, False):
+        yield _timed(
+            "overhead",
+            "parallel-map" if ordered else "parallel-map-unordered",
+            workers,
+            items,
+            lambda: _consume(
+                parallel_map(identity, workers, ordered=ordered)(range(items))
+            ),
+        )
+
+
+def measure_scaling(
+    items: int, workers: int, latency: float, seed: int = 0
+) -> Iterator[CombinatorResult]:
+    rng = random.Random(seed)
+    delays = [latency + rng.uniform(0, latency) for _ in range(items)]
+
+    for ordered in (True, False):
+        yield _timed(
+            "scaling",
+            "ordered" if ordered else "unordered",
+            workers,
+            items,
+            lambda: _consume(
+                parallel_map(time.sleep, workers, ordered=ordered)(delays)
+            ),
+        )
+
+
+def measure_prefetch(items: int, latency: float) -> Iterator[CombinatorResult]:
+    def produce() -> Iterator[int]:
+        for i in range(items):
+            time.sleep(latency)
+            yield i
+
+    def consume(xs: Iterable[int]) -> None:
+        for _ in xs:
+            time.sleep(latency)
+
+    yield _timed("prefetch", "none", 1, items, lambda: consume(produce()))
+
+    for n in (1, 4):
+        yield _timed(
+            "prefetch",
+            f"prefetch-{n}",
+            1,
+            items,
+            lambda: consume(prefetch(n)(produce())),
+        )
+
+
+def measure_rate_limited(items: int, rate: float) -> Iterator[CombinatorResult]:
+    yield _timed(
+        "rate_limited",
+        f"rate-{rate:g}",
+        1,
+        items,
+        lambda: _consume(rate_limited(rate)(range(items))),
+    )
+
+
+def run_benchmark(
+    items: int, workers: List[int], latency: float, rate: float
+) -> Iterator[CombinatorResult]:
+    """Run every benchmark, for every number of workers (where applicable)."""
+    for n in workers:
+        yield from measure_overhead(items * 10, n)
+
+    for n in workers:
+        yield from measure_scaling(items, n, latency)
+
+    yield from measure_prefetch(items, latency)
+    yield from measure_rate_limited(items, rate)
+
+
+def main(
+    items: int = typer.Option(
+        200, help="Number of items per measurement (10 times as many for overhead)"
+    ),
+    workers: List[int] = typer.Option([1, 4, 16], help="Number(s) of workers"),
+    latency_ms: float = typer.Option(
+        5.0, help="Latency of every call (scaling) or item (prefetch)"
+    ),
+    rate: float = typer.Option(1000.0, help="Rate (items per second) to limit to"),
+    output: Optional[Path] = typer.Option(
+        None, help="Also write the (JSON) results to this file"
+    ),
+) -> None:
+    results = run_benchmark(items, workers, latency_ms / 1000, rate)
+    report = dict(environment=environment(), results=[asdict(r) for r in results])
+    text = json.dumps(report, indent=2)
+
+    if output:
+        output.write_text(text)
+
+    typer.echo(text)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,551 @@
+"""Benchmark of granule download latency, throughput, and concurrency scaling.
+
+Serves synthetic GEDI-like HDF5 granules (of configurable sizes) from local
+stand-ins for the services granules are downloaded from (an HTTP server, and S3
+mocked by moto), and reports the latency and throughput of downloading them with
+each of the following transport modes, with increasing numbers of concurrent
+downloads:
+
+- `granule`: `gedi_subset.maapx.download_granule`, as used for subsetting
+- `single`: a single streamed GET of the whole object
+- `ranged`: concurrent ranged GETs of parts of the object, written in place
+- `remote-hdf5`: reading only the datasets that subsetting reads before
+  selecting rows (coordinates and a query dataset of every beam) with h5py
+  directly from the remote object, via ranged GETs, without downloading it
+
+Since the stand-ins are local, results reflect the client-side costs of each
+mode, plus any per-request latency added with `--latency-ms` (HTTP only), rather
+than the bandwidth of a real network, so they are meaningful for comparing modes
+and releases on the same machine, rather than as absolute numbers.
+
+Example:
+
+```plain
+python -m gedi_subset.benchmarks.download --size-mb 16 --size-mb 128 \\
+    --concurrency 1 --concurrency 4 --latency-ms 20 --output download.json
+```
+"""
+
+from __future__ import annotations
+
+import contextlib
+import http.server
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, cast
+
+import typer
+from returns.functions import raise_exception
+
+from gedi_subset.lazy import lazy_import
+from gedi_subset.maapx import download_granule, granule_from_metadata
+
+if TYPE_CHECKING:
+    import boto3
+    import h5py
+    import numpy as np
+    import requests
+    from maap.maap import MAAP
+else:
+    boto3 = lazy_import("boto3")
+    h5py = lazy_import("h5py")
+    np = lazy_import("numpy")
+    requests = lazy_import("requests")
+
+BEAMS = ("BEAM0000", "BEAM0001", "BEAM0010", "BEAM0011")
+
+#: Datasets of every beam read by `remote-hdf5` reads (see `read_remote_hdf5`).
+REMOTE_DATASETS = ("lat_lowestmode", "lon_lowestmode", "agbd")
+
+#: Number of `rh`-like values per shot, which make up most of a granule's size.
+PROFILE_SIZE = 101
+
+BUCKET = "benchmark-granules"
+MiB = 2**20
+
+
+class Backend(str, Enum):
+    http = "http"
+    s3 = "s3"
+
+
+class Mode(str, Enum):
+    granule = "granule"
+    single = "single"
+    ranged = "ranged"
+    remote_hdf5 = "remote-hdf5"
+
+
+def write_granule(path: Path, size: int) -> None:
+    """Write a synthetic granule of (roughly) the given size in bytes, with
+    chunked datasets for each beam laid out as in GEDI granules.
+    """
+    shot_size = len(REMOTE_DATASETS) * 8 + PROFILE_SIZE * 4
+    shots = max(size // (len(BEAMS) * shot_size), 1)
+    rng = np.random.default_rng(0)
+
+    with h5py.File(path, "w") as h5:
+        for beam in BEAMS:
+            group = h5.create_group(beam)
+
+            for name in REMOTE_DATASETS:
+                group.create_dataset(name, data=rng.random(shots), chunks=True)
+
+            group.create_dataset(
+                "rh",
+                data=rng.random((shots, PROFILE_SIZE), dtype=np.float32),
+                chunks=True,
+            )
+
+
+class _RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files from the server's directory, supporting single byte ranges,
+    after an optional delay per request (emulating network latency).
+    """
+
+    latency: float = 0.0
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        time.sleep(self.latency)
+        super().do_HEAD()
+
+    def do_GET(self) -> None:
+        time.sleep(self.latency)
+        path = Path(self.translate_path(self.path))
+
+        if not path.is_file():
+            self.send_error(404)
+            return
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+
+        if spec := self.headers.get("Range"):
+            first, _, last = spec.removeprefix("bytes=").partition("-")
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+
+            while remaining and (chunk := f.read(min(remaining, MiB))):
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+
+@contextlib.contextmanager
+def http_server(directory: Path, latency: float = 0.0) -> Iterator[str]:
+    """Serve the files in a directory over HTTP, yielding the server's base URL."""
+    handler = type(
+        "Handler",
+        (_RangeRequestHandler,),
+        dict(latency=latency, protocol_version="HTTP/1.1"),
+    )
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        lambda *args: handler(*args, directory=str(directory)),
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextlib.contextmanager
+def mock_s3_bucket(directory: Path) -> Iterator[str]:
+    """Upload the files in a directory to a bucket in S3 mocked by moto (for every
+    boto3 client in this process), yielding the bucket's `s3://` URL.
+    """
+    from moto import mock_s3
+
+    for name, value in dict(
+        AWS_ACCESS_KEY_ID="testing",
+        AWS_SECRET_ACCESS_KEY="testing",
+        AWS_DEFAULT_REGION="us-east-1",
+        # Newer botocore versions otherwise upload objects with aws-chunked
+        # encoding (for checksums), which moto stores verbatim
+        AWS_REQUEST_CHECKSUM_CALCULATION="when_required",
+    ).items():
+        os.environ.setdefault(name, value)
+
+    with mock_s3():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=BUCKET)
+
+        for path in directory.iterdir():
+            s3.upload_file(str(path), BUCKET, path.name)
+
+        yield f"s3://{BUCKET}"
+
+
+class Transport:
+    """Ranged and whole-object reads of objects at a URL, counting bytes read."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _count(self, n: int) -> None:
+        with self._lock:
+            self.bytes_read += n
+
+    def _s3(self):
+        if (client := getattr(self._local, "s3", None)) is None:
+            client = self._local.s3 = boto3.client("s3")
+        return client
+
+    def _session(self) -> requests.Session:
+        if (session := getattr(self._local, "session", None)) is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _bucket_key(self) -> tuple:
+        bucket, _, key = self.url.removeprefix("s3://").partition("/")
+        return bucket, key
+
+    def size(self) -> int:
+        if self.url.startswith("s3://"):
+            bucket, key = self._bucket_key()
+            return self._s3().head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+        response = self._session().head(self.url)
+        response.raise_for_status()
+        return int(response.headers["Content-Length"])
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """Read the bytes from `start` to `end` (inclusive)."""
+        if self.url.startswith("s3://"):
+            bucket, key = self._bucket_key()
+            body = self._s3().get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+            )["Body"]
+            data = body.read()
+        else:
+            response = self._session().get(
+                self.url, headers={"Range": f"bytes={start}-{end}"}
+            )
+            response.raise_for_status()
+            data = response.content
+
+        self._count(len(data))
+        return data
+
+    def stream_to(self, f: io.RawIOBase, chunk_size: int = MiB) -> None:
+        if self.url.startswith("s3://"):
+            bucket, key = self._bucket_key()
+            body = self._s3().get_object(Bucket=bucket, Key=key)["Body"]
+            chunks = body.iter_chunks(chunk_size)
+        else:
+            response = self._session().get(self.url, stream=True)
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size)
+
+        for chunk in chunks:
+            f.write(chunk)
+            self._count(len(chunk))
+
+
+class RemoteFile(io.RawIOBase):
+    """Read-only, seekable file whose reads are ranged reads of a remote object."""
+
+    def __init__(self, transport: Transport) -> None:
+        self.transport = transport
+        self.length = transport.size()
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}
+        self.position = base[whence] + offset
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.length)
+
+        if end <= self.position:
+            return 0
+
+        data = self.transport.read_range(self.position, end - 1)
+        buffer[: len(data)] = data
+        self.position += len(data)
+
+        return len(data)
+
+
+def download_with_granule(url: str, todir: Path) -> None:
+    metadata = {
+        "Granule": {
+            "GranuleUR": Path(url).name,
+            "OnlineAccessURLs": {"OnlineAccessURL": [{"URL": url}]},
+        }
+    }
+    # The MAAP instance is used only for obtaining S3 credentials for granules
+    # with an S3 credentials endpoint, which stand-in granules do not have.
+    maap = cast("MAAP", None)
+    granule = granule_from_metadata(maap, metadata)
+    download_granule(maap, str(todir), granule).alt(raise_exception)
+
+
+def download_single(transport: Transport, todir: Path) -> None:
+    with open(todir / Path(transport.url).name, "wb") as f:
+        transport.stream_to(f)
+
+
+def download_ranged(
+    transport: Transport, todir: Path, part_size: int, range_workers: int
+) -> None:
+    size = transport.size()
+    fd = os.open(todir / Path(transport.url).name, os.O_WRONLY | os.O_CREAT)
+
+    def fetch(start: int) -> None:
+        data = transport.read_range(start, min(start + part_size, size) - 1)
+        os.pwrite(fd, data, start)
+
+    try:
+        os.ftruncate(fd, size)
+
+        with ThreadPoolExecutor(range_workers) as pool:
+            list(pool.map(fetch, range(0, size, part_size)))
+    finally:
+        os.close(fd)
+
+
+def read_remote_hdf5(transport: Transport, block_size: int) -> None:
+    """Read the `REMOTE_DATASETS` of every beam directly from the remote granule."""
+    buffered = io.BufferedReader(RemoteFile(transport), buffer_size=block_size)
+
+    with h5py.File(buffered, "r") as h5:
+        for beam in BEAMS:
+            for name in REMOTE_DATASETS:
+                h5[beam][name][()]
+
+
+@dataclass
+class DownloadResult:
+    backend: str
+    mode: str
+    size_bytes: int
+    concurrency: int
+    repeat: int
+    latency_seconds: Dict[str, float]
+    wall_seconds: float
+    bytes_transferred: int
+    throughput_mib_per_second: float
+
+
+def _summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+
+    return dict(
+        min=ordered[0],
+        p50=statistics.median(ordered),
+        p90=ordered[min(int(0.9 * len(ordered)), len(ordered) - 1)],
+        max=ordered[-1],
+        mean=statistics.fmean(ordered),
+    )
+
+
+def measure_download(
+    backend: Backend,
+    url: str,
+    size: int,
+    mode: Mode,
+    concurrency: int,
+    repeat: int = 3,
+    part_size: int = 8 * MiB,
+    range_workers: int = 8,
+) -> DownloadResult:
+    """Download (or read) the object at a URL `concurrency` times at once, `repeat`
+    times over, reporting the latency of every download, and the aggregate
+    throughput of all of the downloads.
+    """
+    transport = Transport(url)
+    operations: Dict[Mode, Callable[[Path], None]] = {
+        Mode.granule: lambda todir: download_with_granule(url, todir),
+        Mode.single: lambda todir: download_single(transport, todir),
+        Mode.ranged: lambda todir: download_ranged(
+            transport, todir, part_size, range_workers
+        ),
+        Mode.remote_hdf5: lambda _: read_remote_hdf5(transport, part_size),
+    }
+    operation = operations[mode]
+    latencies: List[float] = []
+    wall = 0.0
+
+    def timed(todir: Path) -> float:
+        start = time.perf_counter()
+        operation(todir)
+        return time.perf_counter() - start
+
+    for _ in range(repeat):
+        todirs = [Path(tempfile.mkdtemp()) for _ in range(concurrency)]
+
+        try:
+            start = time.perf_counter()
+
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies.extend(pool.map(timed, todirs))
+
+            wall += time.perf_counter() - start
+        finally:
+            for todir in todirs:
+                shutil.rmtree(todir, ignore_errors=True)
+
+    # Granule downloads bypass the transport, so they transfer whole objects
+    transferred = (
+        size * concurrency * repeat if mode is Mode.granule else transport.bytes_read
+    )
+
+    return DownloadResult(
+        backend=backend.value,
+        mode=mode.value,
+        size_bytes=size,
+        concurrency=concurrency,
+        repeat=repeat,
+        latency_seconds=_summarize_latencies(latencies),
+        wall_seconds=wall,
+        bytes_transferred=transferred,
+        throughput_mib_per_second=transferred / MiB / wall,
+    )
+
+
+@contextlib.contextmanager
+def stand_in(backend: Backend, directory: Path, latency: float) -> Iterator[str]:
+    """Serve the files in a directory from a stand-in for a backend, yielding the
+    base URL of the files.
+    """
+    if backend is Backend.http:
+        with http_server(directory, latency) as url:
+            yield url
+    else:
+        with mock_s3_bucket(directory) as url:
+            yield url
+
+
+def run_benchmark(
+    backends: List[Backend],
+    modes: List[Mode],
+    sizes: List[int],
+    concurrencies: List[int],
+    repeat: int = 3,
+    part_size: int = 8 * MiB,
+    range_workers: int = 8,
+    latency: float = 0.0,
+) -> Iterator[DownloadResult]:
+    """Run every combination of backend, mode, size, and concurrency."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        directory = Path(tmpdir)
+
+        for size in sizes:
+            write_granule(directory / f"granule_{size}.h5", size)
+
+        for backend in backends:
+            with stand_in(backend, directory, latency) as base_url:
+                for size in sizes:
+                    name = f"granule_{size}.h5"
+                    actual_size = (directory / name).stat().st_size
+
+                    for mode in modes:
+                        for concurrency in concurrencies:
+                            yield measure_download(
+                                backend,
+                                f"{base_url}/{name}",
+                                actual_size,
+                                mode,
+                                concurrency,
+                                repeat,
+                                part_size,
+                                range_workers,
+                            )
+
+
+def environment() -> Dict[str, object]:
+    return dict(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+    )
+
+
+def main(
+    backend: List[Backend] = typer.Option(
+        [b.value for b in Backend], help="Stand-in backend(s) to download from"
+    ),
+    mode: List[Mode] = typer.Option(
+        [m.value for m in Mode], help="Transport mode(s) to benchmark"
+    ),
+    size_mb: List[float] = typer.Option([16.0], help="Granule size(s), in MiB"),
+    concurrency: List[int] = typer.Option(
+        [1, 4], help="Number(s) of concurrent downloads"
+    ),
+    repeat: int = typer.Option(3, help="Number of times to repeat each measurement"),
+    part_size_mb: float = typer.Option(
+        8.0, help="Part size of ranged downloads (and block size of remote reads)"
+    ),
+    range_workers: int = typer.Option(8, help="Concurrent parts per ranged download"),
+    latency_ms: float = typer.Option(
+        0.0, help="Latency added to every request to the HTTP stand-in"
+    ),
+    output: Optional[Path] = typer.Option(
+        None, help="Also write the (JSON) results to this file"
+    ),
+) -> None:
+    results = run_benchmark(
+        backend,
+        mode,
+        [int(size * MiB) for size in size_mb],
+        concurrency,
+        repeat,
+        int(part_size_mb * MiB),
+        range_workers,
+        latency_ms / 1000,
+    )
+    report = dict(environment=environment(), results=[asdict(r) for r in results])
+    text = json.dumps(report, indent=2)
+
+    if output:
+        output.write_text(text)
+
+    typer.echo(text)
+
+
+if __name__ == "__main__":
+    typer.run(main)
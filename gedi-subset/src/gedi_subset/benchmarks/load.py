@@ -0,0 +1,888 @@
+"""End-to-end load test of the subset CLI against local stand-ins for CMR and S3.
+
+Generates a catalog of (thousands of) synthetic GEDI L4A granules along synthetic
+ground tracks, and stands up the following local stand-ins for the services
+subsetting depends upon:
+
+- a fake CMR, serving the catalog's collection and granule metadata (including
+  footprints and temporal ranges), filtered by bounding box and temporal range,
+  one page at a time
+- an S3 server run by moto (with a fake Earthdata S3 credentials endpoint),
+  serving a generated HDF5 object for every granule
+
+It then runs the subset CLI (`gedi_subset.subset.main`) end to end, in a separate
+process, against the stand-ins, and reports granules subset per minute, bytes
+moved, peak memory (of the whole process tree), and where time went (searching,
+downloading, and appending subsets to the output file).  Since `main` constructs
+its own `MAAP` instance, the job process replaces `maap.maap.MAAP` with
+`LoadTestMAAP`, which searches the fake CMR instead; everything else (including
+worker processes, S3 credentials, and downloads) runs unmodified, with S3
+requests directed to the moto server via `AWS_ENDPOINT_URL_S3` (which requires
+botocore 1.31 or later).  The moto server requires moto's server extras (Flask).
+
+Generating an HDF5 file for every one of thousands of granules would take longer
+than subsetting them, so granules cycle through the objects of `tracks` distinct
+ground tracks (each granule with its own name and temporal range), with every
+object's `delta_time` values rewritten in place to match its granule.
+
+Example (arguments after `--` are passed to the subset CLI):
+
+```plain
+python -m gedi_subset.benchmarks.load --granules 2000 --tracks 32 \\
+    --output load.json -- --columns agbd,sensitivity --query "sensitivity > 0.95"
+```
+"""
+
+from __future__ import annotations
+
+import contextlib
+import datetime as dt
+import functools
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import typer
+from maap.maap import MAAP
+from returns.curry import curry
+
+from gedi_subset.benchmarks.download import environment
+from gedi_subset.lazy import lazy_import
+from gedi_subset.maapx import granule_from_metadata
+from gedi_subset.temporal import GEDI_EPOCH, format_datetime, parse_datetime
+
+if TYPE_CHECKING:
+    import boto3
+    import h5py
+    import numpy as np
+    import requests
+    from maap.Result import Granule
+    from shapely import geometry as shapely_geometry
+else:
+    boto3 = lazy_import("boto3")
+    h5py = lazy_import("h5py")
+    np = lazy_import("numpy")
+    requests = lazy_import("requests")
+    shapely_geometry = lazy_import("shapely.geometry")
+
+BEAMS = (
+    "BEAM0000",
+    "BEAM0001",
+    "BEAM0010",
+    "BEAM0011",
+    "BEAM0101",
+    "BEAM0110",
+    "BEAM1000",
+    "BEAM1011",
+)
+
+#: DOI and concept ID of the synthetic collection (the DOI is GEDI L4A's, which
+#: is the subset CLI's default).
+DOI = "10.3334/ORNLDAAC/2056"
+CONCEPT_ID = "C0000000001-LOADTEST"
+
+BUCKET = "ornl-cumulus-prod-protected"
+PREFIX = "gedi/GEDI_L4A_AGB_Density_V2_1/data"
+
+#: Bounds (min lon, min lat, max lon, max lat) of the default AOI.
+AOI_BOUNDS = (8.45, -4.15, 14.35, 2.35)
+
+#: Temporal range of the synthetic granules (GEDI's first mission phase).
+MISSION_START = dt.datetime(2019, 4, 18, tzinfo=dt.timezone.utc)
+MISSION_END = dt.datetime(2023, 3, 16, tzinfo=dt.timezone.utc)
+
+#: Duration of a (sub-orbit) granule.
+GRANULE_DURATION = dt.timedelta(minutes=23)
+
+#: Distance between adjacent beams across track, in degrees (roughly 600 m).
+BEAM_SPACING = 0.0055
+
+#: Number of granules per page of fake CMR search results.
+PAGE_SIZE = 20
+
+#: Seconds between samples of the memory of the job's process tree.
+MEMORY_INTERVAL = 0.1
+
+#: Earthdata S3 credentials endpoint of the synthetic granules, which the MAAP API
+#: (here, the fake CMR) obtains credentials from on behalf of its clients.
+S3_CREDENTIALS_URL = "https://data.ornldaac.earthdata.nasa.gov/s3credentials"
+
+#: Path (prefix) of the fake MAAP API endpoint for obtaining Earthdata S3
+#: credentials (see `maap.AWS.AWS.earthdata_s3_credentials`).
+CREDENTIALS_PATH = "/api/members/self/awsAccess/edcCredentials/"
+
+
+def make_track(
+    rng: np.random.Generator,
+    bounds: Sequence[float],
+    shots: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the longitudes and latitudes (each of shape `(len(BEAMS), shots)`) of
+    the shots of a synthetic ground track crossing the bounds at an angle, as GEDI
+    tracks do, with parallel beams.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    center = rng.uniform((xmin, ymin), (xmax, ymax))
+    angle = rng.choice((-1, 1)) * rng.uniform(0.3, 0.9)
+    direction = np.array([np.sin(angle), np.cos(angle)])
+    normal = np.array([direction[1], -direction[0]])
+    half_length = np.hypot(xmax - xmin, ymax - ymin) / 2
+    along = np.linspace(-half_length, half_length, shots)
+    across = (np.arange(len(BEAMS)) - (len(BEAMS) - 1) / 2) * BEAM_SPACING
+    points = center + along[None, :, None] * direction + across[:, None, None] * normal
+
+    return points[..., 0], points[..., 1]
+
+
+def track_footprint(lon: np.ndarray, lat: np.ndarray) -> List[Tuple[float, float]]:
+    """Return the points of the footprint of a track (from its outermost beams)."""
+    corners = [(lon[b, s], lat[b, s]) for b, s in ((0, 0), (0, -1), (-1, -1), (-1, 0))]
+    polygon = shapely_geometry.Polygon(corners).buffer(BEAM_SPACING, join_style=2)
+
+    return list(polygon.exterior.coords)[:-1]
+
+
+def write_track(
+    f: io.BytesIO, rng: np.random.Generator, lon: np.ndarray, lat: np.ndarray
+) -> Dict[str, int]:
+    """Write a synthetic L4A granule of a track, returning the byte offset (within
+    `f`) of the (contiguous) `delta_time` dataset of every beam.
+    """
+    shots = lon.shape[1]
+    offsets = {}
+
+    with h5py.File(f, "w") as h5:
+        for b, beam in enumerate(BEAMS):
+            group = h5.create_group(beam)
+            datasets = dict(
+                shot_number=np.arange(shots, dtype="u8") + (b + 1) * 10**9,
+                lat_lowestmode=lat[b],
+                lon_lowestmode=lon[b],
+                agbd=rng.gamma(2.0, 50.0, shots).astype("f4"),
+                agbd_se=rng.uniform(1.0, 10.0, shots).astype("f4"),
+                l2_quality_flag=(rng.random(shots) < 0.8).astype("u1"),
+                l4_quality_flag=(rng.random(shots) < 0.7).astype("u1"),
+                sensitivity=rng.uniform(0.9, 1.0, shots).astype("f4"),
+                sensitivity_a2=rng.uniform(0.9, 1.0, shots).astype("f4"),
+            )
+
+            for name, data in datasets.items():
+                group.create_dataset(name, data=data, chunks=True, compression="gzip")
+
+            # Contiguous, so that values may be rewritten in place for every granule
+            delta_time = group.create_dataset("delta_time", data=np.zeros(shots))
+            offsets[beam] = delta_time.id.get_offset()
+
+    return offsets
+
+
+def granule_name(index: int, begin: dt.datetime, track: int) -> str:
+    orbit, sub_orbit = 1000 + index // 4, index % 4 + 1
+
+    return (
+        f"GEDI04_A_{begin:%Y%j%H%M%S}_O{orbit:05d}_{sub_orbit:02d}"
+        f"_T{track:05d}_02_002_02_V002.h5"
+    )
+
+
+def granule_metadata(
+    name: str,
+    begin: dt.datetime,
+    footprint: Sequence[Tuple[float, float]],
+) -> Dict[str, Any]:
+    """Return metadata of a granule in the form that maap-py parses from CMR."""
+    return {
+        "Granule": {
+            "GranuleUR": name,
+            "Collection": {"ShortName": "GEDI_L4A_AGB_Density_V2_1_2056"},
+            "Temporal": {
+                "RangeDateTime": {
+                    "BeginningDateTime": format_datetime(begin),
+                    "EndingDateTime": format_datetime(begin + GRANULE_DURATION),
+                }
+            },
+            "Spatial": {
+                "HorizontalSpatialDomain": {
+                    "Geometry": {
+                        "GPolygon": {
+                            "Boundary": {
+                                "Point": [
+                                    {
+                                        "PointLongitude": str(lon),
+                                        "PointLatitude": str(lat),
+                                    }
+                                    for lon, lat in footprint
+                                ]
+                            }
+                        }
+                    }
+                }
+            },
+            "OnlineAccessURLs": {
+                "OnlineAccessURL": [{"URL": f"s3://{BUCKET}/{PREFIX}/{name}"}]
+            },
+            "OnlineResources": {
+                "OnlineResource": [
+                    {
+                        "URL": S3_CREDENTIALS_URL,
+                        "Description": "api endpoint to retrieve temporary"
+                        " credentials valid for same-region direct s3 access",
+                    }
+                ]
+            },
+        }
+    }
+
+
+@dataclass
+class Catalog:
+    """Synthetic granules (metadata and HDF5 objects), in temporal order."""
+
+    granules: List[Dict[str, Any]]
+    bounds: np.ndarray
+    begins: np.ndarray
+    objects: List[bytes]
+
+    def search(
+        self,
+        bounding_box: Optional[str] = None,
+        temporal: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return the granules intersecting a (CMR) bounding box and temporal range."""
+        matches = np.ones(len(self.granules), dtype=bool)
+
+        if bounding_box:
+            xmin, ymin, xmax, ymax = map(float, bounding_box.split(","))
+            b = self.bounds
+            matches &= (b[:, 0] <= xmax) & (b[:, 2] >= xmin)
+            matches &= (b[:, 1] <= ymax) & (b[:, 3] >= ymin)
+
+        if temporal:
+            start, end, *_ = temporal.split(",") + [""]
+            duration = GRANULE_DURATION.total_seconds()
+
+            if start:
+                matches &= self.begins + duration >= parse_datetime(start).timestamp()
+            if end:
+                matches &= self.begins <= parse_datetime(end).timestamp()
+
+        return [self.granules[i] for i in np.flatnonzero(matches)]
+
+
+def make_catalog(
+    granules: int,
+    tracks: int,
+    shots: int,
+    bounds: Sequence[float],
+    seed: int = 0,
+) -> Catalog:
+    """Generate a catalog of synthetic granules, cycling through `tracks` ground
+    tracks crossing `bounds`, with `shots` shots per beam, spread uniformly over
+    the mission's temporal range.
+    """
+    rng = np.random.default_rng(seed)
+    templates = []
+
+    for _ in range(tracks):
+        lon, lat = make_track(rng, bounds, shots)
+        f = io.BytesIO()
+        offsets = write_track(f, rng, lon, lat)
+        templates.append((f.getvalue(), offsets, track_footprint(lon, lat)))
+
+    catalog = Catalog([], np.empty((granules, 4)), np.empty(granules), [])
+    step = (MISSION_END - MISSION_START) / granules
+    shot_offsets = np.linspace(0.0, GRANULE_DURATION.total_seconds(), shots)
+
+    for i in range(granules):
+        track = i % tracks
+        template, offsets, footprint = templates[track]
+        begin = MISSION_START + i * step
+        name = granule_name(i, begin, track)
+        obj = bytearray(template)
+        delta_time = ((begin - GEDI_EPOCH).total_seconds() + shot_offsets).tobytes()
+
+        for offset in offsets.values():
+            obj[offset : offset + len(delta_time)] = delta_time
+
+        catalog.granules.append(granule_metadata(name, begin, footprint))
+        catalog.bounds[i] = shapely_geometry.Polygon(footprint).bounds
+        catalog.begins[i] = begin.timestamp()
+        catalog.objects.append(bytes(obj))
+
+    return catalog
+
+
+@dataclass
+class ServiceStats:
+    """Requests to, bytes served by, and time spent within a stand-in service."""
+
+    requests: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    keys: Set[str] = field(default_factory=set)
+    last_response: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, nbytes: int, seconds: float, key: Optional[str] = None) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes += nbytes
+            self.seconds += seconds
+            self.last_response = time.time()
+
+            if key is not None:
+                self.keys.add(key)
+
+
+class _CMRRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves collection and granule searches of a catalog (as JSON), and
+    Earthdata S3 credentials, after an optional delay per request.
+    """
+
+    catalog: Catalog
+    cmr: ServiceStats
+    credentials: ServiceStats
+    latency: float = 0.0
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        if url.path.startswith(CREDENTIALS_PATH):
+            stats, body = self.credentials, self.s3_credentials()
+        elif url.path == "/search/collections.json":
+            stats, body = self.cmr, self.search_collections(params)
+        elif url.path == "/search/granules.json":
+            stats, body = self.cmr, self.search_granules(params)
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        stats.record(len(data), time.perf_counter() - start)
+
+    def s3_credentials(self) -> Mapping[str, str]:
+        expiration = dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=1)
+
+        return dict(
+            accessKeyId="testing",
+            secretAccessKey="testing",
+            sessionToken="testing",
+            expiration=format_datetime(expiration),
+        )
+
+    def search_collections(self, params: Mapping[str, str]) -> Mapping[str, Any]:
+        collection = {"concept-id": CONCEPT_ID, "doi": DOI}
+
+        return dict(items=[collection] if params.get("doi") == DOI else [])
+
+    def search_granules(self, params: Mapping[str, str]) -> Mapping[str, Any]:
+        if params.get("collection_concept_id") != CONCEPT_ID:
+            return dict(hits=0, items=[])
+
+        granules = self.catalog.search(
+            params.get("bounding_box"), params.get("temporal")
+        )
+        page_size = int(params.get("page_size", PAGE_SIZE))
+        start = (int(params.get("page_num", 1)) - 1) * page_size
+
+        return dict(hits=len(granules), items=granules[start : start + page_size])
+
+
+@contextlib.contextmanager
+def cmr_server(
+    catalog: Catalog, cmr: ServiceStats, credentials: ServiceStats, latency: float
+) -> Iterator[str]:
+    """Serve a catalog from a fake CMR (and a fake Earthdata S3 credentials
+    endpoint), yielding the server's base URL.
+    """
+    handler = type(
+        "Handler",
+        (_CMRRequestHandler,),
+        dict(
+            catalog=catalog,
+            cmr=cmr,
+            credentials=credentials,
+            latency=latency,
+            protocol_version="HTTP/1.1",
+        ),
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _metered(app, stats: ServiceStats, latency: float):
+    """Wrap a WSGI application, recording the bytes of (and time spent within)
+    every GET request, after an optional delay per request.
+    """
+
+    def metered(environ, start_response):
+        start = time.perf_counter()
+        time.sleep(latency)
+        nbytes = 0
+
+        for chunk in app(environ, start_response):
+            nbytes += len(chunk)
+            yield chunk
+
+        if environ["REQUEST_METHOD"] == "GET":
+            key = environ.get("PATH_INFO")
+            stats.record(nbytes, time.perf_counter() - start, key)
+
+    return metered
+
+
+@contextlib.contextmanager
+def s3_server(catalog: Catalog, stats: ServiceStats, latency: float) -> Iterator[str]:
+    """Serve a catalog's objects from an S3 server run by moto, yielding the
+    server's endpoint URL.
+    """
+    from moto.moto_server.werkzeug_app import (
+        DomainDispatcherApplication,
+        create_backend_app,
+    )
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs) -> None:
+            pass
+
+    app = DomainDispatcherApplication(create_backend_app)
+    server = make_server(
+        "127.0.0.1",
+        0,
+        _metered(app, stats, latency),
+        threaded=True,
+        request_handler=QuietRequestHandler,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.port}"
+
+    try:
+        s3 = boto3.client(
+            "s3",
+            endpoint_url=url,
+            region_name="us-west-2",
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+        )
+        s3.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+        )
+
+        for granule, obj in zip(catalog.granules, catalog.objects):
+            name = granule["Granule"]["GranuleUR"]
+            s3.put_object(Bucket=BUCKET, Key=f"{PREFIX}/{name}", Body=obj)
+
+        yield url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class LoadTestMAAP(MAAP):
+    """Stand-in for `MAAP` that searches a fake CMR (see `cmr_server`) and obtains
+    Earthdata S3 credentials from the fake credentials endpoint, paging through
+    search results as maap-py does.
+    """
+
+    def __init__(self, maap_host: str = "", *, cmr_url: str) -> None:
+        from maap.AWS import AWS
+
+        self.cmr_url = cmr_url
+        self.aws = AWS(
+            "",
+            "",
+            f"{cmr_url}{CREDENTIALS_PATH}{{endpoint_uri}}",
+            dict(),
+        )
+
+    def _get_api_header(self, content_type: Optional[str] = None) -> Dict[str, str]:
+        return {}
+
+    def _search(self, kind: str, limit: int, **params) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = []
+
+        while len(results) < limit:
+            page_num = len(results) // PAGE_SIZE + 1
+            response = requests.get(
+                f"{self.cmr_url}/search/{kind}.json",
+                params=dict(params, page_size=PAGE_SIZE, page_num=page_num),
+            )
+            response.raise_for_status()
+            items = response.json()["items"]
+            results.extend(items)
+
+            if len(items) < PAGE_SIZE:
+                break
+
+        return results[:limit]
+
+    def searchCollection(self, cmr_host: str = "", limit: int = 100, **params):
+        return self._search("collections", limit, **params)
+
+    def searchGranule(
+        self, cmr_host: str = "", limit: int = 20, **params
+    ) -> List[Granule]:
+        return [
+            granule_from_metadata(self, metadata)
+            for metadata in self._search("granules", limit, **params)
+        ]
+
+
+def _process_memory(pid: int) -> int:
+    """Return the proportional set size (PSS) of a process (or its resident set
+    size, where PSS is not available), in bytes, or 0 if the process is gone.
+    """
+    for path, key in (("smaps_rollup", "Pss:"), ("status", "VmRSS:")):
+        try:
+            with open(f"/proc/{pid}/{path}") as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            continue
+
+    return 0
+
+
+def _descendants(pid: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command (2nd field) may contain spaces, but is parenthesized
+                    ppid = int(f.read().rpartition(")")[2].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+
+            children.setdefault(ppid, []).append(int(entry))
+
+    pids, pending = [], [pid]
+
+    while pending:
+        pids.append(pending.pop())
+        pending.extend(children.get(pids[-1], []))
+
+    return pids
+
+
+class MemoryMonitor:
+    """Samples the memory of a process and all of its descendants (e.g., a job and
+    its worker processes), tracking the peak total (Linux only).
+    """
+
+    def __init__(self, pid: int, interval: float = MEMORY_INTERVAL) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            total = sum(map(_process_memory, _descendants(self.pid)))
+            self.peak_bytes = max(self.peak_bytes or 0, total)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> MemoryMonitor:
+        if os.path.isdir("/proc"):
+            self._thread.start()
+
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def _max_rss_bytes(who: int) -> int:
+    # Kilobytes on Linux, but bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+
+    return resource.getrusage(who).ru_maxrss * scale
+
+
+def run_job(args: Sequence[str], cmr_url: str, conn) -> None:
+    """Run the subset CLI with the given arguments against a fake CMR, sending the
+    timings of the job (as a dict) through a connection, or the error, if it fails.
+    """
+    timings = dict(search=0.0, append=0.0)
+
+    import maap.maap
+    import typer.main
+
+    from gedi_subset import subset
+
+    def timed(name: str, f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+
+            try:
+                return f(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - started
+
+        return wrapper
+
+    search_granules, append_subset = subset.search_granules, subset.append_subset
+    maap.maap.MAAP = functools.partial(LoadTestMAAP, cmr_url=cmr_url)
+    subset.search_granules = timed("search", search_granules)
+    subset.append_subset = curry(timed("append", append_subset))
+
+    app = typer.Typer(add_completion=False)
+    app.command()(subset.main)
+    main_start = time.time()
+
+    try:
+        typer.main.get_command(app).main(
+            list(args), prog_name="gedi_subset", standalone_mode=False
+        )
+    except BaseException as e:
+        conn.send(dict(error=repr(e)))
+        raise
+
+    conn.send(
+        dict(
+            timings,
+            main_start=main_start,
+            end=time.time(),
+            max_rss_bytes=_max_rss_bytes(resource.RUSAGE_SELF),
+        )
+    )
+
+
+@contextlib.contextmanager
+def environ(**values: str) -> Iterator[None]:
+    """Temporarily set environment variables (e.g., to be inherited by a process)."""
+    previous = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@dataclass
+class LoadResult:
+    granules: int
+    tracks: int
+    shots_per_beam: int
+    object_bytes: int
+    granules_found: int
+    granules_subset: int
+    granules_per_minute: float
+    wall_seconds: float
+    seconds: Dict[str, float]
+    bytes_moved: Dict[str, int]
+    requests: Dict[str, int]
+    peak_memory_bytes: Optional[int]
+    peak_job_rss_bytes: int
+    output_bytes: int
+    args: List[str]
+
+
+def run_load_test(
+    args: Sequence[str] = (),
+    granules: int = 2000,
+    tracks: int = 32,
+    shots: int = 500,
+    aoi: Optional[Path] = None,
+    latency: float = 0.0,
+    seed: int = 0,
+) -> LoadResult:
+    """Generate a catalog of synthetic granules, serve it from local stand-ins for
+    CMR and S3, and run the subset CLI (with the given arguments, in addition to
+    `--aoi` and `--output-directory`) against them, measuring the run.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = Path(tmpdir)
+
+        if aoi is None:
+            aoi = workdir / "aoi.geojson"
+            box = shapely_geometry.box(*AOI_BOUNDS)
+            aoi.write_text(
+                json.dumps(
+                    dict(
+                        type="FeatureCollection",
+                        features=[
+                            dict(
+                                type="Feature",
+                                properties={},
+                                geometry=shapely_geometry.mapping(box),
+                            )
+                        ],
+                    )
+                )
+            )
+
+        import geopandas as gpd
+
+        xmin, ymin, xmax, ymax = gpd.read_file(aoi).total_bounds
+        # Tracks cross a region twice the size of the AOI, so that some granules
+        # do not intersect the AOI
+        dx, dy = (xmax - xmin) / 2, (ymax - ymin) / 2
+        region = (xmin - dx, ymin - dy, xmax + dx, ymax + dy)
+        cmr, credentials, s3 = ServiceStats(), ServiceStats(), ServiceStats()
+        started = time.perf_counter()
+
+        catalog = make_catalog(granules, tracks, shots, region, seed)
+
+        with cmr_server(catalog, cmr, credentials, latency) as cmr_url, s3_server(
+            catalog, s3, latency
+        ) as s3_url:
+            generate_seconds = time.perf_counter() - started
+
+            output_dir = workdir / "output"
+            job_args = [*args, "--aoi", str(aoi), "--output-directory", str(output_dir)]
+            context = multiprocessing.get_context("spawn")
+            receiver, sender = context.Pipe(duplex=False)
+
+            with environ(
+                AWS_ENDPOINT_URL_S3=s3_url,
+                AWS_ACCESS_KEY_ID="testing",
+                AWS_SECRET_ACCESS_KEY="testing",
+                AWS_DEFAULT_REGION="us-west-2",
+            ):
+                job_start = time.time()
+                job = context.Process(
+                    target=run_job, args=(job_args, cmr_url, sender), name="job"
+                )
+                job.start()
+
+            with MemoryMonitor(job.pid) as memory:
+                job.join()
+
+            report = receiver.recv() if receiver.poll() else {}
+
+            if job.exitcode != 0 or "error" in report:
+                raise RuntimeError(
+                    f"Subset job failed ({job.exitcode}): {report.get('error')}"
+                )
+
+            found = catalog.search(",".join(map(str, (xmin, ymin, xmax, ymax))))
+            wall = report["end"] - job_start
+            downloads = len(s3.keys)
+            outputs = list(output_dir.glob("*.gpkg"))
+
+            return LoadResult(
+                granules=granules,
+                tracks=tracks,
+                shots_per_beam=shots,
+                object_bytes=len(catalog.objects[0]) if catalog.objects else 0,
+                granules_found=len(found),
+                granules_subset=downloads,
+                granules_per_minute=downloads / wall * 60,
+                wall_seconds=wall,
+                seconds=dict(
+                    generate=generate_seconds,
+                    # Starting the job process, and importing modules
+                    startup=report["main_start"] - job_start,
+                    search=report["search"],
+                    # Including appending subsets (within the job process)
+                    subset=report["end"] - report["main_start"] - report["search"],
+                    append=report["append"],
+                    # Summed over concurrent downloads, so may exceed wall seconds
+                    download=s3.seconds,
+                    credentials=credentials.seconds,
+                ),
+                bytes_moved=dict(cmr=cmr.bytes, s3=s3.bytes),
+                requests=dict(
+                    cmr=cmr.requests,
+                    s3=s3.requests,
+                    credentials=credentials.requests,
+                ),
+                peak_memory_bytes=memory.peak_bytes,
+                peak_job_rss_bytes=report["max_rss_bytes"],
+                output_bytes=sum(path.stat().st_size for path in outputs),
+                args=list(args),
+            )
+
+
+def main(
+    args: Optional[List[str]] = typer.Argument(
+        None, help="Arguments to pass to the subset CLI (after --)"
+    ),
+    granules: int = typer.Option(2000, help="Number of granules in the catalog"),
+    tracks: int = typer.Option(32, help="Number of distinct ground tracks"),
+    shots: int = typer.Option(500, help="Number of shots per beam of every granule"),
+    aoi: Optional[Path] = typer.Option(
+        None,
+        help="AOI to subset (default: a box in central Africa)",
+        exists=True,
+        dir_okay=False,
+        resolve_path=True,
+    ),
+    latency_ms: float = typer.Option(
+        0.0, help="Latency added to every request to the stand-ins"
+    ),
+    seed: int = typer.Option(0, help="Seed of the synthetic catalog"),
+    output: Optional[Path] = typer.Option(
+        None, help="Also write the (JSON) results to this file"
+    ),
+) -> None:
+    result = run_load_test(
+        args or [], granules, tracks, shots, aoi, latency_ms / 1000, seed
+    )
+    report = dict(environment=environment(), results=[asdict(result)])
+    text = json.dumps(report, indent=2)
+
+    if output:
+        output.write_text(text)
+
+    typer.echo(text)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,127 @@
+"""Benchmark of worker process startup and module import times.
+
+Starts a pool of worker processes with the same start method (and preloading)
+used for subsetting granules, and reports how long the pool took until every
+worker was ready, along with the time each worker spent importing each of the
+modules that subsetting a granule requires.  Modules a worker inherits from its
+parent (`fork`) or from the forkserver (`forkserver`) take (near) zero time.
+
+Example:
+
+```plain
+python -m gedi_subset.benchmarks.startup --processes 4 --start-method spawn
+```
+"""
+
+import importlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from multiprocessing.synchronize import Barrier
+from typing import Dict, List, Optional, Sequence
+
+import typer
+
+from gedi_subset.workers import StartMethod, get_context
+
+#: Modules imported by a worker in order to subset a granule.
+MODULES: Sequence[str] = (
+    "numpy",
+    "pandas",
+    "geopandas",
+    "h5py",
+    "boto3",
+    "maap.maap",
+    "gedi_subset.gedi_utils",
+)
+
+
+@dataclass
+class WorkerStartup:
+    pid: int
+    import_seconds: Dict[str, float]
+
+    @property
+    def total_import_seconds(self) -> float:
+        return sum(self.import_seconds.values())
+
+
+@dataclass
+class StartupReport:
+    start_method: str
+    processes: int
+    pool_startup_seconds: float
+    workers: List[WorkerStartup]
+
+    def to_dict(self):
+        return dict(
+            asdict(self),
+            mean_import_seconds=sum(w.total_import_seconds for w in self.workers)
+            / max(len(self.workers), 1),
+        )
+
+
+_barrier: Optional[Barrier] = None
+_startup: Optional[WorkerStartup] = None
+
+
+def import_times(modules: Sequence[str]) -> Dict[str, float]:
+    """Import modules in order, returning the number of seconds each took."""
+    times = {}
+
+    for name in modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        times[name] = time.perf_counter() - start
+
+    return times
+
+
+def _init_worker(barrier: Barrier, modules: Sequence[str]) -> None:
+    global _barrier, _startup
+    _barrier = barrier
+    _startup = WorkerStartup(os.getpid(), import_times(modules))
+
+
+def _report_startup(_: int) -> WorkerStartup:
+    # Wait until every worker is running a task, so that every worker runs
+    # exactly one task, and thus reports its own startup.
+    assert _barrier is not None and _startup is not None
+    _barrier.wait()
+
+    return _startup
+
+
+def measure_startup(
+    processes: int,
+    start_method: Optional[StartMethod] = None,
+    modules: Sequence[str] = MODULES,
+) -> StartupReport:
+    """Start a pool of `processes` workers, and report their startup times."""
+    context = get_context(start_method)
+    barrier = context.Barrier(processes)
+
+    start = time.perf_counter()
+
+    with context.Pool(processes, _init_worker, (barrier, modules)) as pool:
+        workers = pool.map(_report_startup, range(processes), chunksize=1)
+        elapsed = time.perf_counter() - start
+
+    return StartupReport(context.get_start_method(), processes, elapsed, workers)
+
+
+def main(
+    processes: int = typer.Option(
+        os.cpu_count() or 1, help="Number of worker processes to start"
+    ),
+    start_method: Optional[StartMethod] = typer.Option(
+        None, help="Start method of worker processes (default as for subsetting)"
+    ),
+) -> None:
+    report = measure_startup(processes, start_method)
+    typer.echo(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,199 @@
+"""Hierarchical covers of AOIs for fast point-in-AOI tests.
+
+AOIs such as geoBoundaries administrative boundaries may have hundreds of
+thousands of vertices, making an exact point-in-polygon test cost time
+proportional to the number of vertices, for every shot.  An AOI cover partitions
+the bounding box of an AOI into a grid of cells, each of which is classified as
+lying entirely outside the AOI, entirely inside the AOI, or on the AOI's boundary.
+The grid is built as a quadtree, recursively subdividing only boundary cells, so
+building a cover requires relatively few polygon tests, and is then flattened
+into an array, so that locating the cell of a point is an array lookup.  Only the
+(relatively few) points in boundary cells require an exact test.
+
+Since building a cover for a complex AOI takes noticeable time, a cover may be
+cached on disk, next to the AOI's file (see `load_cover`).
+
+Functions:
+
+- build_cover builds the cover of a geometry
+- cover_path returns the path of the cached cover of an AOI file
+- load_cover loads a cached cover, building (and caching) it, if necessary
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import TYPE_CHECKING, Tuple
+
+from gedi_subset.lazy import lazy_import
+from gedi_subset.osx import StrPath
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import numpy as np
+    import shapely.geometry as shapely_geometry
+    import shapely.prepared as shapely_prepared
+    from shapely.geometry.base import BaseGeometry
+else:
+    gpd = lazy_import("geopandas", ignore_warnings=True)
+    np = lazy_import("numpy")
+    shapely_geometry = lazy_import("shapely.geometry")
+    shapely_prepared = lazy_import("shapely.prepared")
+
+logger = logging.getLogger(f"gedi_subset.{__name__}")
+
+#: Default depth of the quadtree of a cover, giving a grid of 2**depth by
+#: 2**depth cells.
+DEFAULT_DEPTH = 8
+
+
+class CellState(IntEnum):
+    OUTSIDE = 0
+    INSIDE = 1
+    BOUNDARY = 2
+
+
+@dataclass(frozen=True)
+class AOICover:
+    """Grid of cells covering the bounding box of an AOI, classified by
+    `CellState`, where `cells[row, col]` is the state of the cell in the given row
+    (from the minimum y value) and column (from the minimum x value).
+    """
+
+    bounds: Tuple[float, float, float, float]
+    cells: np.ndarray
+
+    def cell_states(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Return the states of the cells containing the points with coordinates
+        `x` and `y`, where points outside the bounds of the cover are `OUTSIDE`.
+        """
+        min_x, min_y, max_x, max_y = self.bounds
+        rows, cols = self.cells.shape
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        in_bounds = (min_x <= x) & (x <= max_x) & (min_y <= y) & (y <= max_y)
+        col = ((x - min_x) * (cols / ((max_x - min_x) or 1))).astype(int)
+        row = ((y - min_y) * (rows / ((max_y - min_y) or 1))).astype(int)
+        col = np.clip(col, 0, cols - 1, out=col)
+        row = np.clip(row, 0, rows - 1, out=row)
+
+        return np.where(in_bounds, self.cells[row, col], CellState.OUTSIDE)
+
+    def intersects(
+        self, geometry: BaseGeometry, x: np.ndarray, y: np.ndarray
+    ) -> np.ndarray:
+        """Return a boolean mask of the points (with coordinates `x` and `y`)
+        that intersect the geometry covered by this cover.
+
+        Points in `INSIDE` (`OUTSIDE`) cells are in (not in) the mask without any
+        exact test, and only points in `BOUNDARY` cells are tested exactly against
+        the geometry.
+        """
+        states = self.cell_states(x, y)
+        mask = states == CellState.INSIDE
+
+        if (boundary := np.flatnonzero(states == CellState.BOUNDARY)).size:
+            prepared = shapely_prepared.prep(geometry)
+            points = gpd.points_from_xy(
+                np.asarray(x)[boundary], np.asarray(y)[boundary]
+            )
+            mask[boundary] = [prepared.intersects(point) for point in points]
+
+        return mask
+
+
+def build_cover(geometry: BaseGeometry, depth: int = DEFAULT_DEPTH) -> AOICover:
+    """Build the cover of a geometry, as a quadtree of the given depth.
+
+    For example, the cover of an L-shaped AOI, where cells touching the AOI's
+    boundary are `BOUNDARY` cells (rows are shown from the minimum y value):
+
+    >>> from shapely.geometry import box
+    >>> cover = build_cover(box(0, 0, 2, 1).union(box(0, 1, 1, 2)), depth=2)
+    >>> cover.cells
+    array([[1, 1, 1, 1],
+           [1, 1, 1, 1],
+           [1, 1, 2, 2],
+           [1, 1, 2, 0]], dtype=uint8)
+    >>> x, y = np.array([0.5, 1.75, 1.25, 9]), np.array([0.5, 1.75, 1.25, 0])
+    >>> cover.cell_states(x, y)
+    array([1, 0, 2, 0], dtype=uint8)
+    """
+    size = 2**depth
+    cells = np.full((size, size), CellState.OUTSIDE, dtype=np.uint8)
+    min_x, min_y, max_x, max_y = bounds = geometry.bounds
+    width, height = (max_x - min_x) or 1, (max_y - min_y) or 1
+    prepared = shapely_prepared.prep(geometry)
+    # Quadtree nodes, each given by row, column, and size (in grid cells)
+    nodes = [(0, 0, size)]
+
+    while nodes:
+        row, col, n = nodes.pop()
+        cell = shapely_geometry.box(
+            min_x + width * col / size,
+            min_y + height * row / size,
+            min_x + width * (col + n) / size,
+            min_y + height * (row + n) / size,
+        )
+
+        if not prepared.intersects(cell):
+            continue
+        if prepared.contains(cell):
+            cells[row : row + n, col : col + n] = CellState.INSIDE
+        elif n == 1:
+            cells[row, col] = CellState.BOUNDARY
+        else:
+            half = n // 2
+            nodes.extend(
+                (row + dr, col + dc, half) for dr in (0, half) for dc in (0, half)
+            )
+
+    return AOICover(bounds, cells)
+
+
+def cover_path(aoi_path: StrPath) -> str:
+    """Return the path of the cached cover of an AOI file (next to the file).
+
+    >>> cover_path("/data/GAB-ADM0.json")
+    '/data/GAB-ADM0.json.cover.npz'
+    """
+    return f"{aoi_path}.cover.npz"
+
+
+def _cover_key(geometry: BaseGeometry, depth: int) -> str:
+    return hashlib.sha256(geometry.wkb + depth.to_bytes(1, "big")).hexdigest()
+
+
+def load_cover(
+    path: StrPath, geometry: BaseGeometry, depth: int = DEFAULT_DEPTH
+) -> AOICover:
+    """Load the cover of a geometry cached at the specified path (see `cover_path`),
+    or build it and cache it at the path, if it is not cached there (or if the
+    cached cover is for a different geometry or depth).
+
+    Failure to cache a cover (e.g., due to a read-only directory) is logged, but is
+    otherwise ignored.
+    """
+    key = _cover_key(geometry, depth)
+
+    try:
+        with np.load(path) as cached:
+            if str(cached["key"]) == key:
+                return AOICover(tuple(cached["bounds"].tolist()), cached["cells"])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    logger.info(f"Building AOI cover (depth {depth})")
+    cover = build_cover(geometry, depth)
+
+    try:
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f, key=key, bounds=np.array(cover.bounds), cells=cover.cells
+            )
+    except OSError as e:
+        logger.warning(f"Unable to cache AOI cover at {path}: {e}")
+
+    return cover
@@ -0,0 +1,366 @@
+"""Local, persistent index of granule footprints for fast granule searches.
+
+Searching CMR for the granules of a collection that intersect an AOI, and then
+parsing the footprint of every granule found, is repeated by every job, even
+though the set of granules in a collection changes slowly.  A footprint index is
+a SQLite database containing, for every indexed granule, its footprint, temporal
+range, size, URLs, revision date, and full metadata, along with an R-tree of the
+bounding boxes of the footprints.  Once built, an index answers spatial (and
+temporal) granule searches locally, in milliseconds, and without network access.
+
+An index is refreshed incrementally: only granules revised in CMR since the
+previous refresh of a collection are fetched from CMR.  Granules deleted from
+CMR are not removed from the index (delete the index file to rebuild it).
+
+Functions:
+
+- open_index opens (creating, if necessary) an index file
+- upsert_granules adds granules to an index, replacing existing ones
+- refresh_index adds granules revised in CMR since the previous refresh
+- indexed_concept_id finds the concept ID of an indexed collection by DOI
+- query_granules finds indexed granules intersecting an AOI
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from returns.io import IOFailure, IOResultE, IOSuccess, impure_safe
+
+from gedi_subset.gedi_utils import granule_footprint
+from gedi_subset.lazy import lazy_import
+from gedi_subset.osx import StrPath
+from gedi_subset.temporal import TemporalFilter, format_datetime, parse_datetime
+
+if TYPE_CHECKING:
+    import shapely.prepared as shapely_prepared
+    import shapely.wkb as shapely_wkb
+    from maap.maap import MAAP
+    from shapely.geometry.base import BaseGeometry
+else:
+    shapely_prepared = lazy_import("shapely.prepared")
+    shapely_wkb = lazy_import("shapely.wkb")
+
+logger = logging.getLogger(f"gedi_subset.{__name__}")
+
+#: Overlap between consecutive incremental refreshes, to allow for clock skew
+#: between this host and CMR (re-fetched granules are simply replaced).
+REFRESH_OVERLAP = dt.timedelta(hours=1)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+    concept_id TEXT PRIMARY KEY,
+    doi TEXT,
+    refreshed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS collections_doi ON collections (doi);
+CREATE TABLE IF NOT EXISTS granules (
+    id INTEGER PRIMARY KEY,
+    concept_id TEXT NOT NULL,
+    granule_ur TEXT NOT NULL UNIQUE,
+    begin_time TEXT,
+    end_time TEXT,
+    size_mb REAL,
+    revision_date TEXT,
+    urls TEXT NOT NULL,
+    footprint BLOB NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS granules_concept_id ON granules (concept_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS granule_bounds
+    USING rtree(id, min_x, max_x, min_y, max_y);
+"""
+
+
+def _normalize(value: Optional[str]) -> Optional[str]:
+    # Normalized, so that date/times are comparable as strings
+    return format_datetime(parse_datetime(value)) if value else None
+
+
+def _revision_date(granule: Mapping[str, Any]) -> Optional[str]:
+    metadata = granule["Granule"]
+
+    return _normalize(metadata.get("LastUpdate") or metadata.get("InsertTime"))
+
+
+@dataclass(frozen=True)
+class FootprintRecord:
+    """Indexed properties of a granule, extracted from its (echo10) metadata."""
+
+    granule_ur: str
+    footprint: BaseGeometry
+    begin_time: Optional[str]
+    end_time: Optional[str]
+    size_mb: Optional[float]
+    revision_date: Optional[str]
+    urls: Tuple[str, ...]
+    metadata: Mapping[str, Any]
+
+    @classmethod
+    def from_granule(cls, granule: Mapping[str, Any]) -> FootprintRecord:
+        metadata = granule["Granule"]
+        range_ = metadata.get("Temporal", {}).get("RangeDateTime", {})
+        urls = metadata.get("OnlineAccessURLs", {}).get("OnlineAccessURL", [])
+        size = metadata.get("DataGranule", {}).get("SizeMBDataGranule")
+
+        return cls(
+            metadata["GranuleUR"],
+            granule_footprint(granule),
+            _normalize(range_.get("BeginningDateTime")),
+            _normalize(range_.get("EndingDateTime")),
+            float(size) if size is not None else None,
+            _revision_date(granule),
+            tuple(url["URL"] for url in (urls if isinstance(urls, list) else [urls])),
+            granule,
+        )
+
+
+def open_index(path: StrPath) -> sqlite3.Connection:
+    """Open a footprint index file, creating it (and its tables), if necessary."""
+    connection = sqlite3.connect(path)
+    connection.executescript(_SCHEMA)
+
+    return connection
+
+
+def upsert_granules(
+    connection: sqlite3.Connection,
+    concept_id: str,
+    granules: Iterable[Mapping[str, Any]],
+) -> int:
+    """Add granules of a collection to an index, and return the number added.
+
+    Granules already in the index (by `GranuleUR`) are replaced.
+    """
+    count = 0
+
+    with connection:
+        for record in map(FootprintRecord.from_granule, granules):
+            connection.execute(
+                """
+                INSERT INTO granules (
+                    concept_id, granule_ur, begin_time, end_time, size_mb,
+                    revision_date, urls, footprint, metadata
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (granule_ur) DO UPDATE SET
+                    concept_id = excluded.concept_id,
+                    begin_time = excluded.begin_time,
+                    end_time = excluded.end_time,
+                    size_mb = excluded.size_mb,
+                    revision_date = excluded.revision_date,
+                    urls = excluded.urls,
+                    footprint = excluded.footprint,
+                    metadata = excluded.metadata
+                """,
+                (
+                    concept_id,
+                    record.granule_ur,
+                    record.begin_time,
+                    record.end_time,
+                    record.size_mb,
+                    record.revision_date,
+                    json.dumps(record.urls),
+                    record.footprint.wkb,
+                    json.dumps(record.metadata),
+                ),
+            )
+            ((rowid,),) = connection.execute(
+                "SELECT id FROM granules WHERE granule_ur = ?", (record.granule_ur,)
+            )
+            min_x, min_y, max_x, max_y = record.footprint.bounds
+            connection.execute(
+                "INSERT OR REPLACE INTO granule_bounds VALUES (?, ?, ?, ?, ?)",
+                (rowid, min_x, max_x, min_y, max_y),
+            )
+            count += 1
+
+    return count
+
+
+def _set_collection(
+    connection: sqlite3.Connection,
+    concept_id: str,
+    doi: Optional[str],
+    refreshed_at: Optional[dt.datetime],
+) -> None:
+    with connection:
+        connection.execute(
+            """
+            INSERT INTO collections (concept_id, doi, refreshed_at) VALUES (?, ?, ?)
+            ON CONFLICT (concept_id) DO UPDATE SET
+                doi = coalesce(excluded.doi, doi),
+                refreshed_at = excluded.refreshed_at
+            """,
+            (
+                concept_id,
+                doi,
+                None if refreshed_at is None else format_datetime(refreshed_at),
+            ),
+        )
+
+
+def _refreshed_at(
+    connection: sqlite3.Connection, concept_id: str
+) -> Optional[dt.datetime]:
+    row = connection.execute(
+        "SELECT refreshed_at FROM collections WHERE concept_id = ?", (concept_id,)
+    ).fetchone()
+
+    return parse_datetime(row[0]) if row and row[0] else None
+
+
+def refresh_index(
+    maap: MAAP,
+    connection: sqlite3.Connection,
+    cmr_host: str,
+    concept_id: str,
+    doi: Optional[str] = None,
+    limit: int = 1_000_000,
+) -> IOResultE[int]:
+    """Add a collection's granules revised since its previous refresh to an index.
+
+    On the first refresh of a collection, add all of its granules.  Return
+    `IOSuccess[int]` containing the number of granules added (or replaced);
+    otherwise return `IOFailure[Exception]` containing the reason for failure.
+
+    Granules are searched for in order of revision date, at most `limit` at a
+    time.  When a search finds `limit` granules (i.e., its results were likely
+    truncated), the index is recorded as refreshed up to the newest revision
+    found, and the search is repeated for granules revised since then, until a
+    search finds fewer granules.  Return `IOFailure[ValueError]` if a search
+    finds `limit` granules all revised at the same time, since the index cannot
+    then be completely refreshed.
+    """
+
+    def search(since: Optional[dt.datetime]) -> Sequence[Mapping[str, Any]]:
+        params = (
+            {} if since is None else {"revision_date": f"{format_datetime(since)},"}
+        )
+        logger.info(f"Refreshing footprint index for {concept_id} {params}")
+
+        return maap.searchGranule(
+            cmr_host=cmr_host,
+            collection_concept_id=concept_id,
+            limit=limit,
+            sort_key="revision_date",
+            **params,
+        )
+
+    @impure_safe
+    def refresh() -> int:
+        now = dt.datetime.now(dt.timezone.utc)
+        previous = _refreshed_at(connection, concept_id)
+        since = None if previous is None else previous - REFRESH_OVERLAP
+        count = 0
+
+        while len(granules := search(since)) >= limit:
+            count += upsert_granules(connection, concept_id, granules)
+            revisions = [
+                parse_datetime(revision)
+                for revision in map(_revision_date, granules)
+                if revision
+            ]
+            newest = max(revisions, default=None)
+
+            if newest is None or (since is not None and newest <= since):
+                raise ValueError(
+                    f"Found the limit of {limit} granule(s) of {concept_id} revised"
+                    f" at {since}, so the footprint index cannot be refreshed"
+                )
+
+            logger.info(f"Found the limit of {limit} granule(s) of {concept_id}")
+            _set_collection(connection, concept_id, doi, newest)
+            since = newest
+
+        count += upsert_granules(connection, concept_id, granules)
+        _set_collection(connection, concept_id, doi, now)
+
+        return count
+
+    return refresh()
+
+
+def indexed_concept_id(connection: sqlite3.Connection, doi: str) -> IOResultE[str]:
+    """Find the concept ID of an indexed collection by its DOI.
+
+    Return `IOSuccess[str]` containing the concept ID, otherwise
+    `IOFailure[ValueError]` when no collection with the DOI is indexed.
+    """
+    row = connection.execute(
+        "SELECT concept_id FROM collections WHERE doi = ?", (doi,)
+    ).fetchone()
+
+    return (
+        IOSuccess(row[0])
+        if row
+        else IOFailure(ValueError(f"No collection indexed for DOI {doi}"))
+    )
+
+
+def query_granules(
+    connection: sqlite3.Connection,
+    concept_id: str,
+    aoi: BaseGeometry,
+    temporal: Optional[TemporalFilter] = None,
+    limit: Optional[int] = None,
+) -> List[Mapping[str, Any]]:
+    """Return the metadata of the indexed granules of a collection that intersect
+    an AOI (and satisfy a temporal filter, if specified), in temporal order.
+
+    Candidate granules are found via the R-tree of footprint bounding boxes, and
+    only the footprints of the candidates are tested for intersecting the AOI.
+    """
+    min_x, min_y, max_x, max_y = aoi.bounds
+    start, end = (
+        ("", "~")
+        if temporal is None
+        else (format_datetime(temporal.start), format_datetime(temporal.end))
+    )
+    rows = connection.execute(
+        """
+        SELECT g.footprint, g.begin_time, g.end_time, g.metadata
+        FROM granules g JOIN granule_bounds b ON g.id = b.id
+        WHERE g.concept_id = ?
+            AND b.min_x <= ? AND b.max_x >= ? AND b.min_y <= ? AND b.max_y >= ?
+            AND coalesce(g.end_time, g.begin_time, ?) >= ?
+            AND coalesce(g.begin_time, ?) <= ?
+        ORDER BY g.begin_time, g.granule_ur
+        """,
+        (concept_id, max_x, min_x, max_y, min_y, start, start, end, end),
+    )
+    prepared_aoi = shapely_prepared.prep(aoi)
+    granules = []
+
+    for footprint, begin_time, end_time, metadata in rows:
+        if not prepared_aoi.intersects(shapely_wkb.loads(footprint)):
+            continue
+        if (
+            temporal is not None
+            and begin_time
+            and not temporal.overlaps(
+                parse_datetime(begin_time), parse_datetime(end_time or begin_time)
+            )
+        ):
+            continue
+
+        granules.append(json.loads(metadata))
+
+        if limit is not None and len(granules) >= limit:
+            break
+
+    return granules
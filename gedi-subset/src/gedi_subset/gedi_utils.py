@@ -1,32 +1,59 @@
+from __future__ import annotations
+
 import json
 import logging
 import os
 import os.path
 import posixpath
-import warnings
+import re
 from collections import defaultdict
-from itertools import chain
-from typing import Any, FrozenSet, Iterable, Mapping, Sequence, Union
-
-import h5py
-import numpy as np
-import pandas as pd
-import requests
-from maap.Result import Granule
-from pandas.core.computation.expr import Expr
-from pandas.core.computation.scope import ensure_scope
+from itertools import chain, starmap
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
 from returns.curry import curry
 from returns.io import IOResultE, impure_safe
-from shapely.geometry import Polygon
-from shapely.geometry.base import BaseGeometry
-
-# Suppress UserWarning: The Shapely GEOS version (3.10.2-CAPI-1.16.0) is incompatible
-# with the GEOS version PyGEOS was compiled with (3.8.1-CAPI-1.13.3). Conversions
-# between both will be slow.
-#  shapely_geos_version, geos_capi_version_string
-with warnings.catch_warnings():
-    warnings.simplefilter("ignore")
+
+from gedi_subset.join import merge_join
+from gedi_subset.lazy import lazy_import
+from gedi_subset.readplan import ReadPlanner
+
+if TYPE_CHECKING:
     import geopandas as gpd
+    import h5py
+    import numpy as np
+    import pandas as pd
+    import requests
+    import shapely.geometry as shapely_geometry
+    from maap.Result import Granule
+    from shapely.geometry.base import BaseGeometry
+
+    from gedi_subset.cover import AOICover
+    from gedi_subset.sampling import Sample
+    from gedi_subset.temporal import TemporalFilter
+else:
+    # Suppress UserWarning: The Shapely GEOS version (3.10.2-CAPI-1.16.0) is
+    # incompatible with the GEOS version PyGEOS was compiled with (3.8.1-CAPI-1.13.3).
+    # Conversions between both will be slow.
+    #  shapely_geos_version, geos_capi_version_string
+    gpd = lazy_import("geopandas", ignore_warnings=True)
+    h5py = lazy_import("h5py")
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+    requests = lazy_import("requests")
+    shapely_geometry = lazy_import("shapely.geometry")
 
 
 logger = logging.getLogger(f"gedi_subset.{__name__}")
@@ -86,22 +113,173 @@ def get_geo_boundary(iso: str, level: int) -> gpd.GeoDataFrame:
     return gpd.read_file(file_path)
 
 
+def granule_footprint(granule: Mapping[str, Any]) -> shapely_geometry.Polygon:
+    """Return the polygon determined by the points in a granule's horizontal
+    spatial domain (i.e., the granule's footprint).
+    """
+    points = granule["Granule"]["Spatial"]["HorizontalSpatialDomain"]["Geometry"][
+        "GPolygon"
+    ]["Boundary"]["Point"]
+
+    return shapely_geometry.Polygon(
+        [[float(p["PointLongitude"]), float(p["PointLatitude"])] for p in points]
+    )
+
+
 @curry
 def granule_intersects(aoi: BaseGeometry, granule: Granule):
     """Determines whether or not a granule intersects an Area of Interest
 
     Returns `True` if the polygon determined by the points in the `granule`'s
     horizontal spatial domain intersects the geometry of the Area of Interest;
-    `False` otherwise.
+    `False` otherwise.  (To avoid searching for granules and parsing their
+    footprints for every job, see `gedi_subset.footprints`.)
     """
-    points = granule["Granule"]["Spatial"]["HorizontalSpatialDomain"]["Geometry"][
-        "GPolygon"
-    ]["Boundary"]["Point"]
-    polygon = Polygon(
-        [[float(p["PointLongitude"]), float(p["PointLatitude"])] for p in points]
-    )
+    return granule_footprint(granule).intersects(aoi)
+
+
+_COLUMN_SPEC_PATTERN = re.compile(
+    r"^\s*(?P<name>[^\[\]\s]+)\s*(?:\[(?P<index>[^\]]*)\])?\s*$"
+)
+
+
+def parse_column(spec: str) -> Tuple[str, Optional[Tuple[int, ...]]]:
+    """Parse a column specification into a dataset name and optional indices.
+
+    A column specification is either a plain dataset name (e.g., `"agbd"`), or
+    the name of a 2-D (per-shot) dataset followed by a bracketed selection of
+    indices along its second dimension (e.g., `"rh[50,98]"`).  A selection is a
+    comma-separated list of integers and/or ranges of the form `start:stop` or
+    `start:stop:step` (with the same semantics as Python's `range`).  Selected
+    indices are returned sorted and without duplicates, which is the order
+    required by HDF5 for selecting them in a single read.
+
+    Raise `ValueError` if the specification is malformed.
+
+    >>> parse_column("agbd")
+    ('agbd', None)
+    >>> parse_column("rh[98, 50]")
+    ('rh', (50, 98))
+    >>> parse_column("rh[0:101:25,98]")
+    ('rh', (0, 25, 50, 75, 98, 100))
+    >>> parse_column("rh[]")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid column specification: 'rh[]'
+    """
+    error = ValueError(f"Invalid column specification: {spec!r}")
+
+    if not (match := _COLUMN_SPEC_PATTERN.match(spec)):
+        raise error
+
+    name, index = match.group("name", "index")
+
+    if index is None:
+        return name, None
+
+    try:
+        indices = frozenset(
+            i
+            for part in index.split(",")
+            for i in (range(*map(int, part.split(":"))) if ":" in part else [int(part)])
+        )
+    except (TypeError, ValueError):
+        raise error from None
+
+    if not indices or min(indices) < 0:
+        raise error
+
+    return name, tuple(sorted(indices))
+
 
-    return polygon.intersects(aoi)
+def split_columns(columns: str) -> List[str]:
+    """Split a comma-separated list of column specifications.
+
+    Commas within a bracketed selection of indices (see `parse_column`) do not
+    separate columns.
+
+    >>> split_columns("agbd, rh[50,98] ,sensitivity")
+    ['agbd', 'rh[50,98]', 'sensitivity']
+    """
+    return [
+        column
+        for match in re.findall(r"[^,\[]+(?:\[[^\]]*\])?", columns)
+        if (column := match.strip())
+    ]
+
+
+def array_column_names(
+    name: str, indices: Optional[Sequence[int]], width: int
+) -> List[str]:
+    """Return the names of the scalar columns that an array column expands into.
+
+    Formats that do not support array-valued columns (such as GeoPackage) store
+    each element of an array column in its own column, named by suffixing the
+    dataset name with the index of the element within the original dataset.
+
+    >>> array_column_names("rh", (50, 98), 2)
+    ['rh_50', 'rh_98']
+    >>> array_column_names("rh", None, 3)
+    ['rh_0', 'rh_1', 'rh_2']
+    """
+    return [f"{name}_{i}" for i in (indices or range(width))]
+
+
+@curry
+def explode_array_columns(
+    columns: Sequence[str], gdf: gpd.GeoDataFrame
+) -> gpd.GeoDataFrame:
+    """Expand array-valued columns into one scalar column per array element.
+
+    Columns named by the specifications in `columns` (see `parse_column`) that
+    contain arrays (as produced by `subset_hdf5` for 2-D datasets) are replaced,
+    in place of the original column, by scalar columns named according to
+    `array_column_names`.  All other columns are left as they are.
+    """
+    for name, indices in map(parse_column, columns):
+        if gdf.empty or name not in gdf.columns or gdf[name].dtype != object:
+            continue
+
+        values = np.stack(gdf[name].to_numpy())
+        names = array_column_names(name, indices, values.shape[1])
+        loc = gdf.columns.get_loc(name)
+        gdf = gdf.drop(columns=[name])
+
+        for offset, (column, value) in enumerate(zip(names, values.T)):
+            gdf.insert(loc + offset, column, value)
+
+    return gdf
+
+
+def read_rows(
+    dataset: h5py.Dataset,
+    rows: np.ndarray,
+    indices: Optional[Sequence[int]] = None,
+) -> np.ndarray:
+    """Read the specified rows (and optionally columns) of a 1-D or 2-D dataset.
+
+    Rather than reading each row (or each selected column) separately, read the
+    block of rows spanning the (sorted) `rows` in a single strided HDF5 read,
+    limited to the selected column `indices` (2-D datasets only), if any, and
+    then select the rows from the block in memory.
+
+    >>> import io
+    >>> with h5py.File(io.BytesIO(), "w") as hdf5:
+    ...     dataset = hdf5.create_dataset("rh", data=np.arange(12).reshape(4, 3))
+    ...     read_rows(dataset, np.array([1, 3]), [0, 2])
+    array([[ 3,  5],
+           [ 9, 11]])
+    """
+    columns = () if indices is None else (indices,)
+
+    if rows.size == 0:
+        shape = dataset.shape[1:] if indices is None else (len(indices),)
+        return np.empty((0, *shape), dtype=dataset.dtype)
+
+    start, stop = int(rows[0]), int(rows[-1]) + 1
+    block = dataset[(slice(start, stop), *columns)]
+
+    return block[rows - start]
 
 
 def spatial_filter(beam, aoi):
@@ -132,6 +310,12 @@ def subset_hdf5(
     aoi: gpd.GeoDataFrame,
     columns: Sequence[str],
     query: str,
+    temporal: Optional[TemporalFilter] = None,
+    cache: Optional[MutableMapping[str, np.ndarray]] = None,
+    cover: Optional[AOICover] = None,
+    planner: Optional[ReadPlanner] = None,
+    sample: Optional[Sample] = None,
+    joined: Sequence[h5py.Group] = (),
 ) -> gpd.GeoDataFrame:
     """Subset the data in an HDF5 Group into a ``geopandas.GeoDataFrame``.
 
@@ -191,6 +375,14 @@ def subset_hdf5(
     Further, for traceability, the `filename` and `BEAM` columns are inserted,
     regardless of the specified `columns` value.
 
+    Columns may also name 2-D datasets with one row per shot, such as the `rh`
+    (relative height) percentiles in GEDI L2A data.  Each value of such a column
+    is an array containing the dataset's row for the shot.  To select only some
+    elements of each row, append a bracketed selection of indices to the column
+    name (e.g., `rh[50,98]` or `rh[0:101:10]`; see `parse_column`).  A 2-D
+    dataset is read only for the rows that satisfy the query, in a single read
+    per dataset, so such datasets cannot be referenced within the query itself.
+
     See the code example below for the code that corresponds to this illustration.
 
     Parameters
@@ -207,11 +399,63 @@ def subset_hdf5(
         `query` expression may include column names not given in this sequence of names,
         the resulting ``GeoDataFrame`` will contain only the columns specified by this
         parameter, along with `filename` (str) and `BEAM` (str) columns (for
-        traceability).
+        traceability).  A column name may include a selection of indices for a
+        2-D dataset, as described above (e.g., `rh[50,98]`).
     query : str
         Query expression for subsetting the rows of the data.  After "flattening" all
         of the `"BEAM*"` groups of the HDF5 file into rows across with columns formed by
         the groups' datasets, only rows satisfying this query expression are returned.
+    temporal : Optional[TemporalFilter]
+        Optional temporal filter.  If specified, only rows for which the value of the
+        `delta_time` dataset satisfies the filter are returned.
+
+    cache : Optional[MutableMapping[str, np.ndarray]]
+        Optional cache of the values of the datasets read for selecting rows, keyed
+        by the full names of the datasets.  When subsetting the same HDF5 group for
+        several AOIs (or queries), supplying the same cache to every call avoids
+        reading (and decompressing) the same datasets repeatedly.
+
+    cover : Optional[AOICover]
+        Optional cover of the AOI (see `gedi_subset.cover`).  If specified, points
+        are tested for falling within the AOI via the cover, which avoids exact
+        tests against the AOI's geometry for all points other than those near the
+        AOI's boundary, and rows outside the AOI are dropped before reading any
+        datasets other than those needed for selecting rows.
+
+    planner : Optional[ReadPlanner]
+        Optional planner of the reads of datasets (see `gedi_subset.readplan`),
+        which accumulates statistics of the reads (e.g., the number of chunks
+        decompressed).  When subsetting the same HDF5 group for several AOIs (or
+        queries), supplying the same planner to every call keeps chunks cached
+        across calls.  If not specified, a new planner is used.
+
+    sample : Optional[Sample]
+        Optional sample of the selected rows (see `gedi_subset.sampling`).  If
+        specified, rows are sampled (across all `"BEAM*"` groups) after being
+        selected, but before reading any datasets other than those needed for
+        selecting rows, so that the remaining datasets are read only for the
+        sampled rows.  Without a cover, rows are sampled before being clipped to
+        the AOI (rather than to its bounding box), so a sample limited to a
+        maximum number of rows may contain fewer rows than the maximum.
+
+    joined : Sequence[h5py.Group]
+        Optional HDF5 groups of other GEDI products for the same orbit and track
+        (e.g., L2A and L2B files, when subsetting an L4A file; see
+        `gedi_subset.join`), whose datasets are joined with those of `hdf5` by
+        the `shot_number` datasets of their `"BEAM*"` groups.  Columns (and names
+        in the `query`) naming datasets not within a `"BEAM*"` group of `hdf5`
+        are read from the same `"BEAM*"` group of the first of the joined groups
+        containing such datasets, and only rows with shot numbers within every
+        joined group are returned (i.e., an inner join).  The `cache` applies to
+        the datasets of `hdf5` only.
+
+    Rows are selected by reading only the `lat_lowestmode`, `lon_lowestmode`, and
+    `delta_time` (when `temporal` is specified) datasets, along with the datasets
+    referenced by the `query`.  All other datasets named in `columns` are read only
+    for the selected rows.  Within each `"BEAM*"` group, datasets are read in the
+    order of their data within the file, and datasets read only for the selected
+    rows are read in ranges of rows spanning only the chunks containing selected
+    rows.
 
     Returns
     -------
@@ -322,6 +566,9 @@ def subset_hdf5(
 
     def expr_names(expr: str) -> FrozenSet[str]:
         """Return frozen set of variable names parsed from a query expression."""
+        from pandas.core.computation.expr import Expr
+        from pandas.core.computation.scope import ensure_scope
+
         resolver = defaultdict(int, __foo__=0)
         env = ensure_scope(0, global_dict={}, local_dict={}, resolvers=(resolver,))
 
@@ -338,34 +585,194 @@ def subset_hdf5(
             for value in group.values()
         )
 
-    def subset_beam(beam: h5py.Group) -> gpd.GeoDataFrame:
-        """Subset an individual `"BEAM*"` group as described above."""
-        df_columns = (
-            pd.Series(dataset, name=name)
+    def read(dataset: h5py.Dataset) -> np.ndarray:
+        """Read all values of a dataset, via the cache, if supplied."""
+        if cache is None:
+            return planner.read(dataset)
+        if (values := cache.get(dataset.name)) is None:
+            values = cache[dataset.name] = planner.read(dataset)
+
+        return values
+
+    def join_beam(
+        beam: h5py.Group, datasets: Dict[str, h5py.Dataset]
+    ) -> Tuple[Dict[str, np.ndarray], Optional[np.ndarray]]:
+        """Find the datasets missing from a `"BEAM*"` group within the same beam of
+        the joined groups (adding them to `datasets`), returning, for each such
+        dataset, the rows of the joined beam matching the rows of `beam` (or -1,
+        where there is no matching row; see `gedi_subset.join.merge_join`), along
+        with the mask of the rows of `beam` matching rows of every joined beam
+        (`None` without joined groups).
+        """
+        joined_rows: Dict[str, np.ndarray] = {}
+        matched: Optional[np.ndarray] = None
+
+        for group in joined:
+            other = group.get(posixpath.basename(beam.name))
+            found = {
+                name: dataset
+                for dataset in ([] if other is None else flatten(other))
+                if (name := posixpath.basename(dataset.name)) in dataset_names
+                and name not in datasets
+            }
+            rows = merge_join(
+                read(beam["shot_number"]),
+                np.empty(0) if other is None else planner.read(other["shot_number"]),
+            )
+            datasets.update(found)
+            joined_rows.update(dict.fromkeys(found, rows))
+            matched = rows >= 0 if matched is None else matched & (rows >= 0)
+
+        return joined_rows, matched
+
+    def select_rows(
+        beam: h5py.Group,
+    ) -> Tuple[str, Dict[str, h5py.Dataset], Dict[str, np.ndarray], pd.DataFrame]:
+        """Select the rows of an individual `"BEAM*"` group as described above,
+        returning the group's name, its datasets (including those of joined
+        groups), the rows of the joined datasets matching its rows (see
+        `join_beam`), and the values of the datasets read for selecting rows,
+        limited to the selected rows.
+        """
+        datasets = {
+            name: dataset
             for dataset in flatten(beam)
             if (name := posixpath.basename(dataset.name)) in dataset_names
+        }
+        joined_rows, matched = join_beam(beam, datasets)
+        # Read only the (cheap) datasets needed for selecting rows, and select rows
+        # before reading any other datasets, so that the others are read only for
+        # the selected rows.
+        predicates = {}
+
+        for dataset in planner.order(datasets[name] for name in predicate_names):
+            name = posixpath.basename(dataset.name)
+            predicates[name] = (
+                read(dataset) if name not in joined_rows else planner.read(dataset)
+            )
+
+        df = pd.concat(
+            (
+                pd.Series(predicates[name], name=name)
+                for name in predicate_names
+                if name not in joined_rows
+            ),
+            axis=1,
         )
-        df = pd.concat(df_columns, axis=1)
-        # Keep only the rows matching the specified query
-        df.query(query, inplace=True)
+
+        if matched is not None:
+            # Keep only the rows with matching rows in every joined group, and add
+            # the values of the joined datasets of the matching rows
+            df = df[matched]
+            df = df.assign(
+                **{
+                    name: predicates[name][joined_rows[name][df.index]]
+                    for name in predicate_names
+                    if name in joined_rows
+                }
+            )[predicate_names]
+
+        if temporal is not None:
+            df = df[temporal.mask(df.delta_time.to_numpy())]
+
+        # Keep only the rows within the AOI (or its bounding box, without a cover),
+        # and matching the specified query
+        df = df[
+            df.lon_lowestmode.between(min_x, max_x)
+            & df.lat_lowestmode.between(min_y, max_y)
+            if cover is None
+            else cover.intersects(
+                aoi_geometry, df.lon_lowestmode.to_numpy(), df.lat_lowestmode.to_numpy()
+            )
+        ].query(query)
+
+        return beam.name, datasets, joined_rows, df
+
+    def read_joined_rows(
+        dataset: h5py.Dataset, rows: np.ndarray, indices: Optional[Sequence[int]]
+    ) -> np.ndarray:
+        """Read rows of a joined dataset, which may not be in sorted order."""
+        order = np.argsort(rows, kind="stable")
+        sorted_values = planner.read_rows(dataset, rows[order], indices)
+        values = np.empty_like(sorted_values)
+        values[order] = sorted_values
+
+        return values
+
+    def subset_beam(
+        beam_name: str,
+        datasets: Dict[str, h5py.Dataset],
+        joined_rows: Dict[str, np.ndarray],
+        df: pd.DataFrame,
+    ) -> gpd.GeoDataFrame:
+        """Subset an individual `"BEAM*"` group as described above, given the rows
+        selected from the group (see `select_rows`).
+        """
+        rows = df.index.to_numpy()
         # Grab the coordinates for the geometry, before dropping columns
         x, y = df.lon_lowestmode, df.lat_lowestmode
-        # Drop all columns NOT specified by the columns parameter
-        df.drop(columns=list(set(df.columns) - set(columns)), inplace=True)
-        df.insert(0, "BEAM", beam.name[5:])
+
+        # Read the remaining datasets only for the selected rows, storing each row
+        # of a 2-D (per-shot) dataset as an array (e.g., all or some of the `rh`
+        # percentiles).
+        for dataset in planner.order(datasets[name] for name in column_specs):
+            name = posixpath.basename(dataset.name)
+            indices = column_specs[name]
+
+            if dataset.ndim == 1 and indices is not None:
+                raise ValueError(f"Cannot select indices of 1-D dataset: {name}")
+            if name not in df.columns:
+                values = (
+                    planner.read_rows(dataset, rows, indices)
+                    if name not in joined_rows
+                    else read_joined_rows(dataset, joined_rows[name][rows], indices)
+                )
+                df = df.assign(
+                    **{
+                        name: values
+                        if values.ndim == 1
+                        else pd.Series(list(values), index=df.index, dtype=object)
+                    }
+                )
+
+        # Keep only the columns specified by the columns parameter
+        df = df[[name for name in dataset_names if name in column_specs]]
+        df.insert(0, "BEAM", beam_name[5:])
         gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(x, y), crs="EPSG:4326")
 
-        # Clip subset to the area of interest
-        return gpd.clip(gdf, aoi.set_crs(epsg=4326))
+        # Clip subset to the area of interest (unless already done via the cover)
+        return gdf if cover is not None else gpd.clip(gdf, aoi.set_crs(epsg=4326))
+
+    planner = ReadPlanner() if planner is None else planner
+    column_specs = dict(map(parse_column, columns))
+    coordinate_names = {"lon_lowestmode", "lat_lowestmode"}
+    temporal_names = set() if temporal is None else {"delta_time"}
+    predicate_names = sorted(expr_names(query) | coordinate_names | temporal_names)
+    min_x, min_y, max_x, max_y = aoi.total_bounds
+    aoi_geometry = None if cover is None else aoi.unary_union
 
     # Sorting isn't necessary for correctness, but is necessary for consistent ordering
     # for expected output in the doctests in this function's docstring.
-    dataset_names = sorted(
-        set(columns) | expr_names(query) | {"lon_lowestmode", "lat_lowestmode"}
-    )
+    dataset_names = sorted(set(column_specs) | set(predicate_names))
 
     beams = (group for name, group in hdf5.items() if name.startswith("BEAM"))
-    beams_gdf = pd.concat(map(subset_beam, beams), ignore_index=True, copy=False)
+    selections = [select_rows(beam) for beam in beams]
+
+    if sample is not None:
+        # Sample across all beams at once, so that a maximum number of rows applies
+        # to the granule as a whole
+        samples = sample.select(
+            os.path.basename(hdf5.file.filename),
+            [len(df) for *_, df in selections],
+        )
+        selections = [
+            (*selection[:-1], selection[-1].iloc[positions])
+            for selection, positions in zip(selections, samples)
+        ]
+
+    beams_gdf = pd.concat(
+        starmap(subset_beam, selections), ignore_index=True, copy=False
+    )
     beams_gdf.insert(0, "filename", os.path.basename(hdf5.file.filename))
 
     return beams_gdf
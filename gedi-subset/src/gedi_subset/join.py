@@ -0,0 +1,98 @@
+"""Joining of GEDI products (e.g., L2A, L2B, and L4A) on shot numbers.
+
+The GEDI products derived from the same L1B granule (e.g., L2A heights, L2B
+cover, and L4A biomass) contain the same shots, identified by `shot_number`
+within every beam, so their datasets may be combined into a single table, rather
+than subsetting every product separately and joining the (much larger) subsets
+afterwards.  Granules of different products are paired by the orbit, sub-orbit,
+and track parsed from their names (see `granule_key`), and the shots of paired
+granules are joined by `merge_join`, within every beam.
+
+Functions:
+
+- granule_key returns the orbit, sub-orbit, and track of a granule
+- pair_granules pairs granules with the granules of other products
+- merge_join joins two arrays of shot numbers
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Sequence, Tuple
+
+from gedi_subset.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+    from maap.Result import Granule
+else:
+    np = lazy_import("numpy")
+
+logger = logging.getLogger(f"gedi_subset.{__name__}")
+
+_GRANULE_KEY_PATTERN = re.compile(r"_O(\d+)_(\d+)_T(\d+)_")
+
+
+def granule_key(granule: Granule) -> Optional[Tuple[str, str, str]]:
+    """Return the orbit, sub-orbit granule, and track of a granule, parsed from
+    its name, or `None` if its name does not follow GEDI naming conventions.
+
+    >>> granule_key({"Granule": {
+    ...     "GranuleUR": "GEDI02_A_2019108080338_O01964_01_T05337_02_003_01_V002.h5"
+    ... }})
+    ('01964', '01', '05337')
+    >>> granule_key({"Granule": {"GranuleUR": "foo.h5"}}) is None
+    True
+    """
+    match = _GRANULE_KEY_PATTERN.search(granule["Granule"]["GranuleUR"])
+
+    return None if match is None else match.groups()
+
+
+def pair_granules(
+    granules: Iterable[Granule], others: Sequence[Iterable[Granule]]
+) -> Iterator[Tuple[Granule, Tuple[Granule, ...]]]:
+    """Pair every granule with the granules of the same orbit, sub-orbit, and track
+    (see `granule_key`) of every other collection, preserving the order of
+    `granules`.  Granules lacking a counterpart in any of the other collections
+    are skipped (with a warning).
+    """
+    indexes = [
+        {granule_key(other): other for other in collection} for collection in others
+    ]
+
+    for granule in granules:
+        key = granule_key(granule)
+        matches = tuple(index.get(key) for index in indexes)
+
+        if indexes and (key is None or any(match is None for match in matches)):
+            granule_ur = granule["Granule"]["GranuleUR"]
+            logger.warning(f"Skipping {granule_ur}: no granule(s) to join with")
+            continue
+
+        yield granule, matches
+
+
+def merge_join(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Return, for every value of `left`, the position of the same value within
+    `right`, or -1 where `right` does not contain the value.
+
+    Shot numbers are sorted within every beam, in which case the values are
+    matched by a (vectorized) sorted merge; otherwise, `right` is sorted first.
+
+    >>> merge_join(np.array([10, 11, 13, 14]), np.array([11, 12, 13]))
+    array([-1,  0,  2, -1])
+    >>> merge_join(np.array([10, 11, 13]), np.array([13, 10]))
+    array([ 1, -1,  0])
+    """
+    if len(right) == 0:
+        return np.full(len(left), -1)
+
+    is_sorted = np.all(right[:-1] <= right[1:])
+    order = None if is_sorted else np.argsort(right, kind="stable")
+    sorted_right = right if order is None else right[order]
+    positions = np.minimum(np.searchsorted(sorted_right, left), len(right) - 1)
+    found = sorted_right[positions] == left
+
+    return np.where(found, positions if order is None else order[positions], -1)
@@ -0,0 +1,76 @@
+"""Lazy importing of modules that are expensive to import.
+
+Importing modules such as `geopandas`, `pandas`, and `h5py` takes a noticeable
+amount of time, which is paid by every process that imports them, including
+every worker process of a process pool (depending upon the start method).  A
+lazily imported module is imported only upon first access of one of its
+attributes, so that processes that never use it never pay for importing it.
+
+Typical usage, which also allows static type checkers to see the real module:
+
+```python
+from typing import TYPE_CHECKING
+
+from gedi_subset.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+else:
+    gpd = lazy_import("geopandas")
+```
+
+Functions:
+
+- lazy_import returns a proxy that imports a module upon first attribute access
+"""
+
+import importlib
+import sys
+import warnings
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule(ModuleType):
+    """Module proxy that imports the named module upon first attribute access."""
+
+    def __init__(self, name: str, ignore_warnings: bool = False):
+        super().__init__(name)
+        self.__ignore_warnings = ignore_warnings
+        self.__module: Optional[ModuleType] = None
+
+    def __load(self) -> ModuleType:
+        if self.__module is None:
+            with warnings.catch_warnings():
+                if self.__ignore_warnings:
+                    warnings.simplefilter("ignore")
+                self.__module = importlib.import_module(self.__name__)
+
+        return self.__module
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__load(), name)
+
+    def __dir__(self):
+        return dir(self.__load())
+
+    def __repr__(self) -> str:
+        state = "imported" if self.__module is not None else "not yet imported"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name: str, ignore_warnings: bool = False) -> ModuleType:
+    """Return the named module, or a proxy that imports it when first used.
+
+    If the module is already imported, simply return it.  Otherwise, return a
+    proxy that imports the module upon first access of any of its attributes.
+    If `ignore_warnings` is `True`, suppress warnings raised while importing
+    the module (such as those `geopandas` raises for mismatched GEOS versions).
+
+    >>> json = lazy_import("json")
+    >>> json.dumps([1, 2])
+    '[1, 2]'
+    >>> lazy_import("this_is_not_a_module")
+    <lazy module 'this_is_not_a_module' (not yet imported)>
+    """
+    return sys.modules.get(name) or LazyModule(name, ignore_warnings)
@@ -6,33 +6,62 @@ Collection functions:
 
 Granule functions:
 
-- download_granule attempts to download a granule file
+- download_granule attempts to download a granule file, retrying transient failures
+- granule_from_metadata constructs a granule from (previously obtained) metadata
 """
 
+from __future__ import annotations
+
 import logging
 import operator
-from typing import TYPE_CHECKING, Mapping, Union
+import time
+from typing import TYPE_CHECKING, Any, Mapping, Union
 
-import boto3
-from cachetools import FIFOCache, cached
-from cachetools.func import ttl_cache
-from maap.maap import MAAP
-from maap.Result import Collection, Granule
+from cachetools import FIFOCache, TTLCache, cached
 from returns.converters import result_to_maybe
 from returns.curry import partial
-from returns.io import IOFailure, IOResult, IOResultE, impure_safe
+from returns.io import IOFailure, IOResult, IOResultE, IOSuccess, impure_safe
 from returns.maybe import Maybe
 from returns.pipeline import flow, is_successful, pipe
 from returns.pointfree import bind, bind_ioresult, lash, map_
 from returns.result import safe
+from returns.unsafe import unsafe_perform_io
 
 from gedi_subset import fp
+from gedi_subset.lazy import lazy_import
 
 if TYPE_CHECKING:
+    import boto3
+    import botocore.exceptions as botocore_exceptions
+    import maap.Result as maap_result
+    import requests
     from maap.AWS import AWSCredentials
+    from maap.maap import MAAP
+    from maap.Result import Collection, Granule
+else:
+    boto3 = lazy_import("boto3")
+    botocore_exceptions = lazy_import("botocore.exceptions")
+    maap_result = lazy_import("maap.Result")
+    requests = lazy_import("requests")
 
 logger = logging.getLogger(f"gedi_subset.{__name__}")
 
+#: S3 error codes and HTTP status codes of (likely) transient download failures.
+TRANSIENT_ERROR_CODES = frozenset(
+    {
+        "InternalError",
+        "RequestTimeout",
+        "ServiceUnavailable",
+        "SlowDown",
+        "Throttling",
+        "429",
+        "500",
+        "502",
+        "503",
+        "504",
+    }
+)
+
 
 def _is_s3_credentials_online_resource(resource) -> bool:
     url = resource.get("URL", "").lower()
@@ -52,13 +81,27 @@ def _s3_credentials_endpoint(granule: Granule) -> Maybe[str]:
     )
 
 
-@ttl_cache(ttl=55 * 60)
+#: Short-term S3 credentials by credentials endpoint, expiring before the
+#: credentials themselves do (after 1 hour).
+_s3_credentials: TTLCache = TTLCache(maxsize=32, ttl=55 * 60)
+
+
 def _earthdata_s3_credentials(maap: MAAP, endpoint: str) -> IOResultE["AWSCredentials"]:
-    """Returns short-term AWS credentials obtained from an S3 credentials endpoint."""
+    """Returns short-term AWS credentials obtained from an S3 credentials endpoint.
+
+    Credentials are cached by endpoint alone (every task unpickles its own `maap`),
+    so a worker process obtains credentials once for all of the tasks it runs
+    (including the tasks of many jobs, when run by `gedi_subset.service`) until
+    shortly before they expire.  Failures are not cached.
+    """
+    if (creds := _s3_credentials.get(endpoint)) is not None:
+        return IOSuccess(creds)
 
     logger.debug(f"Obtaining S3 credentials from {endpoint}")
 
-    return impure_safe(maap.aws.earthdata_s3_credentials)(endpoint)
+    return impure_safe(maap.aws.earthdata_s3_credentials)(endpoint).map(
+        partial(_s3_credentials.setdefault, endpoint)
+    )
 
 
 @cached(cache=FIFOCache(maxsize=1), key=lambda creds: creds["sessionToken"])
@@ -76,12 +119,56 @@ def _setup_default_boto3_session(creds: "AWSCredentials") -> None:
     )
 
 
-def download_granule(maap: MAAP, todir: str, granule: Granule) -> IOResultE[str]:
+def is_transient(error: Exception) -> bool:
+    """Return `True` if a download failure is (likely) transient, and thus worth
+    retrying (e.g., a connection error, a timeout, or throttling); otherwise
+    `False`.
+
+    >>> is_transient(ConnectionResetError())
+    True
+    >>> is_transient(FileNotFoundError())
+    False
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    if isinstance(
+        error,
+        (
+            botocore_exceptions.ConnectionError,
+            botocore_exceptions.HTTPClientError,
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ),
+    ):
+        return True
+
+    if isinstance(error, botocore_exceptions.ClientError):
+        return error.response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES
+
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = getattr(error.response, "status_code", None)
+        return str(status) in TRANSIENT_ERROR_CODES
+
+    return False
+
+
+def download_granule(
+    maap: MAAP,
+    todir: str,
+    granule: Granule,
+    retries: int = 0,
+    backoff: float = 1.0,
+) -> IOResultE[str]:
     """Download a granule's data file.
 
     Automatically fetch S3 credentials appropriate for `granule`, based upon
     it's S3 URL, and automatically refreshes credentials before expiry.
 
+    Retry transient failures (see `is_transient`) up to `retries` times, waiting
+    `backoff` seconds before the first retry, doubling the wait for every
+    subsequent retry.
+
     Return `IOSuccess[str]` containing the absolute path of the downloaded file
     upon success; otherwise return `IOFailure[Exception]` containing the reason
     for failure.
@@ -104,7 +191,44 @@ def download_granule(maap: MAAP, todir: str, granule: Granule) -> IOResultE[str]
         if isinstance(result, IOResult) and not is_successful(result):
             return result
 
-    return impure_safe(granule.getData)(todir)
+    download = impure_safe(granule.getData)(todir)
+
+    for attempt in range(retries):
+        if is_successful(download):
+            break
+
+        error = unsafe_perform_io(download.failure())
+
+        if not is_transient(error):
+            break
+
+        delay = backoff * 2**attempt
+        logger.warning(f"Retrying download of {granule_ur} in {delay:.0f}s: {error}")
+        time.sleep(delay)
+        # Overwrite any partially downloaded file
+        download = impure_safe(granule.getData)(todir, overwrite=True)
+
+    return download
+
+
+def granule_from_metadata(maap: MAAP, metadata: Mapping[str, Any]) -> Granule:
+    """Construct a granule from its metadata, as if found via `maap.searchGranule`.
+
+    This allows granules to be downloaded (via `download_granule`) based upon
+    metadata obtained earlier (e.g., from a `gedi_subset.footprints` index),
+    without searching CMR again.
+    """
+    # These are the (private) values maap.searchGranule uses for constructing
+    # granules, which are required only for downloading granules via HTTP.
+    get_api_header = getattr(maap, "_get_api_header", dict)
+
+    return maap_result.Granule(
+        metadata,
+        awsAccessKey=getattr(maap, "_AWS_ACCESS_KEY", ""),
+        awsAccessSecret=getattr(maap, "_AWS_ACCESS_SECRET", ""),
+        cmrFileUrl=getattr(maap, "_SEARCH_GRANULE_URL", ""),
+        apiHeader=get_api_header(),
+    )
 
 
 def find_collection(
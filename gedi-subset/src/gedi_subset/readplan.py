@@ -0,0 +1,515 @@
+"""Planning of HDF5 dataset reads around the datasets' storage layouts.
+
+GEDI datasets are stored in compressed (e.g., shuffled and gzipped) chunks, each
+of which must be decompressed in its entirety for reading any of its values.
+Reading datasets naively (one at a time, in name order, and reading the block of
+rows spanning all selected rows) may therefore decompress chunks that contain no
+selected rows, decompress the same chunk more than once (when a chunk is larger
+than HDF5's raw data chunk cache), and jump back and forth within the file
+(which is particularly costly when reading a file remotely).
+
+A `ReadPlanner` instead:
+
+- orders the reads of datasets by the file offsets of their data, so that files
+  are read (more or less) sequentially,
+- coalesces selected rows into ranges of rows spanning only chunks containing
+  selected rows (see `row_ranges`), reading each range with a single read,
+- reads rows through a chunk cache sized for the dataset (see `chunk_cache`),
+  so that chunks read for one selection of rows are not decompressed again for
+  another (e.g., for another AOI of a batch), and
+- accumulates statistics of the reads (see `ReadStats`), including the number of
+  chunks read, and their stored (compressed) and decoded (decompressed) sizes.
+
+HDF5 decompresses chunks serially, holding its global lock, so a worker process
+spends most of the time it takes to read a compressed granule decompressing
+chunks on a single core.  A planner with `threads` instead reads the raw
+(compressed) chunks containing selected rows directly (see `decode_pipeline`
+for the filters supported), and decompresses them on a pool of threads (with
+zlib, which releases the GIL while decompressing), copying the selected values
+of every decoded chunk straight into the resulting array, such that fewer
+worker processes (each with fewer granules in memory) may keep all cores busy.
+Raw chunks bypass the chunk cache, so such chunks read for more than one
+selection of rows are decompressed again for every selection.
+
+Functions:
+
+- dataset_layout returns the storage layout of a dataset
+- chunk_cache returns the chunk cache size and number of slots for a layout
+- row_ranges coalesces selected rows into ranges to read
+- decode_pipeline returns the filters of a dataset, if its chunks are decodable
+- decode_chunk decodes a raw chunk
+"""
+
+from __future__ import annotations
+
+import functools
+import math
+import posixpath
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from gedi_subset.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import h5py
+    import numpy as np
+else:
+    h5py = lazy_import("h5py")
+    np = lazy_import("numpy")
+
+#: Default size (in bytes) of HDF5's raw data chunk cache of each dataset.
+DEFAULT_CACHE_NBYTES = 1024 * 1024
+
+#: Maximum size (in bytes) of the chunk cache of a dataset read by a planner.
+MAX_CACHE_NBYTES = 64 * 1024 * 1024
+
+#: HDF5 filter identifiers of the filters that raw chunks may be decoded from.
+FILTER_DEFLATE = 1
+FILTER_SHUFFLE = 2
+
+
+@dataclass(frozen=True)
+class Layout:
+    """Storage layout of a dataset.
+
+    `offset` is the file offset of the dataset's (first chunk of) data, or `-1`
+    when unknown (e.g., when no data has been written, or the HDF5 library does
+    not support querying chunk locations).
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    itemsize: int
+    chunks: Optional[Tuple[int, ...]]
+    filters: Tuple[str, ...]
+    offset: int
+    storage_size: int
+
+    @property
+    def chunk_nbytes(self) -> int:
+        """Decoded size (in bytes) of a chunk (of the whole dataset, if it is not
+        chunked).
+        """
+        return math.prod(self.chunks or self.shape) * self.itemsize
+
+    @property
+    def n_chunks(self) -> int:
+        """Number of chunks of the dataset (1, if it is not chunked)."""
+        if not self.chunks:
+            return 1
+
+        return math.prod(-(-n // c) for n, c in zip(self.shape, self.chunks))
+
+
+@dataclass
+class ReadStats:
+    """Statistics of reads of datasets.
+
+    Stored sizes of partially read datasets are estimated from the average
+    stored size of their chunks.  Since (local) reads of compressed datasets are
+    dominated by decompression, `seconds` (the time spent within HDF5 reads)
+    approximates the time spent decompressing.
+    """
+
+    reads: int = 0
+    chunks: int = 0
+    stored_bytes: int = 0
+    decoded_bytes: int = 0
+    seconds: float = 0.0
+
+    def add(
+        self,
+        layout: Layout,
+        chunks: int,
+        seconds: float,
+        stored_bytes: Optional[int] = None,
+    ) -> None:
+        self.reads += 1
+        self.chunks += chunks
+        self.stored_bytes += (
+            round(layout.storage_size * chunks / layout.n_chunks)
+            if stored_bytes is None
+            else stored_bytes
+        )
+        self.decoded_bytes += chunks * layout.chunk_nbytes
+        self.seconds += seconds
+
+    def __str__(self) -> str:
+        return (
+            f"{self.reads} reads of {self.chunks} chunks"
+            f" ({self.stored_bytes / 2**20:.1f} MiB stored,"
+            f" {self.decoded_bytes / 2**20:.1f} MiB decoded)"
+            f" in {self.seconds:.3f}s"
+        )
+
+
+def dataset_layout(dataset: h5py.Dataset) -> Layout:
+    """Return the storage layout of a dataset."""
+    dsid = dataset.id
+    filters = tuple(
+        name
+        for name, enabled in (
+            ("shuffle", dataset.shuffle),
+            (dataset.compression, dataset.compression),
+            ("scaleoffset", dataset.scaleoffset is not None),
+            ("fletcher32", dataset.fletcher32),
+        )
+        if enabled
+    )
+
+    try:
+        if dataset.chunks is None:
+            offset = dsid.get_offset()
+        else:
+            offset = (
+                dsid.get_chunk_info(0).byte_offset if dsid.get_num_chunks() else None
+            )
+    except (AttributeError, RuntimeError, ValueError):
+        offset = None
+
+    return Layout(
+        dataset.name,
+        dataset.shape,
+        dataset.dtype.itemsize,
+        dataset.chunks,
+        filters,
+        -1 if offset is None else offset,
+        dsid.get_storage_size(),
+    )
+
+
+def _next_prime(n: int) -> int:
+    def is_prime(k: int) -> bool:
+        return k > 1 and all(k % d for d in range(2, math.isqrt(k) + 1))
+
+    while not is_prime(n):
+        n += 1
+
+    return n
+
+
+def chunk_cache(layout: Layout, max_nbytes: int = MAX_CACHE_NBYTES) -> Tuple[int, int]:
+    """Return the size (in bytes) and number of hash table slots of a chunk cache
+    for reading rows of a dataset.
+
+    The cache is large enough to hold every (decoded) chunk of the dataset, so
+    that chunks read for one selection of rows remain cached for other selections
+    (e.g., for other AOIs of a batch), but is never smaller than the HDF5 default,
+    nor larger than `max_nbytes`.  Following the HDF5 documentation, the number of
+    slots is a prime number roughly 100 times the number of chunks that fit in the
+    cache.
+
+    >>> layout = Layout("/rh", (100_000, 101), 4, (8192, 101), ("gzip",), 0, 0)
+    >>> chunk_cache(layout)
+    (43024384, 1301)
+    """
+    nbytes = min(
+        max(layout.n_chunks * layout.chunk_nbytes, DEFAULT_CACHE_NBYTES), max_nbytes
+    )
+    nslots = _next_prime(max(100 * (nbytes // max(layout.chunk_nbytes, 1)), 101))
+
+    return nbytes, nslots
+
+
+def _dim0_chunks(layout: Layout) -> int:
+    if not layout.chunks or not layout.shape:
+        return 1
+
+    return max(-(-layout.shape[0] // layout.chunks[0]), 1)
+
+
+def row_ranges(rows: np.ndarray, rows_per_chunk: int) -> List[Tuple[int, int]]:
+    """Coalesce sorted row indices into `(start, stop)` ranges of rows.
+
+    Consecutive selected rows belong to the same range unless a whole chunk (of
+    `rows_per_chunk` rows) without selected rows lies between them, so that
+    reading the ranges decompresses only chunks containing selected rows, with as
+    few reads as possible.
+
+    >>> row_ranges(np.array([1, 5, 12, 13, 40, 41, 95]), 10)
+    [(1, 14), (40, 42), (95, 96)]
+    """
+    if rows.size == 0:
+        return []
+
+    chunk = rows // rows_per_chunk
+    breaks = np.flatnonzero(np.diff(chunk) > 1) + 1
+    starts = rows[np.r_[0, breaks]]
+    stops = rows[np.r_[breaks - 1, rows.size - 1]] + 1
+
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def decode_pipeline(dataset: h5py.Dataset) -> Optional[Tuple[int, ...]]:
+    """Return the identifiers of the filters of a chunked 1-D or 2-D dataset (in
+    the order they are applied when writing chunks), if its raw chunks may be
+    decoded by `decode_chunk` (i.e., when its only filters are deflate and
+    shuffle, and all of its chunks are allocated); otherwise `None`.
+    """
+    if dataset.chunks is None or dataset.ndim not in (1, 2):
+        return None
+
+    plist = dataset.id.get_create_plist()
+    pipeline = tuple(plist.get_filter(i)[0] for i in range(plist.get_nfilters()))
+
+    if not set(pipeline) <= {FILTER_DEFLATE, FILTER_SHUFFLE}:
+        return None
+
+    try:
+        n_chunks = dataset.id.get_num_chunks()
+    except (AttributeError, RuntimeError, ValueError):
+        return None
+
+    return pipeline if n_chunks == dataset_layout(dataset).n_chunks else None
+
+
+def decode_chunk(
+    raw: bytes,
+    filter_mask: int,
+    pipeline: Sequence[int],
+    dtype: np.dtype,
+    shape: Tuple[int, ...],
+) -> np.ndarray:
+    """Decode a raw chunk (as read by `read_direct_chunk`) of the given shape by
+    reverting the filters of a pipeline (see `decode_pipeline`), except those
+    skipped for the chunk (as indicated by the chunk's filter mask).
+
+    The resulting array is a (read-only) view of the decompressed bytes, unless
+    the chunk is shuffled, in which case the bytes are unshuffled into a new
+    array, thus copying (at most) once after decompression.
+
+    >>> values = np.arange(6, dtype="<u2")
+    >>> shuffled = values.view("u1").reshape(-1, 2).T.tobytes()
+    >>> decode_chunk(zlib.compress(shuffled), 0, (2, 1), values.dtype, (2, 3))
+    array([[0, 1, 2],
+           [3, 4, 5]], dtype=uint16)
+    >>> decode_chunk(values.tobytes(), 0b11, (2, 1), values.dtype, (6,))
+    array([0, 1, 2, 3, 4, 5], dtype=uint16)
+    """
+    nbytes = math.prod(shape) * dtype.itemsize
+    data = raw
+
+    for i in reversed(range(len(pipeline))):
+        if filter_mask & (1 << i):
+            continue
+        if pipeline[i] == FILTER_DEFLATE:
+            data = zlib.decompress(data, bufsize=nbytes)
+        elif pipeline[i] == FILTER_SHUFFLE and dtype.itemsize > 1:
+            unshuffled = np.empty(nbytes, dtype=np.uint8)
+            unshuffled.reshape(-1, dtype.itemsize)[:] = (
+                np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T
+            )
+            data = unshuffled
+
+    return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+
+@functools.lru_cache(maxsize=None)
+def _decode_pool(threads: int) -> ThreadPoolExecutor:
+    """Return the (process-wide) pool of threads for decoding chunks."""
+    return ThreadPoolExecutor(threads, thread_name_prefix="decode")
+
+
+class ReadPlanner:
+    """Plans (and performs) reads of datasets, accumulating statistics of the reads
+    in `stats` (see the module documentation).
+
+    When `threads` is positive, chunks of datasets that may be decoded in
+    parallel (see `decode_pipeline`) are decoded on that many threads.
+    """
+
+    def __init__(self, max_cache_nbytes: int = MAX_CACHE_NBYTES, threads: int = 0):
+        self.max_cache_nbytes = max_cache_nbytes
+        self.threads = threads
+        self.stats = ReadStats()
+        self._datasets: Dict[Tuple[int, str], h5py.Dataset] = {}
+
+    def order(self, datasets: Iterable[h5py.Dataset]) -> List[h5py.Dataset]:
+        """Return datasets ordered by the file offsets of their data (datasets
+        with unknown offsets first, by name).
+        """
+        return sorted(
+            datasets, key=lambda dataset: (dataset_layout(dataset).offset, dataset.name)
+        )
+
+    def read(self, dataset: h5py.Dataset) -> np.ndarray:
+        """Read all values of a dataset."""
+        if self.threads and (pipeline := decode_pipeline(dataset)) is not None:
+            rows = np.arange(len(dataset))
+            return self._decode_rows(dataset, pipeline, rows, None)
+
+        layout = dataset_layout(dataset)
+        start = time.perf_counter()
+        values = dataset[()]
+        self.stats.add(layout, layout.n_chunks, time.perf_counter() - start)
+
+        return values
+
+    def read_rows(
+        self,
+        dataset: h5py.Dataset,
+        rows: np.ndarray,
+        indices: Optional[Sequence[int]] = None,
+    ) -> np.ndarray:
+        """Read the specified (sorted) rows (and optionally columns) of a 1-D or
+        2-D dataset, reading coalesced ranges of rows (see `row_ranges`) through a
+        chunk cache sized for the dataset (see `chunk_cache`).
+
+        >>> import io
+        >>> with h5py.File(io.BytesIO(), "w") as hdf5:
+        ...     dataset = hdf5.create_dataset(
+        ...         "rh", data=np.arange(400).reshape(100, 4), chunks=(10, 4)
+        ...     )
+        ...     planner = ReadPlanner()
+        ...     planner.read_rows(dataset, np.array([1, 3, 95]), [0, 2])
+        array([[  4,   6],
+               [ 12,  14],
+               [380, 382]])
+        >>> planner.stats.chunks
+        2
+        """
+        columns = () if indices is None else (list(indices),)
+        shape = dataset.shape[1:] if indices is None else (len(indices),)
+        values = np.empty((rows.size, *shape), dtype=dataset.dtype)
+
+        if rows.size == 0:
+            return values
+
+        if self.threads and (pipeline := decode_pipeline(dataset)) is not None:
+            return self._decode_rows(dataset, pipeline, rows, indices)
+
+        layout = dataset_layout(dataset)
+        dataset = self._with_chunk_cache(dataset, layout)
+        ranges = row_ranges(rows, layout.chunks[0] if layout.chunks else len(dataset))
+        other_chunks = layout.n_chunks // _dim0_chunks(layout)
+        start_time = time.perf_counter()
+        i = 0
+
+        for start, stop in ranges:
+            j = i + int(np.searchsorted(rows[i:], stop))
+            values[i:j] = dataset[(slice(start, stop), *columns)][rows[i:j] - start]
+            i = j
+
+        if layout.chunks:
+            # Ranges never share chunks, so this counts every chunk read only once
+            rows_per_chunk = layout.chunks[0]
+            chunks = other_chunks * sum(
+                (stop - 1) // rows_per_chunk - start // rows_per_chunk + 1
+                for start, stop in ranges
+            )
+        else:
+            chunks = 1
+
+        self.stats.add(layout, chunks, time.perf_counter() - start_time)
+
+        return values
+
+    def _with_chunk_cache(self, dataset: h5py.Dataset, layout: Layout) -> h5py.Dataset:
+        """Return the dataset reopened (once per planner) with a chunk cache sized
+        for reading its rows (or the dataset itself, if it is not chunked).
+        """
+        if not layout.chunks:
+            return dataset
+
+        key = (dataset.file.id.fileno, dataset.name)
+
+        if (cached := self._datasets.get(key)) is not None:
+            return cached
+
+        nbytes, nslots = chunk_cache(layout, self.max_cache_nbytes)
+        dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+        dapl.set_chunk_cache(nslots, nbytes, 0.75)
+        name = posixpath.basename(dataset.name).encode()
+        self._datasets[key] = h5py.Dataset(
+            h5py.h5d.open(dataset.parent.id, name, dapl=dapl)
+        )
+
+        return self._datasets[key]
+
+    def _decode_rows(
+        self,
+        dataset: h5py.Dataset,
+        pipeline: Sequence[int],
+        rows: np.ndarray,
+        indices: Optional[Sequence[int]],
+    ) -> np.ndarray:
+        """Read the specified (sorted) rows (and optionally columns) of a dataset
+        by reading the raw chunks containing them, and decoding the chunks on a
+        pool of threads, each copying its chunk's selected values into the result.
+        """
+        layout = dataset_layout(dataset)
+        chunks = layout.chunks or ()
+        dtype, ndim = dataset.dtype, dataset.ndim
+        columns = None if indices is None else np.asarray(indices, dtype=np.intp)
+        width = () if ndim == 1 else (dataset.shape[1],)
+        shape = width if columns is None else (len(columns),)
+        values = np.empty((rows.size, *shape), dtype=dtype)
+
+        if rows.size == 0:
+            return values
+
+        pool = _decode_pool(self.threads)
+        start_time = time.perf_counter()
+
+        def decode(raw, filter_mask, row_slice, offsets, column_slice) -> None:
+            chunk = decode_chunk(raw, filter_mask, pipeline, dtype, chunks)
+            chunk_rows = rows[row_slice] - offsets[0]
+
+            if ndim == 1:
+                values[row_slice] = chunk[chunk_rows]
+            elif columns is None:
+                n = column_slice.stop - column_slice.start
+                values[row_slice, column_slice] = chunk[chunk_rows, :n]
+            else:
+                chunk_columns = columns[column_slice] - offsets[1]
+                values[row_slice, column_slice] = chunk[
+                    np.ix_(chunk_rows, chunk_columns)
+                ]
+
+        # Column chunks, and the (sorted) selected columns within each
+        if ndim == 1:
+            column_chunks = [((), slice(None))]
+        elif columns is None:
+            column_chunks = [
+                ((start,), slice(start, min(start + chunks[1], width[0])))
+                for start in range(0, width[0], chunks[1])
+            ]
+        else:
+            starts = np.unique(columns // chunks[1]) * chunks[1]
+            bounds = np.searchsorted(columns, np.r_[starts, starts[-1] + chunks[1]])
+            column_chunks = [
+                ((start,), slice(lo, hi))
+                for start, lo, hi in zip(starts.tolist(), bounds, bounds[1:])
+            ]
+
+        row_starts = np.unique(rows // chunks[0]) * chunks[0]
+        row_bounds = np.searchsorted(
+            rows, np.r_[row_starts, row_starts[-1] + chunks[0]]
+        )
+        futures = []
+        stored_bytes = 0
+
+        # Raw reads are serialized by HDF5 anyway, so chunks are read here, while
+        # the threads decode the chunks read so far
+        for row_start, lo, hi in zip(row_starts.tolist(), row_bounds, row_bounds[1:]):
+            for column_offset, column_slice in column_chunks:
+                offsets = (row_start, *column_offset)
+                filter_mask, raw = dataset.id.read_direct_chunk(offsets)
+                stored_bytes += len(raw)
+                futures.append(
+                    pool.submit(
+                        decode, raw, filter_mask, slice(lo, hi), offsets, column_slice
+                    )
+                )
+
+        for future in futures:
+            future.result()
+
+        self.stats.add(
+            layout, len(futures), time.perf_counter() - start_time, stored_bytes
+        )
+
+        return values
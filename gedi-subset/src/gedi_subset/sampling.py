@@ -0,0 +1,165 @@
+"""Sampling of shots, and ordering of granules, for quick, exploratory subsets.
+
+For a quick look at the data within an AOI, subsetting every intersecting
+granule is unnecessary.  A `Sample` selects a random fraction of the shots
+selected from every granule, and/or at most a maximum number of shots, before
+any datasets other than those needed for selecting shots are read (see
+`gedi_subset.gedi_utils.subset_hdf5`).  Samples are reproducible: the shots
+sampled from a granule depend only upon the sample's seed and the granule's
+filename (so speculative attempts of subsetting a granule sample the same
+shots).
+
+When only a limited number of shots is wanted, the granules subset first
+determine which shots are obtained.  Since CMR returns granules in temporal
+order, `spread_granules` reorders granules such that every prefix of the order
+is spread across both the AOI and the time range of the granules.
+
+Functions:
+
+- spread_order orders points such that every prefix is spread across the points
+- spread_granules orders granules such that every prefix is spread in space and time
+"""
+
+from __future__ import annotations
+
+import zlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence
+
+from gedi_subset.gedi_utils import granule_footprint
+from gedi_subset.lazy import lazy_import
+from gedi_subset.temporal import parse_datetime
+
+if TYPE_CHECKING:
+    import numpy as np
+    from maap.Result import Granule
+else:
+    np = lazy_import("numpy")
+
+
+@dataclass(frozen=True)
+class Sample:
+    """Random sample of shots, consisting of a `fraction` of the shots selected
+    from a granule, limited to at most `max_rows` shots (if specified).
+    """
+
+    fraction: float = 1.0
+    max_rows: Optional[int] = None
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if not 0 < self.fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1]: {self.fraction}")
+        if self.max_rows is not None and self.max_rows < 0:
+            raise ValueError(f"Maximum rows must not be negative: {self.max_rows}")
+
+    def rng(self, key: str) -> np.random.Generator:
+        """Return a random number generator seeded by the sample's seed and a key
+        (e.g., the filename of a granule).
+        """
+        return np.random.default_rng([self.seed, zlib.crc32(key.encode())])
+
+    def take(self, key: str, size: int, n: int) -> np.ndarray:
+        """Return the (sorted) positions of `n` rows chosen uniformly at random
+        from `size` rows (or all rows, if `n >= size`).
+
+        >>> Sample().take("key", 3, 5)
+        array([0, 1, 2])
+        >>> len(Sample().take("key", 1000, 10))
+        10
+        """
+        if n >= size:
+            return np.arange(size)
+
+        return np.sort(self.rng(key).choice(size, n, replace=False))
+
+    def select(self, key: str, sizes: Sequence[int]) -> List[np.ndarray]:
+        """Sample groups of rows (e.g., the rows selected from every beam of a
+        granule), returning the (sorted) positions of the sampled rows within each
+        group.
+
+        Every row is sampled with probability `fraction`, and if more than
+        `max_rows` rows are sampled, `max_rows` of them are chosen uniformly at
+        random across all groups.
+
+        >>> Sample().select("key", [2, 3])
+        [array([0, 1]), array([0, 1, 2])]
+        >>> sum(map(len, Sample(max_rows=3).select("key", [5, 5])))
+        3
+        """
+        rng = self.rng(key)
+        total = sum(sizes)
+        positions = (
+            np.arange(total)
+            if self.fraction == 1
+            else np.flatnonzero(rng.random(total) < self.fraction)
+        )
+
+        if self.max_rows is not None and len(positions) > self.max_rows:
+            positions = np.sort(rng.choice(positions, self.max_rows, replace=False))
+
+        bounds = np.cumsum([0, *sizes])
+        groups = np.split(positions, np.searchsorted(positions, bounds[1:-1]))
+
+        return [group - start for group, start in zip(groups, bounds)]
+
+
+def spread_order(points: np.ndarray) -> Iterator[int]:
+    """Yield the indices of points (rows of a 2-D array) in an order such that
+    every prefix of the order is spread evenly across the points.
+
+    Starting with the point nearest the center of the points, every next point
+    is the one farthest from all points already yielded (i.e., a greedy
+    farthest-point traversal), after scaling every dimension to the unit
+    interval (so that, e.g., degrees and seconds are comparable).
+
+    >>> list(spread_order(np.array([[0.0], [1.0], [2.0], [3.0], [4.0]])))
+    [2, 0, 4, 1, 3]
+    """
+    n = len(points)
+
+    if n == 0:
+        return
+
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    scaled = (points - lo) / np.where(hi > lo, hi - lo, 1)
+    i = int(np.argmin(((scaled - scaled.mean(axis=0)) ** 2).sum(axis=1)))
+    distances = np.full(n, np.inf)
+
+    for _ in range(n):
+        yield i
+        distances = np.minimum(distances, ((scaled - scaled[i]) ** 2).sum(axis=1))
+        distances[i] = -1  # Never yield the same point again
+        i = int(np.argmax(distances))
+
+
+def _granule_point(granule: Granule) -> List[float]:
+    """Return the (lon, lat, time) of a granule's footprint's centroid and its
+    beginning date/time (in seconds since the epoch, or NaN, if unknown).
+    """
+    centroid = granule_footprint(granule).centroid
+    range_ = granule["Granule"].get("Temporal", {}).get("RangeDateTime", {})
+    begin = range_.get("BeginningDateTime")
+
+    return [
+        centroid.x,
+        centroid.y,
+        parse_datetime(begin).timestamp() if begin else float("nan"),
+    ]
+
+
+def spread_granules(granules: Iterable[Granule]) -> Iterator[Granule]:
+    """Yield granules in an order such that every prefix of the order is spread
+    across the footprints and temporal ranges of the granules (see `spread_order`).
+    """
+    granules = list(granules)
+
+    if not granules:
+        return
+
+    points = np.array([_granule_point(granule) for granule in granules])
+    # Place granules with unknown times at the middle of the temporal range
+    times = points[:, 2]
+    times[np.isnan(times)] = 0 if np.isnan(times).all() else np.nanmean(times)
+
+    yield from (granules[i] for i in spread_order(points))
@@ -0,0 +1,208 @@
+"""Scheduling of tasks on a process pool, with speculative re-execution of stragglers.
+
+Mapping a function over many tasks with `Pool.imap_unordered` (particularly with
+a `chunksize` greater than 1) lets a single slow task (e.g., a slow download, or
+a pathological granule) hold up the end of a job, while every other worker sits
+idle.  `run_tasks` instead submits tasks one at a time, keeping at most one task
+per worker in flight, and tracks how long each task has been running.  Once no
+new tasks remain to be submitted, idle workers re-run (speculatively) any task
+that has been running much longer than is typical (see `Speculation`), and the
+result of whichever attempt of a task succeeds first is kept, while the results
+of all other attempts of the task are discarded.
+
+Since attempts of the same task may run concurrently, each attempt is given its
+own payload (e.g., with its own working directory), via `attempt_payload`.
+
+Functions:
+
+- run_tasks runs tasks on a pool, yielding their results as they complete
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import queue
+import time
+from dataclasses import dataclass
+from multiprocessing.pool import Pool
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, TypeVar
+
+from returns.io import IOFailure, IOResultE
+from returns.pipeline import is_successful
+from returns.unsafe import unsafe_perform_io
+
+_P = TypeVar("_P")
+_R = TypeVar("_R")
+
+logger = logging.getLogger(f"gedi_subset.{__name__}")
+
+
+@dataclass(frozen=True)
+class Speculation:
+    """Policy for speculatively re-running straggling tasks.
+
+    A task is a straggler once it has been running for more than `factor` times
+    the median duration of completed tasks, and for at least `min_seconds`.  No
+    task is a straggler until at least `min_samples` tasks have completed, and a
+    task is run at most `max_attempts` times (concurrently), including its first
+    attempt.  A `max_attempts` of 1 disables speculation.
+    """
+
+    factor: float = 3.0
+    min_seconds: float = 30.0
+    min_samples: int = 5
+    max_attempts: int = 2
+
+
+class _Durations:
+    """Sorted durations of completed tasks, for computing their median."""
+
+    def __init__(self) -> None:
+        self._values: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, value: float) -> None:
+        bisect.insort(self._values, value)
+
+    def median(self) -> float:
+        n = len(self._values)
+        return (self._values[(n - 1) // 2] + self._values[n // 2]) / 2
+
+
+def run_tasks(
+    pool: Pool,
+    processes: int,
+    func: Callable[[_P], IOResultE[_R]],
+    payloads: Iterable[_P],
+    attempt_payload: Callable[[_P, int], _P],
+    discard: Callable[[_R], None],
+    speculation: Speculation = Speculation(),
+    poll_interval: float = 1.0,
+    drain: bool = False,
+) -> Iterator[IOResultE[_R]]:
+    """Run `func` on a pool of `processes` workers for every payload, yielding the
+    result of every task as it completes (i.e., in no particular order).
+
+    The payload of every attempt of a task (including its first) is
+    `attempt_payload(payload, attempt)`, where `attempt` counts from 0.  When an
+    attempt succeeds after another attempt of the same task has already
+    succeeded, its result is passed to `discard` (e.g., to remove its output
+    files).  A task fails only once all of its attempts have failed, in which
+    case the failure of its last attempt is yielded.  Exceptions raised by `func`
+    (rather than returned as failures) are yielded as failures.
+
+    When `drain` is `True` (e.g., when the pool outlives the tasks, and so is not
+    terminated once they are done), wait for every attempt still running (or
+    queued) once all tasks are done, or once the generator is closed (e.g., upon
+    failure), passing the results of successful attempts to `discard`.  This
+    leaves the pool idle, with no attempts writing to working directories that
+    the caller removes.
+    """
+    results: queue.Queue = queue.Queue()
+    tasks = iter(payloads)
+    exhausted = False
+    payload_by_task: Dict[int, _P] = {}
+    attempts: Dict[int, int] = {}
+    running: Dict[Tuple[int, int], float] = {}
+    done: Set[int] = set()
+    durations = _Durations()
+    n_submitted = n_speculative = 0
+
+    def submit(task: int, attempt: int) -> None:
+        key = (task, attempt)
+        running[key] = time.monotonic()
+        attempts[task] = attempt + 1
+        pool.apply_async(
+            func,
+            (attempt_payload(payload_by_task[task], attempt),),
+            callback=lambda result: results.put((key, result)),
+            error_callback=lambda e: results.put((key, IOFailure(e))),
+        )
+
+    def stragglers() -> List[int]:
+        if len(durations) < speculation.min_samples:
+            return []
+
+        now = time.monotonic()
+        threshold = max(
+            speculation.factor * durations.median(), speculation.min_seconds
+        )
+        candidates = [
+            (now - started, task)
+            for (task, attempt), started in running.items()
+            if task not in done
+            and attempts[task] == attempt + 1  # Only the task's latest attempt
+            and attempts[task] < speculation.max_attempts
+            and now - started > threshold
+        ]
+
+        return [task for _, task in sorted(candidates, reverse=True)]
+
+    try:
+        while True:
+            while not exhausted and len(running) < processes:
+                if (payload := next(tasks, None)) is None:
+                    exhausted = True
+                else:
+                    payload_by_task[n_submitted] = payload
+                    submit(n_submitted, 0)
+                    n_submitted += 1
+
+            if exhausted:
+                for task in stragglers()[: processes - len(running)]:
+                    attempt = attempts[task]
+                    elapsed = time.monotonic() - running[(task, attempt - 1)]
+                    logger.info(
+                        f"Speculatively re-running task {task} (attempt {attempt + 1}),"
+                        f" running for {elapsed:.0f}s"
+                        f" (median task duration {durations.median():.1f}s)"
+                    )
+                    submit(task, attempt)
+                    n_speculative += 1
+
+            if exhausted and len(done) == n_submitted:
+                # Any attempts still running lost to other attempts of their tasks
+                # (and are either drained or left to the caller to terminate)
+                break
+
+            try:
+                (task, attempt), result = results.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+
+            elapsed = time.monotonic() - running.pop((task, attempt))
+            others_running = any(t == task for t, _ in running)
+
+            if task in done:
+                if is_successful(result):
+                    discard(unsafe_perform_io(result.unwrap()))
+                continue
+
+            if not is_successful(result) and others_running:
+                logger.warning(
+                    f"Attempt {attempt + 1} of task {task} failed;"
+                    " awaiting other attempts"
+                )
+                continue
+
+            done.add(task)
+            durations.add(elapsed)
+            del payload_by_task[task]
+
+            yield result
+    finally:
+        if drain and running:
+            logger.info(f"Waiting for {len(running)} outstanding attempt(s)")
+
+        while drain and running:
+            key, result = results.get()
+            del running[key]
+
+            if is_successful(result):
+                discard(unsafe_perform_io(result.unwrap()))
+
+    if n_speculative:
+        logger.info(f"Speculatively re-ran {n_speculative} of {n_submitted} task(s)")
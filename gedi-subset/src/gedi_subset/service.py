@@ -0,0 +1,436 @@
+"""Long-running service running subset jobs with warm resources.
+
+Every run of the subset CLI (`gedi_subset.subset.main`) pays for starting Python,
+importing heavy modules, constructing a MAAP client, finding the collection in
+CMR, starting worker processes, and obtaining S3 credentials (in every worker),
+before subsetting a single granule.  For small AOIs, these fixed costs dominate.
+
+A service instead pays them once, keeping the following warm across jobs:
+
+- the heavy modules (imported by the service, and preloaded by the forkserver)
+- a pool of worker processes (see `gedi_subset.subset.WarmResources`), along
+  with the S3 credentials, boto3 session, and thread pools of every worker (see
+  `gedi_subset.maapx` and `gedi_subset.readplan`)
+- a MAAP client caching the collections it finds (see `WarmMAAP`)
+- the pages of footprint indexes (see `gedi_subset.footprints`) in the OS page
+  cache, and their refreshes fetch only granules revised since the previous job
+
+Jobs are submitted to a local HTTP API (JSON), and queued, such that jobs run one
+at a time, every job on all of the workers.  A job is given as the arguments of
+the subset CLI, and runs exactly as the CLI would, except that the pool's
+number of processes (and start method) is that of the service.
+
+- `POST /jobs` with `{"args": [...], "cwd": "..."}` queues a job, where paths
+  within `args` are relative to `cwd` (responds with the job; see `Job`)
+- `GET /jobs/<id>` responds with a job (including its state and any error)
+- `GET /jobs` responds with all jobs (most recent last)
+- `GET /health` responds with the number of workers and of queued jobs
+
+Commands:
+
+- serve runs the service
+- submit submits a job to the service (by default, waiting for it to finish)
+
+Example (arguments after `--` are passed to the subset CLI):
+
+```plain
+python -m gedi_subset.service serve --port 8765 &
+python -m gedi_subset.service submit --url http://127.0.0.1:8765 -- \\
+    --aoi aoi.geojson --columns agbd --query "agbd > 0" -d output
+```
+"""
+
+from __future__ import annotations
+
+import contextlib
+import http.server
+import importlib
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+
+import typer
+from cachetools import TTLCache
+from maap.maap import MAAP
+
+from gedi_subset import subset
+from gedi_subset.subset import (
+    WarmResources,
+    init_process,
+    set_logging_level,
+    warm_resources,
+    worker_processes,
+)
+from gedi_subset.workers import PRELOAD_MODULES, StartMethod, get_context
+
+logger = logging.getLogger(f"gedi_subset.{__name__}")
+
+#: Default port of the service (on localhost).
+DEFAULT_PORT = 8765
+
+#: Seconds a `WarmMAAP` caches a collection it finds.
+COLLECTION_TTL = 60 * 60
+
+app = typer.Typer(add_completion=False)
+
+
+class WarmMAAP(MAAP):
+    """MAAP client caching the (non-empty) results of collection searches (e.g.,
+    by `gedi_subset.maapx.find_collection`) for `COLLECTION_TTL` seconds, since
+    collections rarely change.
+    """
+
+    def __init__(self, maap_host: str) -> None:
+        super().__init__(maap_host)
+        self._collections: TTLCache = TTLCache(maxsize=64, ttl=COLLECTION_TTL)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Workers never search for collections, so there's no need to send them
+        # the cache (with every task)
+        return {k: v for k, v in self.__dict__.items() if k != "_collections"}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(
+            state, _collections=TTLCache(maxsize=64, ttl=COLLECTION_TTL)
+        )
+
+    def searchCollection(self, **kwargs: Any) -> Any:
+        key = json.dumps(kwargs, sort_keys=True, default=str)
+
+        if (collections := self._collections.get(key)) is None:
+            collections = super().searchCollection(**kwargs)
+
+            if collections:
+                self._collections[key] = collections
+
+        return collections
+
+
+class JobState(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+@dataclass
+class Job:
+    """A subset job, given as the arguments of the subset CLI, where paths are
+    relative to `cwd`, along with its state (and timestamps, in seconds since the
+    epoch).
+    """
+
+    id: str
+    args: List[str]
+    cwd: Optional[str] = None
+    state: JobState = JobState.queued
+    error: Optional[str] = None
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+
+@contextlib.contextmanager
+def _chdir(path: Optional[str]) -> Iterator[None]:
+    cwd = os.getcwd()
+
+    try:
+        if path is not None:
+            os.chdir(path)
+
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+class SubsetService:
+    """Queue of subset jobs, run one at a time (see `run`) with warm resources."""
+
+    def __init__(
+        self,
+        resources: WarmResources,
+        logging_level: int = logging.INFO,
+        max_queued: int = 100,
+    ) -> None:
+        command_app = typer.Typer(add_completion=False)
+        command_app.command()(subset.main)
+        self.command = typer.main.get_command(command_app)
+        self.resources = resources
+        self.logging_level = logging_level
+        self.jobs: Dict[str, Job] = {}
+        self._ids = itertools.count(1)
+        self._queue: queue.Queue[Optional[Job]] = queue.Queue(max_queued)
+        self._lock = threading.Lock()
+
+    def submit(self, args: Sequence[str], cwd: Optional[str] = None) -> Job:
+        """Queue a job, raising `queue.Full` if too many jobs are queued."""
+        with self._lock:
+            job = Job(f"{next(self._ids)}", list(args), cwd)
+            self._queue.put_nowait(job)
+            self.jobs[job.id] = job
+
+        logger.info(f"Queued job {job.id}: {' '.join(job.args)}")
+
+        return job
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self) -> None:
+        """Stop running jobs (once the running job, if any, and the jobs queued
+        before stopping have finished).
+        """
+        self._queue.put(None)
+
+    def run(self) -> None:
+        """Run queued jobs, one at a time, until stopped (see `stop`)."""
+        while (job := self._queue.get()) is not None:
+            self.run_job(job)
+
+    def run_job(self, job: Job) -> None:
+        job.state, job.started = JobState.running, time.time()
+        logger.info(f"Running job {job.id}")
+        token = warm_resources.set(self.resources)
+
+        try:
+            with _chdir(job.cwd):
+                self.command.main(
+                    job.args, prog_name="gedi_subset.subset", standalone_mode=False
+                )
+        except Exception as e:
+            # Usage errors (click exceptions, such as typer.BadParameter) need no
+            # traceback
+            if (format_message := getattr(e, "format_message", None)) is None:
+                logger.exception(f"Job {job.id} failed")
+
+            job.state = JobState.failed
+            job.error = format_message() if format_message else str(e) or repr(e)
+        else:
+            job.state = JobState.succeeded
+        finally:
+            warm_resources.reset(token)
+            # Jobs may set the logging level of the whole process (via --verbose)
+            set_logging_level(self.logging_level)
+            job.finished = time.time()
+
+        logger.info(
+            f"Job {job.id} {job.state.value} in {job.finished - job.started:.1f}s"
+            + ("" if job.error is None else f": {job.error}")
+        )
+
+
+class _ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the API of a `SubsetService` (as JSON)."""
+
+    service: SubsetService
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(format % args)
+
+    def respond(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        path = urllib.parse.urlsplit(self.path).path.rstrip("/")
+        jobs = self.service.jobs
+
+        if path == "/health":
+            self.respond(
+                200,
+                dict(
+                    workers=self.service.resources.processes,
+                    queued=self.service.queued(),
+                ),
+            )
+        elif path == "/jobs":
+            self.respond(200, [asdict(job) for job in list(jobs.values())])
+        elif path.startswith("/jobs/") and (job := jobs.get(path[6:])) is not None:
+            self.respond(200, asdict(job))
+        else:
+            self.respond(404, dict(error=f"Not found: {path}"))
+
+    def do_POST(self) -> None:
+        if urllib.parse.urlsplit(self.path).path.rstrip("/") != "/jobs":
+            self.respond(404, dict(error=f"Not found: {self.path}"))
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            args, cwd = body["args"], body.get("cwd")
+
+            if not isinstance(args, list) or not all(isinstance(a, str) for a in args):
+                raise ValueError("args must be a list of strings")
+        except (KeyError, TypeError, ValueError) as e:
+            self.respond(400, dict(error=f"Invalid job: {e}"))
+            return
+
+        try:
+            job = self.service.submit(args, cwd)
+        except queue.Full:
+            self.respond(503, dict(error="Too many queued jobs"))
+            return
+
+        self.respond(202, asdict(job))
+
+
+def make_server(
+    service: SubsetService, host: str = "127.0.0.1", port: int = DEFAULT_PORT
+) -> http.server.ThreadingHTTPServer:
+    """Make a server of the API of a service (see `serve_forever`), listening on
+    `port` (any free port, when 0; see `server_port`).
+    """
+    handler = type("Handler", (_ServiceRequestHandler,), dict(service=service))
+
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+def request(
+    url: str, method: str = "GET", body: Optional[Mapping[str, Any]] = None
+) -> Any:
+    """Send a request to a service, returning the (JSON) body of its response, or
+    raising `ValueError` with the service's error upon an error response.
+    """
+    data = None if body is None else json.dumps(body).encode()
+    headers = {"Content-Type": "application/json"}
+    req = urllib.request.Request(url, data, headers, method=method)
+
+    try:
+        with urllib.request.urlopen(req) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.load(e).get("error", str(e))) from e
+
+
+def submit_job(
+    url: str,
+    args: Sequence[str],
+    cwd: Optional[str] = None,
+    wait: bool = True,
+    poll_interval: float = 0.5,
+) -> Mapping[str, Any]:
+    """Submit a job to the service at `url`, returning the job (as JSON), once it
+    has finished, when `wait` is `True`; otherwise, once it is queued.
+    """
+    job = request(f"{url}/jobs", "POST", dict(args=list(args), cwd=cwd))
+
+    while wait and job["state"] not in (JobState.succeeded, JobState.failed):
+        time.sleep(poll_interval)
+        job = request(f"{url}/jobs/{job['id']}")
+
+    return job
+
+
+def _import_heavy_modules() -> None:
+    for name in PRELOAD_MODULES:
+        if name != "__main__":
+            with contextlib.suppress(ImportError):
+                importlib.import_module(name)
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Address to listen on"),
+    port: int = typer.Option(DEFAULT_PORT, help="Port to listen on"),
+    decode_threads: int = typer.Option(
+        0,
+        help="Number of threads per worker process each job is expected to"
+        " decompress chunks on (see the subset CLI's --decode-threads), for sizing"
+        " the pool of worker processes",
+        min=0,
+    ),
+    start_method: Optional[StartMethod] = typer.Option(
+        None,
+        help="Start method of worker processes (default: forkserver, if supported"
+        " by the platform; otherwise spawn)",
+    ),
+    max_tasks_per_worker: Optional[int] = typer.Option(
+        None,
+        help="Number of granules a worker process subsets before it is replaced by"
+        " a new one (e.g., to bound memory leaks; default: never replaced)",
+        min=1,
+    ),
+    max_queued: int = typer.Option(100, help="Maximum number of queued jobs", min=1),
+    verbose: bool = typer.Option(False, help="Provide verbose output"),
+) -> None:
+    """Run a service running subset jobs (one at a time) with warm resources."""
+    logging_level = logging.DEBUG if verbose else logging.INFO
+    set_logging_level(logging_level)
+    _import_heavy_modules()
+
+    processes = worker_processes(decode_threads)
+    context = get_context(start_method)
+    maap = WarmMAAP("api.ops.maap-project.org")
+    logger.info(f"Starting {processes} {context.get_start_method()} worker processes")
+
+    with context.Pool(
+        processes, init_process, (logging_level,), max_tasks_per_worker
+    ) as pool:
+        service = SubsetService(
+            WarmResources(maap, pool, processes), logging_level, max_queued
+        )
+        runner = threading.Thread(target=service.run, name="runner", daemon=True)
+        runner.start()
+
+        with make_server(service, host, port) as server:
+            logger.info(f"Serving on http://{host}:{server.server_port}")
+
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                logger.info("Stopping")
+
+
+@app.command(context_settings=dict(ignore_unknown_options=True))
+def submit(
+    args: Optional[List[str]] = typer.Argument(
+        None, help="Arguments of the subset CLI (after --)"
+    ),
+    url: str = typer.Option(
+        f"http://127.0.0.1:{DEFAULT_PORT}", help="Base URL of the service"
+    ),
+    wait: bool = typer.Option(True, help="Wait for the job to finish"),
+    poll_interval: float = typer.Option(0.5, help="Seconds between polls of the job"),
+) -> None:
+    """Submit a subset job to a service, printing the job (as JSON), and exiting
+    with a non-zero status if the job failed.
+    """
+    args = list(args or [])
+
+    # The subset CLI's default output directory would otherwise be relative to
+    # the service's working directory, rather than to this one
+    if not any(
+        arg in ("-d", "--output-directory") or arg.startswith("--output-directory=")
+        for arg in args
+    ):
+        args += ["--output-directory", os.path.abspath("output")]
+
+    try:
+        job = submit_job(url, args, os.getcwd(), wait, poll_interval)
+    except (ValueError, urllib.error.URLError) as e:
+        typer.echo(f"Error submitting job to {url}: {e}", err=True)
+        raise typer.Exit(1)
+
+    typer.echo(json.dumps(job, indent=2))
+
+    if job["state"] == JobState.failed:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app(prog_name="python -m gedi_subset.service")
@@ -1,20 +1,32 @@
 #!/usr/bin/env -S python -W ignore::FutureWarning -W ignore::UserWarning
 
+from __future__ import annotations
+
 import logging
-import multiprocessing
 import os
 import os.path
-from dataclasses import dataclass
+import shutil
+import sqlite3
+from contextlib import ExitStack, closing, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
 from enum import Enum
 from pathlib import Path
-from typing import Any, Iterable, Sequence, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-import geopandas as gpd
-import h5py
 import typer
-from maap.maap import MAAP
-from maap.Result import Granule
-from returns.curry import partial
+from returns.curry import curry, partial
 from returns.functions import raise_exception, tap
 from returns.io import IOFailure, IOResult, IOResultE, IOSuccess, impure_safe
 from returns.iterables import Fold
@@ -23,17 +35,58 @@ from returns.pipeline import flow, is_successful, pipe
 from returns.pointfree import bind, bind_ioresult, lash, map_
 from returns.unsafe import unsafe_perform_io
 
-from gedi_subset import osx
+from gedi_subset import footprints, osx
+from gedi_subset.aggregate import Aggregation, Grid, merge_partials, summarize
+from gedi_subset.batch import AOIJob, read_jobs, union_aoi
+from gedi_subset.cover import DEFAULT_DEPTH, AOICover, cover_path, load_cover
 from gedi_subset.fp import always, filter, map
 from gedi_subset.gedi_utils import (
     chext,
-    gdf_read_parquet,
+    explode_array_columns,
     gdf_to_file,
-    gdf_to_parquet,
+    granule_footprint,
     granule_intersects,
+    split_columns,
     subset_hdf5,
 )
-from gedi_subset.maapx import download_granule, find_collection
+from gedi_subset.join import pair_granules
+from gedi_subset.lazy import lazy_import
+from gedi_subset.maapx import (
+    download_granule,
+    find_collection,
+    granule_from_metadata,
+)
+from gedi_subset.readplan import ReadPlanner
+from gedi_subset.sampling import Sample, spread_granules
+from gedi_subset.scheduler import Speculation, run_tasks
+from gedi_subset.temporal import (
+    Season,
+    TemporalFilter,
+    granule_overlaps,
+    parse_temporal,
+)
+from gedi_subset.transfer import (
+    count_rows,
+    read_subset,
+    shared_memory_dir,
+    write_subset,
+)
+from gedi_subset.workers import StartMethod, get_context
+
+if TYPE_CHECKING:
+    from multiprocessing.pool import Pool
+
+    import geopandas as gpd
+    import h5py
+    import pandas as pd
+    from maap.maap import MAAP
+    from maap.Result import Granule
+else:
+    # Heavy modules are imported upon first use (see gedi_subset.workers for how
+    # worker processes avoid paying for importing them again).
+    gpd = lazy_import("geopandas", ignore_warnings=True)
+    h5py = lazy_import("h5py")
+    pd = lazy_import("pandas")
 
 
 class CMRHost(str, Enum):
@@ -46,14 +99,36 @@ LOGGING_FORMAT = "%(asctime)s [%(processName)s:%(name)s] [%(levelname)s] %(messa
 logging.basicConfig(level=logging.INFO, format=LOGGING_FORMAT)
 logger = logging.getLogger("gedi_subset")
 
+#: Number of times to retry a transient failure to download a granule (waiting
+#: 1, 2, 4, ... seconds between retries).
+DOWNLOAD_RETRIES = 4
+
+
+@dataclass(frozen=True)
+class WarmResources:
+    """Resources kept warm across subset jobs by a long-running service (see
+    `gedi_subset.service`), rather than created (and discarded) by every job: a
+    MAAP client, and a pool of `processes` worker processes.
+    """
+
+    maap: MAAP
+    pool: Pool
+    processes: int
+
+
+#: Warm resources for running the subset job of the current context, if any (set
+#: by `gedi_subset.service` for every job it runs).
+warm_resources: ContextVar[Optional[WarmResources]] = ContextVar(
+    "warm_resources", default=None
+)
+
 
 @dataclass
 class SubsetGranuleProps:
     """Properties for calling `subset_granule` with a single argument.
 
-    Since `multiprocessing.Pool.imap_unordered` does not support supplying
-    multiple iterators (like `builtins.map` does) for producing muliple
-    arguments to the supplied function, we must package all "arguments" into a
+    Since tasks are run on a process pool with a single payload per task (see
+    `gedi_subset.scheduler.run_tasks`), we must package all "arguments" into a
     single argument.
     """
 
@@ -63,43 +138,169 @@ class SubsetGranuleProps:
     columns: Sequence[str]
     query: str
     output_dir: Path
+    temporal: Optional[TemporalFilter] = None
+    cover: Optional[AOICover] = None
+    aggregation: Optional[Aggregation] = None
+    sample: Optional[Sample] = None
+    joined: Tuple[Granule, ...] = ()
+    shm_dir: Optional[str] = None
+    decode_threads: int = 0
 
 
 @impure_safe
 def subset_granule(props: SubsetGranuleProps) -> Maybe[str]:
-    """Subset a granule to a GeoParquet file and return the output path.
+    """Subset a granule to an Arrow IPC file and return the output path.
 
     Download the specified granule (`props.granule`) obtained from a CMR search
-    to the specified directory (`props.output_dir`), subset it to a GeoParquet
-    file where it overlaps with the specified AOI (`props.aoi_gdf`), remove the
-    downloaded granule file, and return the path to the output file.
+    to the specified directory (`props.output_dir`), subset it where it overlaps
+    with the specified AOI (`props.aoi_gdf`), write the subset to an Arrow IPC
+    file for transfer to the parent process (within `props.shm_dir`, memory
+    permitting; see `gedi_subset.transfer`), remove the downloaded granule file,
+    and return the path to the output file.
 
-    Return `Nothing` if the subset is empty (in which case no GeoParquet file
-    was written), otherwise `Some[str]` indicating the output path of the
-    GeoParquet file.
-    """
+    Return `Nothing` if the subset is empty (in which case no file was written),
+    otherwise `Some[str]` indicating the output path of the Arrow IPC file.
 
-    io_result = download_granule(props.maap, str(props.output_dir), props.granule)
-    inpath = unsafe_perform_io(io_result.alt(raise_exception).unwrap())
+    When `props.aggregation` is specified, write the (much smaller) partial
+    aggregate of the subset (see `gedi_subset.aggregate`) to a Parquet file,
+    instead of the subset itself.
+
+    When `props.joined` specifies granules of other products paired with the
+    granule (see `gedi_subset.join`), download them as well, and join their
+    datasets with the granule's datasets by shot number (see `subset_hdf5`).
+
+    When `props.decode_threads` is positive, decompress the chunks of datasets on
+    that many threads (see `gedi_subset.readplan`).
+    """
+    inpath, *joined_paths = [
+        unsafe_perform_io(
+            download_granule(
+                props.maap, str(props.output_dir), granule, DOWNLOAD_RETRIES
+            )
+            .alt(raise_exception)
+            .unwrap()
+        )
+        for granule in (props.granule, *props.joined)
+    ]
+    planner = ReadPlanner(threads=props.decode_threads)
 
     logger.debug(f"Subsetting {inpath}")
 
-    with h5py.File(inpath) as hdf5:
-        gdf = subset_hdf5(hdf5, props.aoi_gdf, props.columns, props.query)
+    with ExitStack() as stack:
+        hdf5, *joined = [
+            stack.enter_context(h5py.File(path)) for path in (inpath, *joined_paths)
+        ]
+        gdf = subset_hdf5(
+            hdf5,
+            props.aoi_gdf,
+            props.columns,
+            props.query,
+            props.temporal,
+            cover=props.cover,
+            planner=planner,
+            sample=props.sample,
+            joined=joined,
+        )
 
-    osx.remove(inpath)
+    logger.debug(f"Read {inpath}: {planner.stats}")
+
+    for path in (inpath, *joined_paths):
+        osx.remove(path)
 
     if gdf.empty:
         logger.debug(f"Empty subset produced from {inpath}; not writing")
         return Nothing
 
-    outpath = chext(".gpq", inpath)
-    logger.debug(f"Writing subset to {outpath}")
-    gdf_to_parquet(outpath, gdf).alt(raise_exception)
+    if props.aggregation is not None:
+        outpath = chext(".agg.parquet", inpath)
+        logger.debug(f"Writing partial aggregate to {outpath}")
+        props.aggregation.partial(gdf).to_parquet(outpath, index=False)
+
+        return Some(outpath)
+
+    outpath = write_subset(gdf, chext(".arrow", inpath), props.shm_dir)
+    logger.debug(f"Wrote subset to {outpath}")
 
     return Some(outpath)
 
 
+@dataclass
+class SubsetGranuleBatchProps:
+    """Properties for calling `subset_granule_batch` with a single argument (see
+    `SubsetGranuleProps`).
+    """
+
+    granule: Granule
+    maap: MAAP
+    jobs: Sequence[AOIJob]
+    output_dir: Path
+    temporal: Optional[TemporalFilter] = None
+    sample: Optional[Sample] = None
+    shm_dir: Optional[str] = None
+    decode_threads: int = 0
+
+
+@impure_safe
+def subset_granule_batch(props: SubsetGranuleBatchProps) -> Tuple[Tuple[str, str], ...]:
+    """Subset a granule for every AOI job of a batch that the granule intersects.
+
+    Like `subset_granule`, but download and read the granule only once for all of
+    the jobs whose AOIs intersect the granule's footprint, writing a separate
+    Arrow IPC file for each job (named by suffixing the granule's name with the
+    name of the job).  The datasets read for selecting rows (coordinates, etc.)
+    are read only once for all of the jobs, and the chunks of other datasets are
+    cached (see `gedi_subset.readplan`) across jobs.
+
+    Return the (job name, output path) pairs of the non-empty subsets written,
+    which is empty if the granule intersects none of the jobs' AOIs, or if all
+    subsets are empty.
+    """
+    footprint = granule_footprint(props.granule)
+    jobs = [job for job in props.jobs if job.geometry.intersects(footprint)]
+
+    if not jobs:
+        return ()
+
+    io_result = download_granule(
+        props.maap, str(props.output_dir), props.granule, DOWNLOAD_RETRIES
+    )
+    inpath = unsafe_perform_io(io_result.alt(raise_exception).unwrap())
+    cache: Dict[str, Any] = {}
+    planner = ReadPlanner(threads=props.decode_threads)
+    outputs: List[Tuple[str, str]] = []
+
+    logger.debug(f"Subsetting {inpath} for {len(jobs)} AOI(s)")
+
+    with h5py.File(inpath) as hdf5:
+        for job in jobs:
+            gdf = subset_hdf5(
+                hdf5,
+                job.aoi_gdf,
+                job.columns,
+                job.query,
+                props.temporal,
+                cache,
+                job.cover,
+                planner,
+                props.sample,
+            )
+
+            if gdf.empty:
+                logger.debug(f"Empty subset produced from {inpath} for {job.name}")
+                continue
+
+            outpath = write_subset(
+                gdf, chext(f".{job.name}.arrow", inpath), props.shm_dir
+            )
+            logger.debug(f"Wrote subset to {outpath}")
+            outputs.append((job.name, outpath))
+
+    logger.debug(f"Read {inpath}: {planner.stats}")
+    osx.remove(inpath)
+
+    return tuple(outputs)
+
+
 def init_process(logging_level: int) -> None:
     set_logging_level(logging_level)
 
@@ -109,6 +310,79 @@ def set_logging_level(logging_level: int) -> None:
     logger.setLevel(logging_level)
 
 
+@curry
+def append_subset(dest: Path, columns: Sequence[str], src: str) -> IOResultE[str]:
+    """Append a subset transferred from a worker (see `gedi_subset.transfer`) to a
+    GeoPackage file, and remove the subset's file.
+    """
+    to_file_props = dict(index=False, mode="a", driver="GPKG")
+    logger.debug(f"Appending {src} to {dest}")
+
+    return flow(
+        impure_safe(read_subset)(src),
+        # GeoPackage does not support array-valued columns
+        map_(explode_array_columns(columns)),
+        bind_ioresult(partial(gdf_to_file, dest, to_file_props)),
+        tap(pipe(always(src), osx.remove)),
+        map_(always(src)),
+    )
+
+
+def worker_processes(decode_threads: int = 0) -> int:
+    """Return the number of worker processes for subsetting granules, such that
+    there is a process per CPU, or, when every process decompresses chunks on
+    `decode_threads` threads, a thread per CPU (with fewer processes).
+    """
+    return max((os.cpu_count() or 1) // max(decode_threads, 1), 1)
+
+
+def attempt_dir(output_dir: Path, attempt: int) -> Path:
+    """Return (creating, if necessary) the working directory of the given attempt
+    (counting from 0) of subsetting a granule (see `gedi_subset.scheduler`).
+
+    Each attempt of subsetting the same granule downloads it and writes its subset
+    to its own directory, so that speculative attempts do not interfere.
+    """
+    path = output_dir / f".attempt-{attempt}"
+    path.mkdir(parents=True, exist_ok=True)
+
+    return path
+
+
+def remove_attempt_dirs(output_dir: Path) -> None:
+    """Remove the working directories of attempts (see `attempt_dir`), along with
+    any files left behind by attempts that were abandoned.
+    """
+    for path in output_dir.glob(".attempt-*"):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@contextmanager
+def worker_pool(
+    processes: int,
+    start_method: Optional[StartMethod],
+    init_args: Tuple[Any, ...],
+) -> Iterator[Tuple[Pool, int]]:
+    """Provide a pool of worker processes, along with its number of processes.
+
+    When a service is running the current job (see `warm_resources`), provide the
+    service's (warm) pool, which remains running upon exit, so callers must drain
+    their tasks from it (see `gedi_subset.scheduler.run_tasks`).  Otherwise,
+    provide a new pool of `processes` workers, which is terminated (along with any
+    tasks still running) upon exit.
+    """
+    if (resources := warm_resources.get()) is not None:
+        logger.info(f"Subsetting on {resources.processes} warm processes")
+        yield resources.pool, resources.processes
+        return
+
+    context = get_context(start_method)
+    logger.info(f"Subsetting on {processes} {context.get_start_method()} processes")
+
+    with context.Pool(processes, init_process, init_args) as pool:
+        yield pool, processes
+
+
 def subset_granules(
     maap: MAAP,
     aoi_gdf: gpd.GeoDataFrame,
@@ -118,7 +392,70 @@ def subset_granules(
     dest: Path,
     init_args: Tuple[Any, ...],
     granules: Iterable[Granule],
+    temporal: Optional[TemporalFilter] = None,
+    start_method: Optional[StartMethod] = None,
+    cover: Optional[AOICover] = None,
+    aggregation: Optional[Aggregation] = None,
+    speculation: Speculation = Speculation(),
+    sample: Optional[Sample] = None,
+    joins: Sequence[Iterable[Granule]] = (),
+    decode_threads: int = 0,
 ) -> IOResultE[Tuple[str, ...]]:
+    """Subset granules in parallel, appending the subsets to `dest`.
+
+    Granules are subset one per worker at a time, and granules taking much longer
+    than is typical are speculatively subset again by idle workers, once there are
+    no other granules left to subset (see `gedi_subset.scheduler`).
+
+    When `sample` is specified, sample the shots of every granule (see
+    `gedi_subset.sampling`).  When the sample is limited to a maximum number of
+    rows, stop subsetting further granules once the subsets appended to `dest`
+    contain that many rows, and append only as many of the rows of the last
+    subset as are needed to reach the maximum (not supported with `aggregation`).
+
+    When `joins` specifies the granules of other collections (e.g., L2A and L2B,
+    when `granules` are L4A granules), pair every granule with the granules of the
+    same orbit and track of the other collections, and join their datasets by
+    shot number (see `gedi_subset.join`), so that `columns` and `query` may name
+    datasets of any of the collections.
+
+    When `aggregation` is specified, merge the partial aggregates of the subsets
+    as they are produced, and write the resulting statistics per grid cell to
+    `dest`, instead of the subsets themselves.
+
+    When `decode_threads` is positive, every worker decompresses chunks on that
+    many threads, with proportionally fewer workers (see `worker_processes`).
+    """
+    partials: List[pd.DataFrame] = []
+
+    def merge_partial(src: str) -> IOResultE[str]:
+        def merge(partial: pd.DataFrame) -> str:
+            partials.append(partial)
+
+            # Keep memory bounded by periodically merging the partial aggregates
+            if len(partials) >= 32:
+                partials[:] = [merge_partials(partials)]
+
+            return src
+
+        logger.debug(f"Merging partial aggregate {src}")
+
+        return flow(
+            impure_safe(pd.read_parquet)(src),
+            map_(merge),
+            tap(pipe(always(src), osx.remove)),
+        )
+
+    def write_grid(srcs: Tuple[str, ...]) -> IOResultE[Tuple[str, ...]]:
+        if aggregation is None or not srcs:
+            return IOSuccess(srcs)
+
+        to_file_props = dict(index=False, driver="GPKG")
+        grid_gdf = summarize(aggregation, merge_partials(partials))
+        logger.info(f"Writing statistics of {len(grid_gdf)} grid cell(s) to {dest}")
+
+        return gdf_to_file(dest, to_file_props, grid_gdf).map(always(srcs))
+
     def subset_saved(path: IOResultE[Maybe[str]]) -> bool:
         """Return `True` if `path`'s value is a `Some`, otherwise `False` if it
         is `Nothing`.  This indicates whether or not a subset file was written
@@ -126,41 +463,336 @@ def subset_granules(
         """
         return unsafe_perform_io(map_(is_successful)(path).unwrap())
 
-    def append_subset(src: str) -> IOResultE[str]:
-        to_file_props = dict(index=False, mode="a", driver="GPKG")
-        logger.debug(f"Appending {src} to {dest}")
+    max_rows = None if sample is None else sample.max_rows
+    rows_remaining = max_rows
 
-        return flow(
-            gdf_read_parquet(src),
-            bind_ioresult(partial(gdf_to_file, dest, to_file_props)),
-            tap(pipe(always(src), osx.remove)),
-            map_(always(src)),
+    def take_rows(src: str) -> Maybe[str]:
+        """Keep at most the number of rows remaining to reach `max_rows` (chosen at
+        random) of a subset, returning `Nothing` (after removing the subset) if no
+        rows remain.
+        """
+        nonlocal rows_remaining
+
+        if sample is None or rows_remaining is None:
+            return Some(src)
+
+        if rows_remaining == 0:
+            osx.remove(src)
+            return Nothing
+
+        if (n_rows := count_rows(src)) > rows_remaining:
+            logger.debug(f"Keeping {rows_remaining} of {n_rows} rows of {src}")
+            positions = sample.take(os.path.basename(src), n_rows, rows_remaining)
+            # Write a new file, rather than overwriting the (memory-mapped) subset
+            sampled = chext(".sample.arrow", src)
+            write_subset(read_subset(src).iloc[positions], sampled)
+            osx.remove(src)
+            src = sampled
+
+        rows_remaining -= min(n_rows, rows_remaining)
+
+        return Some(src)
+
+    def payloads() -> Iterable[SubsetGranuleProps]:
+        for granule, joined in pair_granules(granules, joins):
+            if rows_remaining == 0:
+                logger.info(f"Subset {max_rows} row(s); skipping remaining granules")
+                return
+
+            yield SubsetGranuleProps(
+                granule,
+                maap,
+                aoi_gdf,
+                columns,
+                query,
+                output_dir,
+                temporal,
+                cover,
+                aggregation,
+                # No granule needs more than the rows remaining to reach max_rows
+                None if sample is None else replace(sample, max_rows=rows_remaining),
+                joined,
+                shm_dir,
+                decode_threads,
+            )
+
+    processes = worker_processes(decode_threads)
+    shm_dir = shared_memory_dir()
+    sink = append_subset(dest, columns) if aggregation is None else merge_partial
+
+    def attempt_props(props: SubsetGranuleProps, attempt: int) -> SubsetGranuleProps:
+        return replace(props, output_dir=attempt_dir(output_dir, attempt))
+
+    def discard(path: Maybe[str]) -> None:
+        path.map(osx.remove)
+
+    try:
+        with worker_pool(processes, start_method, init_args) as (
+            pool,
+            processes,
+        ), closing(
+            run_tasks(
+                pool,
+                processes,
+                subset_granule,
+                payloads(),
+                attempt_props,
+                discard,
+                speculation,
+                # Leave a warm pool idle for the next job
+                drain=warm_resources.get() is not None,
+            )
+        ) as results:
+            return flow(
+                results,
+                map(lash(raise_exception)),  # Fail fast (if subsetting errored out)
+                map(map_(bind(take_rows))),  # Limit subsets to max_rows in total
+                filter(subset_saved),  # Skip granules that produced empty subsets
+                map(bind(bind(sink))),  # Append (or merge) non-empty subset
+                partial(Fold.collect, acc=IOSuccess(())),
+                bind(write_grid),
+            )
+    finally:
+        remove_attempt_dirs(output_dir)
+
+        if shm_dir is not None:
+            shutil.rmtree(shm_dir, ignore_errors=True)
+
+
+def subset_granules_batch(
+    maap: MAAP,
+    jobs: Sequence[AOIJob],
+    output_dir: Path,
+    init_args: Tuple[Any, ...],
+    granules: Iterable[Granule],
+    temporal: Optional[TemporalFilter] = None,
+    start_method: Optional[StartMethod] = None,
+    speculation: Speculation = Speculation(),
+    sample: Optional[Sample] = None,
+    decode_threads: int = 0,
+) -> IOResultE[Tuple[Tuple[str, str], ...]]:
+    """Subset granules for a batch of AOI jobs, reading each granule only once.
+
+    Append the subsets for each job to the GeoPackage file named by the job within
+    `output_dir` (e.g., `gabon.gpkg` for the job named `gabon`), and return the
+    (job name, subset path) pairs of the appended subsets.
+    """
+    columns_by_name = {job.name: job.columns for job in jobs}
+
+    def append_subsets(
+        subsets: Tuple[Tuple[str, str], ...]
+    ) -> IOResultE[Tuple[Tuple[str, str], ...]]:
+        return Fold.collect(
+            (
+                append_subset(
+                    output_dir / f"{name}.gpkg", columns_by_name[name], path
+                ).map(lambda path, name=name: (name, path))
+                for name, path in subsets
+            ),
+            IOSuccess(()),
         )
 
-    # https://docs.python.org/3/library/multiprocessing.html#multiprocessing.pool.Pool.imap
-    chunksize = 10
-    processes = os.cpu_count()
+    def attempt_props(
+        props: SubsetGranuleBatchProps, attempt: int
+    ) -> SubsetGranuleBatchProps:
+        return replace(props, output_dir=attempt_dir(output_dir, attempt))
+
+    def discard(subsets: Tuple[Tuple[str, str], ...]) -> None:
+        for _, path in subsets:
+            osx.remove(path)
+
+    processes = worker_processes(decode_threads)
+    shm_dir = shared_memory_dir()
     payloads = (
-        SubsetGranuleProps(granule, maap, aoi_gdf, columns, query, output_dir)
+        SubsetGranuleBatchProps(
+            granule, maap, jobs, output_dir, temporal, sample, shm_dir, decode_threads
+        )
         for granule in granules
     )
 
-    logger.info(f"Subsetting on {processes} processes (chunksize={chunksize})")
+    logger.info(f"Subsetting {len(jobs)} AOI(s)")
 
-    with multiprocessing.Pool(processes, init_process, init_args) as pool:
-        return flow(
-            pool.imap_unordered(subset_granule, payloads, chunksize),
-            map(lash(raise_exception)),  # Fail fast (if subsetting errored out)
-            filter(subset_saved),  # Skip granules that produced empty subsets
-            map(bind(bind(append_subset))),  # Append non-empty subset
-            partial(Fold.collect, acc=IOSuccess(())),
+    try:
+        with worker_pool(processes, start_method, init_args) as (
+            pool,
+            processes,
+        ), closing(
+            run_tasks(
+                pool,
+                processes,
+                subset_granule_batch,
+                payloads,
+                attempt_props,
+                discard,
+                speculation,
+                # Leave a warm pool idle for the next job
+                drain=warm_resources.get() is not None,
+            )
+        ) as results:
+            return flow(
+                results,
+                map(lash(raise_exception)),  # Fail fast (if subsetting errored out)
+                map(bind(append_subsets)),
+                partial(Fold.collect, acc=IOSuccess(())),
+                map_(
+                    lambda subsets: tuple(pair for pairs in subsets for pair in pairs)
+                ),
+            )
+    finally:
+        remove_attempt_dirs(output_dir)
+
+        if shm_dir is not None:
+            shutil.rmtree(shm_dir, ignore_errors=True)
+
+
+def search_granules(
+    maap: MAAP,
+    cmr_host: str,
+    doi: str,
+    aoi_gdf: gpd.GeoDataFrame,
+    limit: int,
+    temporal: Optional[TemporalFilter] = None,
+) -> IOResultE[Iterable[Granule]]:
+    """Search CMR for granules of a collection that intersect an AOI (and satisfy a
+    temporal filter, if specified).
+    """
+    temporal_params = {} if temporal is None else {"temporal": temporal.cmr_temporal}
+    granule_in_temporal = (
+        always(True) if temporal is None else granule_overlaps(temporal)
+    )
+
+    return IOResult.do(
+        flow(
+            granules,
+            filter(partial(granule_intersects, aoi_gdf.geometry[0])),
+            filter(granule_in_temporal),
+        )
+        for collection in find_collection(maap, cmr_host, {"doi": doi})
+        for granules in impure_safe(maap.searchGranule)(
+            cmr_host=cmr_host,
+            collection_concept_id=collection["concept-id"],
+            bounding_box=",".join(map(str)(aoi_gdf.total_bounds)),
+            limit=limit,
+            **temporal_params,
         )
+    )
+
+
+def search_footprint_index(
+    maap: MAAP,
+    cmr_host: str,
+    doi: str,
+    aoi_gdf: gpd.GeoDataFrame,
+    limit: int,
+    temporal: Optional[TemporalFilter],
+    index_path: Path,
+    refresh: bool,
+) -> IOResultE[Iterable[Granule]]:
+    """Search a local footprint index for granules of a collection that intersect an
+    AOI (and satisfy a temporal filter, if specified).
+
+    When `refresh` is `True`, first add the collection's granules revised in CMR
+    since the previous refresh to the index (all granules on the first refresh),
+    and fall back to searching CMR (see `search_granules`) if the index cannot be
+    refreshed.  Otherwise, do not access CMR at all, in which case the index must
+    already contain the collection.
+    """
+
+    def refreshed_concept_id(connection: sqlite3.Connection) -> IOResultE[str]:
+        return IOResult.do(
+            concept_id
+            for collection in find_collection(maap, cmr_host, {"doi": doi})
+            for concept_id in IOSuccess(collection["concept-id"])
+            for _ in footprints.refresh_index(
+                maap, connection, cmr_host, concept_id, doi
+            )
+        )
+
+    def query(connection: sqlite3.Connection, concept_id: str) -> Iterable[Granule]:
+        return [
+            granule_from_metadata(maap, metadata)
+            for metadata in footprints.query_granules(
+                connection, concept_id, aoi_gdf.geometry[0], temporal, limit
+            )
+        ]
+
+    def search_cmr(error: Exception) -> IOResultE[Iterable[Granule]]:
+        logger.warning(f"Searching CMR instead of the footprint index: {error}")
+        return search_granules(maap, cmr_host, doi, aoi_gdf, limit, temporal)
+
+    granules = IOResult.do(
+        query(connection, concept_id)
+        for connection in impure_safe(footprints.open_index)(index_path)
+        for concept_id in (
+            refreshed_concept_id(connection)
+            if refresh
+            else footprints.indexed_concept_id(connection, doi)
+        )
+    )
+
+    return granules.lash(search_cmr) if refresh else granules
+
+
+def subset_batch(
+    maap: MAAP,
+    jobs: Sequence[AOIJob],
+    output_dir: Path,
+    init_args: Tuple[Any, ...],
+    search: Callable[[gpd.GeoDataFrame], IOResultE[Iterable[Granule]]],
+    temporal: Optional[TemporalFilter] = None,
+    start_method: Optional[StartMethod] = None,
+    sample: Optional[Sample] = None,
+    decode_threads: int = 0,
+) -> None:
+    """Search for the granules intersecting any of the AOIs of a batch of jobs, and
+    subset them for every job, raising an exception upon failure.
+    """
+
+    def log_subsets(subsets: Tuple[Tuple[str, str], ...]) -> None:
+        for job in jobs:
+            count = sum(1 for name, _ in subsets if name == job.name)
+            logger.info(f"Subset {count} granule(s) to {output_dir / job.name}.gpkg")
+
+    IOResult.do(
+        subsets
+        for granules in search(union_aoi(jobs))
+        for subsets in subset_granules_batch(
+            maap,
+            jobs,
+            output_dir,
+            init_args,
+            granules,
+            temporal,
+            start_method,
+            sample=sample,
+            decode_threads=decode_threads,
+        )
+    ).bind_ioresult(
+        lambda subsets: IOSuccess(subsets)
+        if subsets
+        else IOFailure(ValueError("No granules intersect any of the AOIs"))
+    ).map(
+        log_subsets
+    ).alt(
+        raise_exception
+    )
+
+
+def check_fraction(value: float) -> float:
+    """Validate a fraction in the range (0, 1] (a typer callback, since typer
+    supports only closed ranges).
+    """
+    if not 0 < value <= 1:
+        raise typer.BadParameter(f"{value} is not in the range 0<x<=1.")
+
+    return value
 
 
 def main(
-    aoi: Path = typer.Option(
-        ...,
-        help="Area of Interest (path to GeoJSON file)",
+    aoi: Optional[Path] = typer.Option(
+        None,
+        help="Area of Interest (path to GeoJSON file); required unless --batch is"
+        " specified",
         exists=True,
         file_okay=True,
         dir_okay=False,
@@ -168,10 +800,29 @@ def main(
         readable=True,
         resolve_path=True,
     ),
+    batch: Optional[Path] = typer.Option(
+        None,
+        help="Batch of AOIs to subset at once, reading each granule only once (path"
+        " to a vector file with one AOI per feature, or to a JSON list of AOI jobs;"
+        " see gedi_subset.batch), writing one <name>.gpkg file per AOI",
+        exists=True,
+        file_okay=True,
+        dir_okay=False,
+        readable=True,
+        resolve_path=True,
+    ),
     doi=typer.Option(
         "10.3334/ORNLDAAC/2056",  # GEDI L4A DOI, v2.1
         help="Digital Object Identifier of collection to subset (https://www.doi.org/)",
     ),
+    join: Optional[str] = typer.Option(
+        None,
+        help="Comma-separated list of Digital Object Identifiers of other GEDI"
+        " collections (e.g., L2A and L2B) to join with the collection to subset by"
+        " shot number, pairing granules by orbit and track, such that columns and"
+        " the query may name datasets of any of the collections (not supported with"
+        " --batch)",
+    ),
     cmr_host: CMRHost = typer.Option(
         CMRHost.maap,
         help="CMR hostname",
@@ -187,7 +838,8 @@ def main(
                 "sensitivity_a2",
             ]
         ),
-        help="Comma-separated list of columns to select",
+        help="Comma-separated list of columns to select (a column for a 2-D dataset"
+        " may select indices of its second dimension, e.g., 'rh[50,98]')",
     ),
     query: str = typer.Option(
         "l2_quality_flag == 1"
@@ -200,6 +852,24 @@ def main(
         10_000,
         help="Maximum number of granules to subset",
     ),
+    temporal: Optional[str] = typer.Option(
+        None,
+        help="Temporal range of granules and shots to subset, as a comma-separated"
+        " pair of ISO 8601 dates or date/times, either of which may be empty for an"
+        " open-ended range (e.g., '2019-06-01,2021-06-01T12:00:00Z' or '2020-01-01,')",
+    ),
+    day_of_year: Optional[str] = typer.Option(
+        None,
+        help="Day-of-year window (inclusive) of granules and shots to subset, within"
+        " every year of the temporal range, as a comma-separated pair of days, where"
+        " the first day may be greater than the last to wrap around the end of the"
+        " year (e.g., '152,243' or '335,59')",
+    ),
+    season: Optional[Season] = typer.Option(
+        None,
+        help="Season of granules and shots to subset, within every year of the"
+        " temporal range (alternative to --day-of-year)",
+    ),
     output_dir: Path = typer.Option(
         f"{os.path.join(os.path.abspath(os.path.curdir), 'output')}",
         "-d",
@@ -212,41 +882,218 @@ def main(
         readable=True,
         resolve_path=True,
     ),
+    footprint_index: Optional[Path] = typer.Option(
+        None,
+        help="Path to a local granule footprint index (created, if necessary) to use"
+        " for finding granules, rather than searching CMR for every job",
+        dir_okay=False,
+        resolve_path=True,
+    ),
+    refresh_index: bool = typer.Option(
+        True,
+        help="Refresh the footprint index with granules revised in CMR since its"
+        " previous refresh (--no-refresh-index avoids accessing CMR at all)",
+    ),
+    start_method: Optional[StartMethod] = typer.Option(
+        None,
+        help="Start method of worker processes (default: forkserver, if supported"
+        " by the platform, which imports heavy modules only once for all workers;"
+        " otherwise spawn)",
+    ),
+    aggregate: Optional[str] = typer.Option(
+        None,
+        help="Comma-separated list of columns to aggregate into grid cells, writing"
+        " statistics per cell (count, mean, std, min, max, and quantiles) to"
+        " gedi_subset_grid.gpkg, instead of writing the selected shots (not"
+        " supported with --batch)",
+    ),
+    grid_crs: str = typer.Option(
+        Grid.crs,
+        help="CRS of the aggregation grid (default: EASE-Grid 2.0 global)",
+    ),
+    grid_resolution: float = typer.Option(
+        Grid.resolution,
+        help="Size of the cells of the aggregation grid, in units of the grid CRS",
+    ),
+    quantiles: str = typer.Option(
+        "0.5",
+        help="Comma-separated list of quantiles of aggregated columns to estimate,"
+        " each between 0 and 1 (estimates are within 1% of the true values)",
+    ),
+    aoi_cover_depth: int = typer.Option(
+        DEFAULT_DEPTH,
+        help="Depth of the quadtree cover of each AOI used for quickly testing"
+        " whether shots fall within the AOI (0 disables the cover).  A cover is"
+        " cached next to its AOI file (or batch file).",
+        min=0,
+        max=12,
+    ),
+    sample_fraction: float = typer.Option(
+        1.0,
+        help="Fraction of the shots selected from every granule to subset, sampled"
+        " at random (for a quick, exploratory subset), greater than 0 and at most 1",
+        callback=check_fraction,
+    ),
+    max_rows: Optional[int] = typer.Option(
+        None,
+        help="Maximum number of shots to subset, sampled at random across granules,"
+        " which are subset in an order spread across the AOI and the temporal range,"
+        " stopping once the maximum is reached (not supported with --batch or"
+        " --aggregate)",
+        min=1,
+    ),
+    sample_seed: int = typer.Option(
+        0,
+        help="Seed of the random sampling of shots (see --sample-fraction and"
+        " --max-rows)",
+    ),
+    decode_threads: int = typer.Option(
+        0,
+        help="Number of threads every worker process decompresses chunks of"
+        " datasets on (0 leaves decompression to HDF5, which decompresses serially),"
+        " with one worker process per that many CPUs, rather than one per CPU",
+        min=0,
+    ),
     verbose: bool = typer.Option(False, help="Provide verbose output"),
 ) -> None:
     logging_level = logging.DEBUG if verbose else logging.INFO
     set_logging_level(logging_level)
 
+    if (aoi is None) == (batch is None):
+        raise typer.BadParameter("Specify exactly one of --aoi or --batch")
+
+    if aggregate is not None and batch is not None:
+        raise typer.BadParameter("--aggregate is not supported with --batch")
+
+    if join is not None and batch is not None:
+        raise typer.BadParameter("--join is not supported with --batch")
+
+    if max_rows is not None and (aggregate is not None or batch is not None):
+        raise typer.BadParameter(
+            "--max-rows is not supported with --aggregate or --batch"
+        )
+
+    try:
+        temporal_filter = parse_temporal(temporal, day_of_year, season)
+        jobs = (
+            None if batch is None else read_jobs(batch, split_columns(columns), query)
+        )
+        aggregation = (
+            None
+            if aggregate is None
+            else Aggregation(
+                split_columns(aggregate),
+                Grid(grid_crs, grid_resolution),
+                tuple(map(float)(split_columns(quantiles))),
+            )
+        )
+        sample = (
+            None
+            if sample_fraction == 1 and max_rows is None
+            else Sample(sample_fraction, max_rows, sample_seed)
+        )
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    if aggregation is not None and not all(0 <= q <= 1 for q in aggregation.quantiles):
+        raise typer.BadParameter(f"Quantiles must be between 0 and 1: {quantiles}")
+
     os.makedirs(output_dir, exist_ok=True)
-    dest = output_dir / "gedi_subset.gpkg"
+    dest = output_dir / (
+        "gedi_subset.gpkg" if aggregation is None else "gedi_subset_grid.gpkg"
+    )
+    dests = [dest] if jobs is None else [output_dir / f"{j.name}.gpkg" for j in jobs]
 
-    # Remove existing combined subset file, primarily to support
+    # Remove existing combined subset files, primarily to support
     # testing.  When running in the context of a DPS job, there
-    # should be no existing file since every job uses a unique
+    # should be no existing files since every job uses a unique
     # output directory.
-    osx.remove(dest)
+    for path in dests:
+        osx.remove(path)
+
+    if (resources := warm_resources.get()) is not None:
+        maap = resources.maap
+    else:
+        from maap.maap import MAAP
+
+        maap = MAAP("api.ops.maap-project.org")
+
+    def find(aoi_gdf: gpd.GeoDataFrame, doi: str) -> IOResultE[Iterable[Granule]]:
+        return (
+            search_granules(maap, cmr_host, doi, aoi_gdf, limit, temporal_filter)
+            if footprint_index is None
+            else search_footprint_index(
+                maap,
+                cmr_host,
+                doi,
+                aoi_gdf,
+                limit,
+                temporal_filter,
+                footprint_index,
+                refresh_index,
+            )
+        )
+
+    def search(aoi_gdf: gpd.GeoDataFrame) -> IOResultE[Iterable[Granule]]:
+        granules = find(aoi_gdf, doi)
+
+        # When sampling, the first granules subset should be representative of all
+        # granules (particularly when stopping at a maximum number of rows)
+        return granules if sample is None else granules.map(spread_granules)
+
+    def search_joins(
+        aoi_gdf: gpd.GeoDataFrame,
+    ) -> IOResultE[Tuple[Iterable[Granule], ...]]:
+        join_dois = [] if join is None else split_columns(join)
+
+        return Fold.collect((find(aoi_gdf, d) for d in join_dois), IOSuccess(()))
 
-    maap = MAAP("api.ops.maap-project.org")
+    def aoi_cover(path: str, aoi_gdf: gpd.GeoDataFrame) -> Optional[AOICover]:
+        if aoi_cover_depth == 0:
+            return None
+
+        return load_cover(cover_path(path), aoi_gdf.unary_union, aoi_cover_depth)
+
+    if jobs is not None:
+        subset_batch(
+            maap,
+            [
+                replace(job, cover=aoi_cover(f"{batch}.{job.name}", job.aoi_gdf))
+                for job in jobs
+            ],
+            output_dir,
+            (logging_level,),
+            search,
+            temporal_filter,
+            start_method,
+            sample,
+            decode_threads,
+        )
+        return
 
     IOResult.do(
         subsets
         for aoi_gdf in impure_safe(gpd.read_file)(aoi)
-        for collection in find_collection(maap, cmr_host, {"doi": doi})
-        for granules in impure_safe(maap.searchGranule)(
-            cmr_host=cmr_host,
-            collection_concept_id=collection["concept-id"],
-            bounding_box=",".join(map(str)(aoi_gdf.total_bounds)),
-            limit=limit,
-        )
+        for cover in impure_safe(aoi_cover)(str(aoi), aoi_gdf)
+        for granules in search(aoi_gdf)
+        for joins in search_joins(aoi_gdf)
         for subsets in subset_granules(
             maap,
             aoi_gdf,
-            [c.strip() for c in columns.split(",")],
+            # Only the aggregated columns are needed when aggregating
+            split_columns(columns if aggregate is None else aggregate),
             query,
             output_dir,
             dest,
             (logging_level,),
-            filter(partial(granule_intersects, aoi_gdf.geometry[0]))(granules),
+            granules,
+            temporal_filter,
+            start_method,
+            cover,
+            aggregation,
+            sample=sample,
+            joins=joins,
+            decode_threads=decode_threads,
         )
     ).bind_ioresult(
         lambda subsets: IOSuccess(subsets)
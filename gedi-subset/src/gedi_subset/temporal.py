@@ -0,0 +1,274 @@
+"""Temporal filtering of granules (via CMR and locally) and of individual shots.
+
+A `TemporalFilter` combines an (optionally open-ended) date/time range with an
+optional day-of-year window, which may be used to select a season across all
+years of the range (e.g., only June through August of every year).
+
+Functions:
+
+- parse_temporal parses command-line values into a `TemporalFilter`
+- granule_overlaps determines whether a granule's time range satisfies a filter
+"""
+
+from __future__ import annotations
+
+import calendar
+import datetime as dt
+from dataclasses import dataclass
+from enum import Enum
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from returns.curry import curry
+
+from gedi_subset.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+    from maap.Result import Granule
+else:
+    np = lazy_import("numpy")
+
+#: Reference time of the GEDI `delta_time` datasets (seconds since this time).
+GEDI_EPOCH = dt.datetime(2018, 1, 1, tzinfo=dt.timezone.utc)
+
+
+class Season(str, Enum):
+    """Meteorological (northern hemisphere) seasons."""
+
+    djf = "DJF"
+    mam = "MAM"
+    jja = "JJA"
+    son = "SON"
+
+
+#: Day-of-year windows (inclusive) of each season, for non-leap years.  Locally,
+#: days of leap years are shifted back by a day after February 28 (see
+#: `TemporalFilter.leap_shift`), so that the windows follow month boundaries in
+#: every year; CMR periodic searches are extended by a day (see
+#: `TemporalFilter.cmr_temporal`) to cover the last day of the window in leap
+#: years.
+SEASON_DAYS = {
+    Season.djf: (335, 59),
+    Season.mam: (60, 151),
+    Season.jja: (152, 243),
+    Season.son: (244, 334),
+}
+
+
+def format_datetime(value: dt.datetime) -> str:
+    """Format a date/time as expected by CMR (UTC, to the second)."""
+    return value.astimezone(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_datetime(value: str) -> dt.datetime:
+    """Parse an ISO 8601 date/time, assuming UTC when no time zone is given."""
+    parsed = dt.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt.timezone.utc)
+
+
+def _datetime64(value: dt.datetime) -> np.datetime64:
+    return np.datetime64(value.astimezone(dt.timezone.utc).replace(tzinfo=None), "us")
+
+
+def _day_of_year(value: dt.datetime) -> int:
+    return value.timetuple().tm_yday
+
+
+@dataclass(frozen=True)
+class TemporalFilter:
+    """Date/time range with an optional (inclusive) day-of-year window.
+
+    When the first day of the window is greater than the last day, the window
+    wraps around the end of the year (e.g., `(335, 59)` for December through
+    February).
+
+    When `leap_shift` is `True` (e.g., for seasons), the window is given in days
+    of a non-leap year, and is applied locally to the days of leap years shifted
+    back by a day after February 28 (such that February 29 falls on day 59, along
+    with February 28), so that the window spans the same months in every year.
+    """
+
+    start: dt.datetime
+    end: dt.datetime
+    days: Optional[Tuple[int, int]] = None
+    leap_shift: bool = False
+
+    @property
+    def cmr_temporal(self) -> str:
+        """Value of the CMR `temporal` search parameter for this filter.
+
+        CMR supports periodic (day-of-year) temporal searches only for windows
+        that do not wrap around the end of the year, so a wrapping window is
+        omitted from the search (and is applied only locally).
+
+        When `leap_shift` is `True`, the last day of the window is extended by a
+        day, since CMR does not shift the days of leap years, so that the search
+        includes the last day of the window in leap years (e.g., August 31 is day
+        244 of 2020).  The extra day of non-leap years is trimmed locally.
+
+        >>> TemporalFilter(
+        ...     dt.datetime(2019, 1, 1, tzinfo=dt.timezone.utc),
+        ...     dt.datetime(2022, 1, 1, tzinfo=dt.timezone.utc),
+        ...     (152, 243),
+        ... ).cmr_temporal
+        '2019-01-01T00:00:00Z,2022-01-01T00:00:00Z,152,243'
+        >>> parse_temporal("2019-01-01,2022-01-01", season=Season.jja).cmr_temporal
+        '2019-01-01T00:00:00Z,2022-01-01T00:00:00Z,152,244'
+        """
+        range_ = f"{format_datetime(self.start)},{format_datetime(self.end)}"
+
+        if self.days is None or self.days[0] > self.days[1]:
+            return range_
+
+        first, last = self.days
+
+        if self.leap_shift:
+            last = min(last + 1, 366)
+
+        return f"{range_},{first},{last}"
+
+    def includes_day(
+        self, day: np.ndarray, leap: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Return a boolean mask of the days of the year within the window, where
+        `leap` indicates which days are of leap years (only when `leap_shift`).
+
+        >>> summer = parse_temporal(season=Season.jja)
+        >>> summer.includes_day(np.array([152, 243, 244]), np.array([True] * 3))
+        array([False,  True,  True])
+        """
+        if self.days is None:
+            return np.ones_like(day, dtype=bool)
+
+        if self.leap_shift and leap is not None:
+            day = np.where(leap & (day >= 60), day - 1, day)
+
+        first, last = self.days
+
+        if first <= last:
+            return (day >= first) & (day <= last)
+
+        return (day >= first) | (day <= last)
+
+    def overlaps(self, begin: dt.datetime, end: dt.datetime) -> bool:
+        """Return `True` if any time between `begin` and `end` satisfies this filter.
+
+        >>> utc = dt.timezone.utc
+        >>> summer = TemporalFilter(
+        ...     dt.datetime(2019, 1, 1, tzinfo=utc),
+        ...     dt.datetime(2022, 1, 1, tzinfo=utc),
+        ...     SEASON_DAYS[Season.jja],
+        ... )
+        >>> summer.overlaps(
+        ...     dt.datetime(2020, 7, 1, 2, tzinfo=utc),
+        ...     dt.datetime(2020, 7, 1, 3, tzinfo=utc),
+        ... )
+        True
+        >>> summer.overlaps(
+        ...     dt.datetime(2020, 1, 1, 2, tzinfo=utc),
+        ...     dt.datetime(2020, 1, 1, 3, tzinfo=utc),
+        ... )
+        False
+        """
+        begin, end = max(begin, self.start), min(end, self.end)
+
+        if begin > end:
+            return False
+
+        n_days = min((end.date() - begin.date()).days + 1, 366)
+        dates = [begin + dt.timedelta(days=n) for n in range(n_days)]
+        days = np.array([_day_of_year(date) for date in dates])
+        leap = np.array([calendar.isleap(date.year) for date in dates], dtype=bool)
+
+        return bool(self.includes_day(days, leap).any())
+
+    def mask(self, delta_time: np.ndarray) -> np.ndarray:
+        """Return a boolean mask of the GEDI shots satisfying this filter.
+
+        `delta_time` contains the time of each shot, in seconds since
+        `GEDI_EPOCH`, as given by the `delta_time` dataset of each beam.
+        """
+        offsets = (np.asarray(delta_time) * 1e6).astype("timedelta64[us]")
+        times = _datetime64(GEDI_EPOCH) + offsets
+        years = times.astype("datetime64[Y]")
+        days = times.astype("datetime64[D]") - years
+        year = years.astype(int) + 1970
+        leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+
+        return (
+            (times >= _datetime64(self.start))
+            & (times <= _datetime64(self.end))
+            & self.includes_day(days.astype(int) + 1, leap)
+        )
+
+
+def parse_temporal(
+    temporal: Optional[str] = None,
+    day_of_year: Optional[str] = None,
+    season: Optional[Season] = None,
+) -> Optional[TemporalFilter]:
+    """Parse command-line values into a `TemporalFilter`.
+
+    `temporal` is a comma-separated pair of ISO 8601 dates or date/times (either
+    of which may be empty, for an open-ended range), `day_of_year` is a
+    comma-separated pair of (inclusive) days of the year, and `season` is an
+    alternative to `day_of_year`.  Return `None` when all values are `None`.
+
+    Raise `ValueError` if a value is malformed, or if both `day_of_year` and
+    `season` are specified.
+
+    >>> parse_temporal("2019-06-01,2020-06-01T12:00:00Z", "152,243").cmr_temporal
+    '2019-06-01T00:00:00Z,2020-06-01T12:00:00Z,152,243'
+    >>> parse_temporal(season=Season.djf).days
+    (335, 59)
+    >>> parse_temporal() is None
+    True
+    """
+    if temporal is None and day_of_year is None and season is None:
+        return None
+
+    if day_of_year is not None and season is not None:
+        raise ValueError("Specify either a day-of-year window or a season, not both")
+
+    if temporal and "," not in temporal:
+        raise ValueError(f"Invalid temporal range: {temporal!r}")
+
+    start, end = (value.strip() for value in (temporal or ",").split(",", 1))
+
+    if day_of_year is not None:
+        first, last = (int(day) for day in day_of_year.split(","))
+
+        if not (1 <= first <= 366 and 1 <= last <= 366):
+            raise ValueError(f"Invalid day-of-year window: {day_of_year!r}")
+
+        days: Optional[Tuple[int, int]] = (first, last)
+    else:
+        days = SEASON_DAYS[season] if season is not None else None
+
+    return TemporalFilter(
+        parse_datetime(start) if start else GEDI_EPOCH,
+        parse_datetime(end) if end else dt.datetime.now(dt.timezone.utc),
+        days,
+        leap_shift=season is not None,
+    )
+
+
+@curry
+def granule_overlaps(temporal: TemporalFilter, granule: Granule) -> bool:
+    """Determines whether or not a granule's time range satisfies a temporal filter.
+
+    Returns `True` if the granule's range of date/times (from its temporal
+    metadata) overlaps the range of the filter, and includes at least one day
+    within the filter's day-of-year window (if any).  Returns `True` also when
+    the granule has no temporal metadata, so that such a granule is not skipped.
+    """
+    range_ = granule["Granule"].get("Temporal", {}).get("RangeDateTime", {})
+
+    if not (begin := range_.get("BeginningDateTime")):
+        return True
+
+    return temporal.overlaps(
+        parse_datetime(begin),
+        parse_datetime(range_.get("EndingDateTime") or begin),
+    )
@@ -0,0 +1,160 @@
+"""Transfer of subsets from worker processes to the parent process.
+
+Every worker hands its subset to the parent, which appends it to the output
+file.  Writing the subset as GeoParquet for the sake of crossing the process
+boundary costs Parquet encoding (and compression), a round trip through the
+disk, and decoding.  Instead, a worker writes its subset as an (uncompressed)
+Arrow IPC file, by preference within a shared memory directory (see
+`shared_memory_dir`), such that the parent memory-maps the file, and the subset
+never touches the disk.  Under memory pressure (i.e., when the shared memory
+filesystem or the available memory would be left with less than
+`MIN_FREE_MEMORY` bytes), the file is spilled to disk instead.
+
+Geometries are transferred as WKB, and the name of the geometry column and the
+CRS as schema metadata.
+
+Functions:
+
+- shared_memory_dir creates a directory for transferring subsets in shared memory
+- write_subset writes a subset for transfer, returning the path written
+- read_subset reads a transferred subset
+- count_rows returns the number of rows of a transferred subset
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import os.path
+import shutil
+import tempfile
+from typing import TYPE_CHECKING, Optional
+
+from gedi_subset.lazy import lazy_import
+from gedi_subset.osx import StrPath
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pandas as pd
+    import pyarrow as pa
+else:
+    gpd = lazy_import("geopandas", ignore_warnings=True)
+    pd = lazy_import("pandas")
+    pa = lazy_import("pyarrow")
+
+logger = logging.getLogger(f"gedi_subset.{__name__}")
+
+#: Directory of the POSIX shared memory filesystem (Linux only).
+SHARED_MEMORY_ROOT = "/dev/shm"
+
+#: Free memory (in bytes) to leave for everything else (e.g., the workers) when
+#: writing subsets to shared memory, below which subsets are spilled to disk.
+MIN_FREE_MEMORY = 1 << 30
+
+#: Schema metadata keys of the geometry column and CRS of a transferred subset.
+GEOMETRY_KEY = b"gedi_subset:geometry"
+CRS_KEY = b"gedi_subset:crs"
+
+
+def shared_memory_dir() -> Optional[str]:
+    """Create a (uniquely named) directory for transferring subsets within shared
+    memory, returning its path, or `None` if the platform has no shared memory
+    filesystem.  The caller is responsible for removing the directory.
+    """
+    if not os.path.isdir(SHARED_MEMORY_ROOT):
+        return None
+
+    return tempfile.mkdtemp(prefix="gedi_subset-", dir=SHARED_MEMORY_ROOT)
+
+
+def _available_memory() -> Optional[int]:
+    """Return the memory available (in bytes) for starting new applications
+    without swapping (`MemAvailable` in `/proc/meminfo`), if known.
+    """
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def _fits_in_memory(shm_dir: StrPath, nbytes: int) -> bool:
+    available = _available_memory()
+
+    return shutil.disk_usage(shm_dir).free - nbytes >= MIN_FREE_MEMORY and (
+        available is None or available - nbytes >= MIN_FREE_MEMORY
+    )
+
+
+def _to_arrow(gdf: gpd.GeoDataFrame) -> pa.Buffer:
+    geometry = gdf.geometry.name
+    df = pd.DataFrame(gdf).assign(**{geometry: gdf.geometry.to_wkb()})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    crs = "" if gdf.crs is None else gdf.crs.to_json()
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            GEOMETRY_KEY: geometry.encode(),
+            CRS_KEY: crs.encode(),
+        }
+    )
+    sink = pa.BufferOutputStream()
+
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue()
+
+
+def write_subset(
+    gdf: gpd.GeoDataFrame, path: StrPath, shm_dir: Optional[StrPath] = None
+) -> str:
+    """Write a subset for transfer to the parent process as an Arrow IPC file,
+    returning the path of the file.
+
+    When `shm_dir` is specified (see `shared_memory_dir`), and the subset fits
+    within shared memory without putting the system under memory pressure, write
+    the subset to a file within `shm_dir` (named by the basename of `path`,
+    prefixed by the process ID, since speculative attempts of subsetting the same
+    granule share `shm_dir`); otherwise (spill to disk, and) write the subset to
+    `path`.
+    """
+    buffer = _to_arrow(gdf)
+
+    if shm_dir is not None and _fits_in_memory(shm_dir, buffer.size):
+        path = os.path.join(shm_dir, f"{os.getpid()}-{os.path.basename(path)}")
+    elif shm_dir is not None:
+        logger.debug(f"Spilling {buffer.size} byte subset to {path}")
+
+    with open(path, "wb") as f:
+        f.write(buffer)
+
+    return str(path)
+
+
+def read_subset(path: StrPath) -> gpd.GeoDataFrame:
+    """Read a subset written by `write_subset`, memory-mapping its file."""
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        df = table.to_pandas()
+
+    metadata = table.schema.metadata
+    geometry = metadata[GEOMETRY_KEY].decode()
+    crs = metadata[CRS_KEY].decode() or None
+    df[geometry] = gpd.GeoSeries.from_wkb(df[geometry], crs=crs)
+
+    return gpd.GeoDataFrame(df, geometry=geometry, crs=crs)
+
+
+def count_rows(path: StrPath) -> int:
+    """Return the number of rows of a subset written by `write_subset`."""
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+
+        return sum(
+            reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+        )
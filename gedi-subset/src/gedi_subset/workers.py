@@ -0,0 +1,71 @@
+"""Creation of the process pools used for subsetting granules in parallel.
+
+The cost of starting a worker process depends upon the process start method:
+
+- `fork` (the default on Linux) copies the parent process, so workers start
+  with every module the parent has already imported, but forking a process
+  that has started threads (e.g., by `boto3`) is unsafe.
+- `spawn` (the default on macOS) starts a fresh interpreter for every worker,
+  so every worker pays the full cost of importing `geopandas`, `pandas`,
+  `h5py`, etc.
+- `forkserver` starts a single server process that imports the modules listed
+  in `PRELOAD_MODULES` once, and then forks each worker from the server, so
+  workers start "warm" without inheriting the parent's state.
+
+Functions:
+
+- get_context returns a multiprocessing context for a start method
+"""
+
+import multiprocessing
+from enum import Enum
+from multiprocessing.context import BaseContext
+from typing import Optional, Sequence
+
+
+class StartMethod(str, Enum):
+    fork = "fork"
+    forkserver = "forkserver"
+    spawn = "spawn"
+
+
+#: Modules imported by the forkserver process, and thus inherited by every worker
+#: forked from it.  `__main__` refers to the main module (e.g., `subset.py` when
+#: run as a script), which is otherwise imported by every worker.
+PRELOAD_MODULES: Sequence[str] = (
+    "__main__",
+    "numpy",
+    "pandas",
+    "geopandas",
+    "h5py",
+    "boto3",
+    "maap.maap",
+    "gedi_subset.gedi_utils",
+    "gedi_subset.maapx",
+)
+
+
+def default_start_method() -> StartMethod:
+    """Return `forkserver` if the platform supports it; otherwise `spawn`."""
+    methods = multiprocessing.get_all_start_methods()
+
+    return StartMethod.forkserver if "forkserver" in methods else StartMethod.spawn
+
+
+def get_context(
+    start_method: Optional[StartMethod] = None,
+    preload: Sequence[str] = PRELOAD_MODULES,
+) -> BaseContext:
+    """Return a multiprocessing context for creating worker processes.
+
+    When `start_method` is `None`, use the `default_start_method()`.  When the
+    start method is `forkserver`, the forkserver process imports the `preload`
+    modules (ignoring any that cannot be imported) before forking any workers.
+    """
+    method = start_method or default_start_method()
+    context = multiprocessing.get_context(method.value)
+
+    if method is StartMethod.forkserver:
+        context.set_forkserver_preload(list(preload))
+
+    return context
@@ -4,6 +4,7 @@ from typing import Iterable
 
 import boto3
 import h5py
+import numpy as np
 import pytest
 from maap.AWS import AWS
 from maap.maap import MAAP
@@ -78,12 +79,15 @@ def h5_path(tmp_path_factory: pytest.TempPathFactory) -> str:
     with h5py.File(path, "w") as h5_file:
         beam = h5_file.create_group("BEAM0000")
         beam.create_dataset("agbd", data=[1.271942, 1.3311168, 1.1160929], dtype="f4")
+        # 2019-07-01, 2019-07-01, 2020-01-15 (seconds since 2018-01-01)
+        beam.create_dataset("delta_time", data=[47174400.5, 47174401.5, 64281600.5])
         beam.create_dataset("agbd_se", data=[3.057197, 3.053778, 3.06673], dtype="f4")
         beam.create_dataset("l2_quality_flag", data=[0, 1, 1], dtype="i1")
         beam.create_dataset("l4_quality_flag", data=[1, 0, 1], dtype="i1")
         beam.create_dataset("lat_lowestmode", data=[-1.82556, -9.82514, -1.82471])
         beam.create_dataset("lon_lowestmode", data=[12.06648, 12.06678, 12.06707])
         beam.create_dataset("sensitivity", data=[0.9, 0.97, 0.99], dtype="f4")
+        beam.create_dataset("rh", data=np.linspace(0.0, 30.0, 303).reshape(3, 101))
         land_cover = beam.create_group("land_cover_data")
         land_cover.create_dataset("landsat_treecover", data=[77.0, 98.0, 95.0])
         land_cover.create_dataset(
@@ -92,12 +96,14 @@ def h5_path(tmp_path_factory: pytest.TempPathFactory) -> str:
 
         beam = h5_file.create_group("BEAM0001")
         beam.create_dataset("agbd", data=[1.1715966, 1.630395, 3.5265787], dtype="f4")
+        beam.create_dataset("delta_time", data=[47174400.6, 47174401.6, 64281600.6])
         beam.create_dataset("agbd_se", data=[3.063243, 3.037882, 2.9968245], dtype="f4")
         beam.create_dataset("l2_quality_flag", data=[0, 1, 1], dtype="i1")
         beam.create_dataset("l4_quality_flag", data=[1, 0, 1], dtype="i1")
         beam.create_dataset("lat_lowestmode", data=[-1.82556, -9.82514, -1.82471])
         beam.create_dataset("lon_lowestmode", data=[12.06648, 12.06678, 12.06707])
         beam.create_dataset("sensitivity", data=[0.93, 0.96, 0.98], dtype="f4")
+        beam.create_dataset("rh", data=np.linspace(1.0, 31.0, 303).reshape(3, 101))
         land_cover = beam.create_group("land_cover_data")
         land_cover.create_dataset("landsat_treecover", data=[68.0, 85.0, 83.0])
         land_cover.create_dataset(
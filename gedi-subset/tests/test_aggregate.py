@@ -0,0 +1,91 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from gedi_subset.aggregate import (
+    Aggregation,
+    Grid,
+    merge_partials,
+    quantile_name,
+    summarize,
+)
+
+
+@pytest.fixture(scope="module")
+def points() -> gpd.GeoDataFrame:
+    rng = np.random.default_rng(0)
+    n = 20_000
+
+    return gpd.GeoDataFrame(
+        {
+            "agbd": rng.lognormal(3, 1, n),
+            "elev": rng.normal(0, 100, n),
+        },
+        geometry=gpd.points_from_xy(rng.uniform(0, 2, n), rng.uniform(0, 1, n)),
+        crs="EPSG:4326",
+    )
+
+
+def test_merged_partials_match_direct_statistics(points: gpd.GeoDataFrame) -> None:
+    # 1-degree cells, so the points fall into exactly 2 cells
+    aggregation = Aggregation(
+        ["agbd", "elev"], Grid("EPSG:4326", 1.0), quantiles=(0.1, 0.5, 0.9)
+    )
+    # Partial aggregates of arbitrary pieces merge into the same statistics
+    shuffled = points.sample(frac=1, random_state=1)
+    pieces = [shuffled.iloc[i : i + 3000] for i in range(0, len(shuffled), 3000)]
+    grid = summarize(aggregation, merge_partials(map(aggregation.partial, pieces)))
+    west = points[points.geometry.x < 1]
+
+    assert grid[["row", "col"]].values.tolist() == [[0, 0], [0, 1]]
+    assert grid.loc[0, "agbd_count"] == len(west)
+    assert grid.loc[0, "agbd_mean"] == pytest.approx(west.agbd.mean())
+    assert grid.loc[0, "elev_std"] == pytest.approx(west.elev.std())
+    assert grid.loc[0, "elev_min"] == west.elev.min()
+
+    for column in ["agbd", "elev"]:
+        for q in [0.1, 0.5, 0.9]:
+            expected = np.quantile(west[column], q)
+            actual = grid.loc[0, f"{column}_{quantile_name(q)}"]
+            assert actual == pytest.approx(expected, rel=0.02, abs=1)
+
+
+def test_summarize_many_cells(points: gpd.GeoDataFrame) -> None:
+    # 0.25-degree cells, so the points fall into 32 cells, of varying counts
+    aggregation = Aggregation(["agbd"], Grid("EPSG:4326", 0.25), quantiles=(0, 0.75))
+    grid = summarize(aggregation, aggregation.partial(points))
+    x, y = points.geometry.x, points.geometry.y
+    cells = points.groupby([np.floor(y / 0.25), np.floor(x / 0.25)]).agbd
+
+    assert len(grid) == 32
+    np.testing.assert_array_equal(grid.agbd_count, cells.count())
+    np.testing.assert_allclose(grid.agbd_q00, cells.min())
+    np.testing.assert_allclose(grid.agbd_q75, cells.quantile(0.75), rtol=0.02)
+    np.testing.assert_allclose(
+        grid.geometry.bounds, np.c_[grid.col, grid.row, grid.col + 1, grid.row + 1] / 4
+    )
+
+
+def test_aggregation_distinct_quantiles() -> None:
+    assert Aggregation(["agbd"], quantiles=(0.5, 0.501)).quantiles == (0.5, 0.501)
+
+    with pytest.raises(ValueError, match="distinct"):
+        Aggregation(["agbd"], quantiles=(0.5, 0.5))
+
+
+def test_partial_skips_missing_values() -> None:
+    aggregation = Aggregation(["agbd"], Grid("EPSG:4326", 1.0))
+    gdf = gpd.GeoDataFrame(
+        {"agbd": [1.0, np.nan, 0.0]},
+        geometry=gpd.points_from_xy([0.5, 0.5, 0.5], [0.5, 0.5, 0.5]),
+        crs="EPSG:4326",
+    )
+    grid = summarize(aggregation, aggregation.partial(gdf))
+
+    assert grid.loc[0, "agbd_count"] == 2
+    assert grid.loc[0, "agbd_q50"] == pytest.approx(0.5, abs=0.5)
+
+
+def test_merge_partials_empty() -> None:
+    assert merge_partials([pd.DataFrame()]).empty
@@ -0,0 +1,80 @@
+import json
+import pathlib
+
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from gedi_subset.batch import read_jobs, union_aoi
+
+
+def write_features(path: pathlib.Path, features) -> pathlib.Path:
+    gpd.GeoDataFrame.from_features(features, crs="EPSG:4326").to_file(
+        path, driver="GeoJSON"
+    )
+    return path
+
+
+def feature(geometry, **properties):
+    return {"type": "Feature", "properties": properties, "geometry": geometry}
+
+
+def test_read_jobs_from_features(tmp_path: pathlib.Path) -> None:
+    path = write_features(
+        tmp_path / "aois.geojson",
+        [
+            feature(box(0, 0, 1, 1).__geo_interface__, name="west", query="agbd > 1"),
+            feature(box(1, 0, 2, 1).__geo_interface__, columns="agbd,rh[50,98]"),
+        ],
+    )
+
+    west, east = read_jobs(path, ["agbd"], "l2_quality_flag == 1")
+
+    assert (west.name, west.columns, west.query) == ("west", ["agbd"], "agbd > 1")
+    assert (east.name, east.columns) == ("aoi_1", ["agbd", "rh[50,98]"])
+    assert east.query == "l2_quality_flag == 1"
+    assert east.geometry.equals(box(1, 0, 2, 1))
+
+
+def test_read_jobs_from_spec(tmp_path: pathlib.Path) -> None:
+    write_features(tmp_path / "gabon.geojson", [feature(box(9, -3, 13, 1))])
+    write_features(tmp_path / "peru.geojson", [feature(box(-76, -10, -72, -6))])
+    path = tmp_path / "batch.json"
+    path.write_text(
+        json.dumps([{"aoi": "gabon.geojson"}, {"aoi": "peru.geojson", "name": "pe"}])
+    )
+
+    gabon, peru = read_jobs(path, ["agbd"], "agbd > 0")
+
+    assert (gabon.name, peru.name) == ("gabon", "pe")
+    assert union_aoi([gabon, peru]).total_bounds.tolist() == [-76, -10, 13, 1]
+
+
+@pytest.mark.parametrize(
+    "specs, message",
+    [
+        ([], "No AOI jobs"),
+        ([{"aoi": "a.geojson"}, {"aoi": "a.geojson"}], "Duplicate AOI job names: a"),
+        ([{"aoi": "a.geojson", "name": "../a"}], "Invalid AOI job name"),
+        ([{"aoi": "a.geojson"}, {"name": "b"}], "AOI job 1: missing 'aoi'"),
+        (["a.geojson"], "AOI job 0: expected an object"),
+        ([{"aoi": "a.geojson", "name": 1}], "AOI job 0: invalid 'name'"),
+        ([{"aoi": "missing.geojson"}], "AOI job 0: AOI file not found"),
+        ([{"aoi": "batch.json"}], "AOI job 0: cannot read"),
+    ],
+)
+def test_read_jobs_invalid(tmp_path: pathlib.Path, specs, message) -> None:
+    write_features(tmp_path / "a.geojson", [feature(box(0, 0, 1, 1))])
+    path = tmp_path / "batch.json"
+    path.write_text(json.dumps(specs))
+
+    with pytest.raises(ValueError, match=message):
+        read_jobs(path, ["agbd"], "agbd > 0")
+
+
+def test_read_jobs_unreadable(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "batch.geojson"
+    path.write_text("not a vector file")
+
+    with pytest.raises(ValueError, match="Cannot read batch file"):
+        read_jobs(path, ["agbd"], "agbd > 0")
@@ -0,0 +1,43 @@
+import os
+import pathlib
+
+import numpy as np
+import pytest
+from shapely.geometry import MultiPoint, Point
+
+from gedi_subset.cover import CellState, build_cover, cover_path, load_cover
+
+
+@pytest.fixture(scope="module")
+def geometry():
+    # A polygon with many vertices, along with a hole
+    return Point(0, 0).buffer(10, 256).difference(Point(3, 3).buffer(2, 64))
+
+
+def test_cover_intersects_matches_exact_test(geometry) -> None:
+    cover = build_cover(geometry, depth=6)
+    rng = np.random.default_rng(42)
+    x, y = rng.uniform(-12, 12, (2, 10_000))
+    expected = np.array([geometry.intersects(p) for p in MultiPoint(np.c_[x, y]).geoms])
+
+    assert np.array_equal(cover.intersects(geometry, x, y), expected)
+    # Only a small fraction of points should require an exact test
+    assert (cover.cell_states(x, y) == CellState.BOUNDARY).mean() < 0.2
+
+
+def test_load_cover_caches(tmp_path: pathlib.Path, geometry) -> None:
+    path = cover_path(tmp_path / "aoi.geojson")
+    cover = load_cover(path, geometry, depth=4)
+    mtime = os.stat(path).st_mtime_ns
+
+    cached = load_cover(path, geometry, depth=4)
+
+    assert os.stat(path).st_mtime_ns == mtime
+    assert cached.bounds == cover.bounds
+    assert np.array_equal(cached.cells, cover.cells)
+
+    # A different geometry (or depth) replaces the cached cover
+    other = load_cover(path, geometry.buffer(1), depth=4)
+
+    assert other.bounds != cover.bounds
+    assert load_cover(path, geometry, depth=5).cells.shape == (32, 32)
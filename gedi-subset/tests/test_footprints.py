@@ -0,0 +1,214 @@
+import datetime as dt
+import pathlib
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+import pytest
+from maap.maap import MAAP
+from returns.io import IOSuccess
+from returns.pipeline import is_successful
+from returns.unsafe import unsafe_perform_io
+from shapely.geometry import box
+
+from gedi_subset import footprints
+from gedi_subset.temporal import parse_datetime, parse_temporal
+
+
+def make_metadata(
+    granule_ur: str,
+    bounds: Tuple[float, float, float, float],
+    begin: str,
+    last_update: str = "2022-01-01T00:00:00.000Z",
+) -> Mapping[str, Any]:
+    min_x, min_y, max_x, max_y = bounds
+    points = [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]
+
+    return {
+        "Granule": {
+            "GranuleUR": granule_ur,
+            "LastUpdate": last_update,
+            "Temporal": {
+                "RangeDateTime": {
+                    "BeginningDateTime": begin,
+                    "EndingDateTime": begin.replace("T00", "T01"),
+                }
+            },
+            "Spatial": {
+                "HorizontalSpatialDomain": {
+                    "Geometry": {
+                        "GPolygon": {
+                            "Boundary": {
+                                "Point": [
+                                    {"PointLongitude": str(x), "PointLatitude": str(y)}
+                                    for x, y in points
+                                ]
+                            }
+                        }
+                    }
+                }
+            },
+            "DataGranule": {"SizeMBDataGranule": "123.4"},
+            "OnlineAccessURLs": {
+                "OnlineAccessURL": {"URL": f"s3://bucket/{granule_ur}.h5"}
+            },
+        }
+    }
+
+
+GRANULES = [
+    make_metadata("gabon-2019", (9.0, -2.0, 13.0, 1.0), "2019-07-01T00:00:00.000Z"),
+    make_metadata("gabon-2020", (8.0, -3.0, 12.0, 0.0), "2020-01-15T00:00:00.000Z"),
+    make_metadata("peru-2019", (-76.0, -10.0, -72.0, -6.0), "2019-07-02T00:00:00.000Z"),
+]
+
+
+def granule_urs(granules: Sequence[Mapping[str, Any]]) -> List[str]:
+    return [granule["Granule"]["GranuleUR"] for granule in granules]
+
+
+def test_query_granules(tmp_path: pathlib.Path) -> None:
+    connection = footprints.open_index(tmp_path / "index.db")
+
+    assert footprints.upsert_granules(connection, "C1", GRANULES) == 3
+
+    aoi = box(10.0, -1.0, 11.0, 0.5)
+    jja = parse_temporal(day_of_year="152,243")
+
+    assert granule_urs(footprints.query_granules(connection, "C1", aoi)) == [
+        "gabon-2019",
+        "gabon-2020",
+    ]
+    assert granule_urs(footprints.query_granules(connection, "C1", aoi, jja)) == [
+        "gabon-2019"
+    ]
+    assert granule_urs(footprints.query_granules(connection, "C1", aoi, limit=1)) == [
+        "gabon-2019"
+    ]
+    assert footprints.query_granules(connection, "C2", aoi) == []
+    assert footprints.query_granules(connection, "C1", box(0, 0, 1, 1)) == []
+
+
+def test_upsert_granules_replaces(tmp_path: pathlib.Path) -> None:
+    connection = footprints.open_index(tmp_path / "index.db")
+    footprints.upsert_granules(connection, "C1", GRANULES)
+
+    # Same granule, but with a new footprint that no longer intersects the AOI
+    moved = make_metadata("gabon-2019", (20.0, 5.0, 21.0, 6.0), "2019-07-01T00:00:00Z")
+    footprints.upsert_granules(connection, "C1", [moved])
+
+    ((count,),) = connection.execute("SELECT count(*) FROM granules")
+    granules = footprints.query_granules(connection, "C1", box(10, -1, 11, 0.5))
+
+    assert count == 3
+    assert granule_urs(granules) == ["gabon-2020"]
+
+
+def test_refresh_index_incremental(
+    maap: MAAP,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    searches: List[Dict[str, Any]] = []
+
+    def search_granule(**kwargs: Any) -> Sequence[Mapping[str, Any]]:
+        searches.append(kwargs)
+        return GRANULES if len(searches) == 1 else GRANULES[:1]
+
+    monkeypatch.setattr(maap, "searchGranule", search_granule, raising=False)
+    connection = footprints.open_index(tmp_path / "index.db")
+
+    first = footprints.refresh_index(maap, connection, "cmr", "C1", doi="10.1/x")
+    second = footprints.refresh_index(maap, connection, "cmr", "C1", doi="10.1/x")
+
+    assert first == IOSuccess(3)
+    assert second == IOSuccess(1)
+    assert "revision_date" not in searches[0]
+    assert searches[1]["revision_date"].endswith("Z,")
+    assert footprints.indexed_concept_id(connection, "10.1/x") == IOSuccess("C1")
+
+
+def fake_search_granule(
+    granules: Sequence[Mapping[str, Any]], searches: List[Dict[str, Any]]
+) -> Callable[..., Sequence[Mapping[str, Any]]]:
+    """Return a fake `searchGranule`, filtering and sorting by revision date."""
+
+    def revision(granule: Mapping[str, Any]) -> dt.datetime:
+        return parse_datetime(granule["Granule"]["LastUpdate"])
+
+    def search_granule(**kwargs: Any) -> Sequence[Mapping[str, Any]]:
+        searches.append(kwargs)
+        since = kwargs.get("revision_date", "2000-01-01,").split(",")[0]
+        revised = sorted(
+            (g for g in granules if revision(g) >= parse_datetime(since)),
+            key=revision,
+        )
+
+        return revised[: kwargs["limit"]]
+
+    return search_granule
+
+
+def test_refresh_index_pages(
+    maap: MAAP,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    searches: List[Dict[str, Any]] = []
+    granules = [
+        make_metadata(f"g{day}", (0, 0, 1, 1), "2019-07-01T00:00:00.000Z", revision)
+        for day in range(1, 4)
+        for revision in [f"2022-01-0{day}T00:00:00Z"]
+    ]
+    search_granule = fake_search_granule(granules, searches)
+    monkeypatch.setattr(maap, "searchGranule", search_granule, raising=False)
+    connection = footprints.open_index(tmp_path / "index.db")
+
+    result = footprints.refresh_index(maap, connection, "cmr", "C1", limit=2)
+    ((count,),) = connection.execute("SELECT count(*) FROM granules")
+
+    # Every search is truncated at the limit, until the last, so the index catches
+    # up with all granules in a single refresh
+    assert result == IOSuccess(5)
+    assert count == 3
+    assert all(search["sort_key"] == "revision_date" for search in searches)
+    assert [search.get("revision_date") for search in searches] == [
+        None,
+        "2022-01-02T00:00:00Z,",
+        "2022-01-03T00:00:00Z,",
+    ]
+
+    footprints.refresh_index(maap, connection, "cmr", "C1", limit=2)
+
+    # The next refresh starts from the time of the (complete) previous refresh
+    assert searches[-1]["revision_date"] > "2022-01-03T00:00:00Z,"
+
+
+def test_refresh_index_truncated(
+    maap: MAAP,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    searches: List[Dict[str, Any]] = []
+    search_granule = fake_search_granule(GRANULES, searches)
+    monkeypatch.setattr(maap, "searchGranule", search_granule, raising=False)
+    connection = footprints.open_index(tmp_path / "index.db")
+
+    result = footprints.refresh_index(maap, connection, "cmr", "C1", limit=2)
+
+    # All granules were revised at the same time, so searching from the newest
+    # revision found makes no progress
+    assert not is_successful(result)
+    assert "cannot be refreshed" in str(unsafe_perform_io(result.failure()))
+    assert searches[1]["revision_date"] == "2022-01-01T00:00:00Z,"
+
+    footprints.refresh_index(maap, connection, "cmr", "C1")
+
+    # The progress of the failed refresh was recorded (less the overlap)
+    assert searches[2]["revision_date"] == "2021-12-31T23:00:00Z,"
+
+
+def test_indexed_concept_id_missing(tmp_path: pathlib.Path) -> None:
+    connection = footprints.open_index(tmp_path / "index.db")
+    result = footprints.indexed_concept_id(connection, "10.1/missing")
+
+    assert not is_successful(result)
+    assert "10.1/missing" in str(unsafe_perform_io(result.failure()))
@@ -0,0 +1,144 @@
+import threading
+import time
+from typing import Iterator, List
+
+import pytest
+from returns.pipeline import flow
+
+from gedi_subset.benchmarks.combinators import run_benchmark
+from gedi_subset.fp import batched, filter, map, parallel_map, prefetch, rate_limited
+
+
+def test_parallel_map_bounds_concurrency() -> None:
+    lock = threading.Lock()
+    running = peak = 0
+    taken = []
+
+    def f(x: int) -> int:
+        nonlocal running, peak
+
+        with lock:
+            running += 1
+            peak = max(peak, running)
+
+        time.sleep(0.01)
+
+        with lock:
+            running -= 1
+
+        return x * 2
+
+    def items() -> Iterator[int]:
+        for i in range(20):
+            taken.append(i)
+            yield i
+
+    results = parallel_map(f, 3)(items())
+
+    assert next(results) == 0
+    # Items are taken only as workers become available
+    assert len(taken) <= 4
+    assert list(results) == [2 * i for i in range(1, 20)]
+    assert peak <= 3
+
+
+def test_parallel_map_unordered() -> None:
+    results = list(parallel_map(time.sleep, 2, ordered=False)([0.2, 0.0, 0.0]))
+
+    assert len(results) == 3
+    assert list(parallel_map(lambda x: x, 4, ordered=False)([])) == []
+
+
+def test_parallel_map_raises() -> None:
+    def f(x: int) -> int:
+        return 1 // x
+
+    results = parallel_map(f, 2)([1, 0, 1])
+
+    assert next(results) == 1
+
+    with pytest.raises(ZeroDivisionError):
+        next(results)
+
+
+def test_parallel_map_in_flow() -> None:
+    results = flow(
+        range(10),
+        batched(3),
+        parallel_map(sum, 2),
+        filter(lambda total: total % 2 == 1),
+        list,
+    )
+
+    assert results == [3, 21, 9]
+
+
+def test_prefetch_raises() -> None:
+    def items() -> Iterator[int]:
+        yield 1
+        raise ValueError("oops")
+
+    results = prefetch(4)(items())
+
+    assert next(results) == 1
+
+    with pytest.raises(ValueError, match="oops"):
+        next(results)
+
+
+def test_prefetch_stops_when_closed() -> None:
+    produced = []
+    producers = []
+
+    def items() -> Iterator[int]:
+        producers.append(threading.current_thread())
+
+        for i in range(1_000):
+            produced.append(i)
+            yield i
+
+    results = prefetch(2)(items())
+
+    assert next(results) == 0
+
+    results.close()
+    producers[0].join(timeout=10)
+
+    # The producer stopped, at most a few items ahead of the consumer
+    assert not producers[0].is_alive()
+    assert len(produced) < 10
+
+
+def test_rate_limited() -> None:
+    now = 0.0
+    sleeps: List[float] = []
+
+    def sleep(seconds: float) -> None:
+        nonlocal now
+        sleeps.append(seconds)
+        now += seconds
+
+    items = list(rate_limited(50.0, 2, lambda: now, sleep)(range(7)))
+
+    assert items == list(range(7))
+    # The first 2 items are a burst, and the other 5 are 1/50 s apart
+    assert sleeps == pytest.approx([0.02] * 5)
+
+
+def test_batched_flow() -> None:
+    assert flow(range(5), batched(2), map(sum), list) == [1, 5, 4]
+
+    with pytest.raises(ValueError):
+        batched(0)
+
+
+def test_run_benchmark() -> None:
+    results = list(run_benchmark(10, [1, 2], latency=0.001, rate=1000.0))
+
+    assert {r.benchmark for r in results} == {
+        "overhead",
+        "scaling",
+        "prefetch",
+        "rate_limited",
+    }
+    assert all(r.items_per_second > 0 for r in results)
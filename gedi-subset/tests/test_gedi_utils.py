@@ -1,11 +1,14 @@
 import os.path
 import warnings
-from typing import Set
+from typing import Optional, Set
 
 import h5py
+import numpy as np
 import pytest
 
-from gedi_subset.gedi_utils import subset_hdf5
+from gedi_subset.cover import build_cover
+from gedi_subset.gedi_utils import explode_array_columns, subset_hdf5
+from gedi_subset.temporal import Season, parse_temporal
 
 with warnings.catch_warnings():
     warnings.simplefilter("ignore")
@@ -41,3 +44,96 @@ def test_subset_hdf5(
 
     assert set(gdf.columns) == expected_columns
     assert gdf.shape == (n_expected_rows, len(expected_columns))
+
+
+@pytest.mark.parametrize(
+    "temporal, day_of_year, season, n_expected_rows",
+    [
+        (None, None, None, 4),
+        ("2019-01-01,2020-01-01", None, None, 2),
+        ("2020-01-01,", None, None, 2),
+        (None, "152,243", None, 2),
+        (None, None, Season.djf, 2),
+        (None, None, Season.mam, 0),
+    ],
+)
+def test_subset_hdf5_temporal(
+    h5_path: str,
+    aoi_gdf: gpd.GeoDataFrame,
+    temporal: Optional[str],
+    day_of_year: Optional[str],
+    season: Optional[Season],
+    n_expected_rows: int,
+) -> None:
+    temporal_filter = parse_temporal(temporal, day_of_year, season)
+
+    with h5py.File(h5_path) as hdf5:
+        gdf = subset_hdf5(hdf5, aoi_gdf, ["agbd"], "agbd > 0", temporal_filter)
+
+    assert gdf.shape == (n_expected_rows, 4)
+
+
+def test_subset_hdf5_cover(h5_path: str, aoi_gdf: gpd.GeoDataFrame) -> None:
+    cover = build_cover(aoi_gdf.geometry[0], depth=4)
+
+    with h5py.File(h5_path) as hdf5:
+        expected = subset_hdf5(hdf5, aoi_gdf, ["agbd", "rh[50]"], "agbd > 0")
+        gdf = subset_hdf5(hdf5, aoi_gdf, ["agbd", "rh[50]"], "agbd > 0", cover=cover)
+
+    assert gdf.drop(columns="rh").equals(expected.drop(columns="rh"))
+
+
+@pytest.mark.parametrize(
+    "column, expected_width",
+    [
+        ("rh", 101),
+        ("rh[50,98]", 2),
+        ("rh[0:101:10]", 11),
+    ],
+)
+def test_subset_hdf5_2d_dataset(
+    h5_path: str,
+    aoi_gdf: gpd.GeoDataFrame,
+    column: str,
+    expected_width: int,
+) -> None:
+    with h5py.File(h5_path) as hdf5:
+        gdf = subset_hdf5(hdf5, aoi_gdf, ["agbd", column], "l2_quality_flag == 1")
+        expected_rh = np.concatenate(
+            [hdf5["BEAM0000/rh"][2:3], hdf5["BEAM0001/rh"][2:3]]
+        )
+
+    assert set(gdf.columns) == {"filename", "BEAM", "agbd", "rh", "geometry"}
+    assert gdf.shape[0] == 2
+    assert all(value.shape == (expected_width,) for value in gdf.rh)
+
+    if column == "rh":
+        np.testing.assert_array_equal(np.stack(gdf.rh.to_numpy()), expected_rh)
+
+
+def test_subset_hdf5_indices_of_1d_dataset(
+    h5_path: str,
+    aoi_gdf: gpd.GeoDataFrame,
+) -> None:
+    with h5py.File(h5_path) as hdf5:
+        with pytest.raises(ValueError, match="agbd"):
+            subset_hdf5(hdf5, aoi_gdf, ["agbd[0]"], "l2_quality_flag == 1")
+
+
+def test_explode_array_columns(h5_path: str, aoi_gdf: gpd.GeoDataFrame) -> None:
+    columns = ["agbd", "rh[50,98]"]
+
+    with h5py.File(h5_path) as hdf5:
+        gdf = subset_hdf5(hdf5, aoi_gdf, columns, "l2_quality_flag == 1")
+
+    exploded = explode_array_columns(columns)(gdf)
+
+    assert list(exploded.columns) == [
+        "filename",
+        "BEAM",
+        "agbd",
+        "rh_50",
+        "rh_98",
+        "geometry",
+    ]
+    np.testing.assert_array_equal(exploded.rh_98, [v[1] for v in gdf.rh])
@@ -0,0 +1,111 @@
+import io
+import warnings
+from typing import Any, Mapping
+
+import h5py
+import numpy as np
+import pytest
+
+from gedi_subset.gedi_utils import subset_hdf5
+from gedi_subset.join import merge_join, pair_granules
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    import geopandas as gpd
+
+
+def make_granule(name: str) -> Mapping[str, Any]:
+    return {"Granule": {"GranuleUR": name}}
+
+
+@pytest.fixture
+def l4a() -> h5py.File:
+    with h5py.File(io.BytesIO(), "w") as hdf5:
+        beam = hdf5.create_group("BEAM0000")
+        beam.create_dataset("shot_number", data=np.arange(100, 106, dtype="u8"))
+        beam.create_dataset("lat_lowestmode", data=[-1.8, -1.8, -9.8, -1.8, -1.8, -1.8])
+        beam.create_dataset("lon_lowestmode", data=[12.0, 12.1, 12.2, 12.3, 12.4, 12.5])
+        beam.create_dataset("agbd", data=np.arange(6, dtype="f4"))
+        beam.create_dataset("sensitivity", data=np.full(6, 0.9))
+
+        yield hdf5
+
+
+@pytest.fixture
+def l2a() -> h5py.File:
+    # Shot 104 is missing, and the shots are not in sorted order
+    shots = np.array([105, 100, 101, 102, 103], dtype="u8")
+
+    with h5py.File(io.BytesIO(), "w") as hdf5:
+        beam = hdf5.create_group("BEAM0000")
+        beam.create_dataset("shot_number", data=shots)
+        beam.create_dataset("lat_lowestmode", data=np.zeros(5))
+        beam.create_dataset("lon_lowestmode", data=np.zeros(5))
+        beam.create_dataset("l2_quality_flag", data=[1, 1, 0, 1, 1], dtype="i1")
+        beam.create_dataset("sensitivity", data=np.full(5, 0.5))
+        beam.create_dataset(
+            "rh", data=(shots[:, None] * 1000 + np.arange(101)).astype("f8")
+        )
+
+        yield hdf5
+
+
+@pytest.fixture
+def l2b() -> h5py.File:
+    with h5py.File(io.BytesIO(), "w") as hdf5:
+        beam = hdf5.create_group("BEAM0000")
+        beam.create_dataset("shot_number", data=np.arange(100, 106, dtype="u8"))
+        beam.create_dataset("cover", data=[0.0, 0.1, 0.2, 0.3, 0.4, 0.5])
+
+        yield hdf5
+
+
+@pytest.mark.parametrize(
+    "left, right, expected",
+    [
+        ([], [], []),
+        ([1, 2], [], [-1, -1]),
+        ([1, 2, 3], [1, 2, 3], [0, 1, 2]),
+        ([1, 2, 3], [3, 1], [1, -1, 0]),
+        ([5], [1, 2, 3], [-1]),
+    ],
+)
+def test_merge_join(left, right, expected) -> None:
+    joined = merge_join(np.array(left, dtype="u8"), np.array(right, dtype="u8"))
+
+    assert joined.tolist() == expected
+
+
+def test_pair_granules() -> None:
+    l4a = [
+        make_granule(f"GEDI04_A_2019108080338_O01964_0{i}_T05337_02_002_02_V002.h5")
+        for i in range(1, 4)
+    ]
+    l2a = [
+        make_granule(f"GEDI02_A_2019108080338_O01964_0{i}_T05337_02_003_01_V002.h5")
+        for i in (3, 1)
+    ]
+    pairs = list(pair_granules(l4a, [l2a]))
+
+    assert pairs == [(l4a[0], (l2a[1],)), (l4a[2], (l2a[0],))]
+    assert list(pair_granules(l4a, [])) == [(granule, ()) for granule in l4a]
+
+
+def test_subset_hdf5_joined(
+    l4a: h5py.File, l2a: h5py.File, l2b: h5py.File, aoi_gdf: gpd.GeoDataFrame
+) -> None:
+    gdf = subset_hdf5(
+        l4a,
+        aoi_gdf,
+        ["agbd", "sensitivity", "rh[50]", "cover"],
+        "l2_quality_flag == 1 and cover < 0.35",
+        joined=[l2a, l2b],
+    )
+
+    # Shot 101 fails the query, 102 is outside the AOI, 104 is not in L2A, and
+    # 105 fails the query (by its L2B cover)
+    assert gdf.agbd.tolist() == [0.0, 3.0]
+    # Datasets of the subset granule take precedence over joined datasets
+    assert gdf.sensitivity.tolist() == [0.9, 0.9]
+    assert [rh.tolist() for rh in gdf.rh] == [[100_050.0], [103_050.0]]
+    assert gdf.cover.tolist() == [0.0, 0.3]
@@ -1,7 +1,8 @@
+import copy
 import json
 import pathlib
 import re
-from typing import Any, Mapping
+from typing import Any, Iterator, Mapping
 
 import pytest
 import requests
@@ -12,6 +13,8 @@ from mypy_boto3_s3.client import S3Client
 from returns.functions import raise_exception
 from returns.unsafe import unsafe_perform_io
 
+from gedi_subset import maapx
+from gedi_subset.benchmarks.download import Backend, Mode, run_benchmark
 from gedi_subset.maapx import download_granule
 
 EDC_CREDENTIALS_URL_PATTERN = re.compile(
@@ -19,6 +22,14 @@ EDC_CREDENTIALS_URL_PATTERN = re.compile(
 )
 
 
+@pytest.fixture(autouse=True)
+def s3_credentials_cache() -> Iterator[None]:
+    # Credentials are cached by endpoint, which tests share
+    maapx._s3_credentials.clear()
+    yield
+    maapx._s3_credentials.clear()
+
+
 def make_granule(metadata: Mapping[str, Any]) -> Granule:
     return Granule(
         metadata,
@@ -121,6 +132,50 @@ def test_download_granule_s3credentials_failure(
             download_granule(maap, str(tmp_path), granule).alt(raise_exception)
 
 
+def test_download_granule_s3credentials_cached(
+    maap: MAAP,
+    s3: S3Client,
+    tmp_path: pathlib.Path,
+):
+    s3.create_bucket(Bucket="mybucket")
+    s3.put_object(Bucket="mybucket", Key="file.txt", Body="s3 contents")
+
+    creds = {
+        "sessionToken": "mytoken",
+        "accessKeyId": "mykeyid",
+        "secretAccessKey": "myaccesskey",
+    }
+    granule = make_granule(
+        {
+            "Granule": {
+                "GranuleUR": "foo",
+                "OnlineAccessURLs": {
+                    "OnlineAccessURL": {"URL": "s3://mybucket/file.txt"}
+                },
+                "OnlineResources": {
+                    "OnlineResource": {"URL": "https://host/s3credentials"}
+                },
+            }
+        }
+    )
+
+    with responses.RequestsMock() as mock:
+        failure = mock.get(url=EDC_CREDENTIALS_URL_PATTERN, status=500)
+        download_granule(maap, str(tmp_path), granule)
+        mock.remove(failure)
+        success = mock.get(
+            url=EDC_CREDENTIALS_URL_PATTERN, status=200, body=json.dumps(creds)
+        )
+
+        # Every task unpickles its own MAAP, so credentials are cached regardless
+        for _ in range(3):
+            download_granule(copy.copy(maap), str(tmp_path), granule).unwrap()
+
+    # The failure was not cached, and the credentials were obtained only once
+    assert failure.call_count == 1
+    assert success.call_count == 1
+
+
 def test_download_granule_https_success(
     maap: MAAP,
     tmp_path: pathlib.Path,
@@ -165,3 +220,76 @@ def test_download_granule_https_failure(
         with responses.RequestsMock() as mock:
             mock.get(url="https://host/file.txt", status=404)
             download_granule(maap, str(tmp_path), granule).alt(raise_exception)
+
+
+def test_download_granule_https_retries_transient_failure(
+    maap: MAAP,
+    tmp_path: pathlib.Path,
+):
+    granule = make_granule(
+        {
+            "Granule": {
+                "GranuleUR": "foo",
+                "OnlineAccessURLs": {
+                    "OnlineAccessURL": {"URL": "https://host/file.txt"}
+                },
+            }
+        }
+    )
+
+    with responses.RequestsMock() as mock:
+        mock.get(url="https://host/file.txt", status=503)
+        mock.get(url="https://host/file.txt", status=200, body="https contents")
+        filename = unsafe_perform_io(
+            download_granule(
+                maap, str(tmp_path), granule, retries=2, backoff=0
+            ).unwrap()
+        )
+
+    with open(filename) as f:
+        assert f.read() == "https contents"
+
+
+def test_download_granule_https_does_not_retry_permanent_failure(
+    maap: MAAP,
+    tmp_path: pathlib.Path,
+):
+    granule = make_granule(
+        {
+            "Granule": {
+                "GranuleUR": "foo",
+                "OnlineAccessURLs": {
+                    "OnlineAccessURL": {"URL": "https://host/file.txt"}
+                },
+            }
+        }
+    )
+
+    with pytest.raises(requests.exceptions.HTTPError, match="404"):
+        with responses.RequestsMock() as mock:
+            mock.get(url="https://host/file.txt", status=404)
+            result = download_granule(maap, str(tmp_path), granule, retries=2)
+            assert len(mock.calls) == 1
+            result.alt(raise_exception)
+
+
+@pytest.mark.parametrize("backend", list(Backend))
+def test_download_benchmark(aws_credentials: None, backend: Backend) -> None:
+    size = 2**20
+    results = list(
+        run_benchmark(
+            [backend], list(Mode), [size], [1, 2], repeat=1, part_size=2**16
+        )
+    )
+
+    assert [(r.mode, r.concurrency) for r in results] == [
+        (mode.value, concurrency) for mode in Mode for concurrency in (1, 2)
+    ]
+    assert all(r.throughput_mib_per_second > 0 for r in results)
+
+    for r in results:
+        if r.mode == Mode.remote_hdf5.value:
+            # Only the coordinates and query datasets of the granule are read
+            assert r.bytes_transferred < r.size_bytes * r.concurrency
+        else:
+            assert r.bytes_transferred == r.size_bytes * r.concurrency
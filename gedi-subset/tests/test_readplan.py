@@ -0,0 +1,159 @@
+import io
+import warnings
+from typing import Optional, Sequence
+
+import h5py
+import numpy as np
+import pytest
+
+from gedi_subset.gedi_utils import read_rows, subset_hdf5
+from gedi_subset.readplan import (
+    ReadPlanner,
+    dataset_layout,
+    decode_pipeline,
+    row_ranges,
+)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    import geopandas as gpd
+
+
+@pytest.fixture
+def hdf5() -> h5py.File:
+    with h5py.File(io.BytesIO(), "w") as hdf5:
+        hdf5.create_dataset(
+            "rh",
+            data=np.arange(10_000 * 101, dtype="f4").reshape(10_000, 101),
+            chunks=(500, 101),
+            compression="gzip",
+            shuffle=True,
+        )
+        hdf5.create_dataset("agbd", data=np.arange(10_000, dtype="f4"))
+
+        yield hdf5
+
+
+@pytest.mark.parametrize(
+    "rows, expected",
+    [
+        ([], []),
+        ([7], [(7, 8)]),
+        ([0, 9, 10, 19], [(0, 20)]),
+        ([0, 9, 20], [(0, 10), (20, 21)]),
+        ([5, 15, 25, 35], [(5, 36)]),
+    ],
+)
+def test_row_ranges(rows: Sequence[int], expected) -> None:
+    assert row_ranges(np.array(rows, dtype=int), 10) == expected
+
+
+@pytest.mark.parametrize("indices", [None, (50,), (0, 50, 98)])
+def test_read_rows(hdf5: h5py.File, indices: Optional[Sequence[int]]) -> None:
+    rows = np.sort(np.random.default_rng(0).choice(10_000, 50, replace=False))
+    planner = ReadPlanner()
+
+    for name in ("rh", "agbd"):
+        expected = read_rows(hdf5[name], rows, indices if name == "rh" else None)
+        values = planner.read_rows(hdf5[name], rows, indices if name == "rh" else None)
+        np.testing.assert_array_equal(values, expected)
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+@pytest.mark.parametrize("indices", [None, (50,), (0, 29, 30, 98, 100)])
+def test_read_rows_threads(shuffle: bool, indices: Optional[Sequence[int]]) -> None:
+    rows = np.sort(np.random.default_rng(0).choice(1_000, 50, replace=False))
+    planner = ReadPlanner(threads=2)
+
+    with h5py.File(io.BytesIO(), "w") as hdf5:
+        # Chunks of the last rows and columns are partial (edge) chunks
+        rh = hdf5.create_dataset(
+            "rh",
+            data=np.arange(1_000 * 101, dtype=">f4").reshape(1_000, 101),
+            chunks=(128, 30),
+            compression="gzip",
+            shuffle=shuffle,
+        )
+        agbd = hdf5.create_dataset(
+            "agbd", data=np.arange(1_000.0), chunks=(100,), compression="gzip"
+        )
+
+        assert decode_pipeline(rh) is not None
+        np.testing.assert_array_equal(
+            planner.read_rows(rh, rows, indices), read_rows(rh, rows, indices)
+        )
+        np.testing.assert_array_equal(planner.read_rows(agbd, rows), agbd[rows])
+        np.testing.assert_array_equal(planner.read(agbd), agbd[()])
+
+    assert planner.stats.chunks > 0
+    assert 0 < planner.stats.stored_bytes < planner.stats.decoded_bytes
+
+
+def test_decode_pipeline_unsupported() -> None:
+    with h5py.File(io.BytesIO(), "w") as hdf5:
+        checksummed = hdf5.create_dataset(
+            "a", data=np.arange(100), chunks=(10,), fletcher32=True
+        )
+        unallocated = hdf5.create_dataset("b", shape=(100,), chunks=(10,))
+        contiguous = hdf5.create_dataset("c", data=np.arange(100))
+
+        assert decode_pipeline(checksummed) is None
+        assert decode_pipeline(unallocated) is None
+        assert decode_pipeline(contiguous) is None
+
+        # Falls back to reading via HDF5
+        planner = ReadPlanner(threads=2)
+        np.testing.assert_array_equal(
+            planner.read_rows(checksummed, np.array([3, 50])), [3, 50]
+        )
+
+
+def test_read_rows_decompresses_only_chunks_with_selected_rows(
+    hdf5: h5py.File,
+) -> None:
+    planner = ReadPlanner()
+    planner.read_rows(hdf5["rh"], np.array([0, 1, 9_999]))
+
+    assert planner.stats.reads == 1
+    assert planner.stats.chunks == 2
+    assert planner.stats.decoded_bytes == 2 * 500 * 101 * 4
+    assert 0 < planner.stats.stored_bytes < planner.stats.decoded_bytes
+
+
+def test_read_rows_empty(hdf5: h5py.File) -> None:
+    values = ReadPlanner().read_rows(hdf5["rh"], np.array([], dtype=int), [1, 2])
+
+    assert values.shape == (0, 2)
+    assert values.dtype == np.float32
+
+
+def test_dataset_layout(hdf5: h5py.File) -> None:
+    layout = dataset_layout(hdf5["rh"])
+
+    assert layout.chunks == (500, 101)
+    assert layout.filters == ("shuffle", "gzip")
+    assert layout.n_chunks == 20
+    assert layout.chunk_nbytes == 500 * 101 * 4
+    assert layout.offset > 0
+    assert dataset_layout(hdf5["agbd"]).filters == ()
+
+
+def test_order(hdf5: h5py.File) -> None:
+    datasets = ReadPlanner().order([hdf5["rh"], hdf5["agbd"]])
+    offsets = [dataset_layout(dataset).offset for dataset in datasets]
+
+    assert offsets == sorted(offsets)
+
+
+def test_subset_hdf5_planner_stats(h5_path: str, aoi_gdf: gpd.GeoDataFrame) -> None:
+    planner = ReadPlanner()
+
+    with h5py.File(h5_path) as hdf5:
+        expected = subset_hdf5(hdf5, aoi_gdf, ["agbd", "rh[50]"], "agbd > 0")
+        gdf = subset_hdf5(
+            hdf5, aoi_gdf, ["agbd", "rh[50]"], "agbd > 0", planner=planner
+        )
+
+    assert gdf.drop(columns="rh").equals(expected.drop(columns="rh"))
+    assert planner.stats.reads > 0
+    assert planner.stats.decoded_bytes > 0
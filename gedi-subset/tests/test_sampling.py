@@ -0,0 +1,128 @@
+import warnings
+from typing import Any, Mapping
+
+import h5py
+import numpy as np
+import pytest
+
+from gedi_subset.gedi_utils import subset_hdf5
+from gedi_subset.sampling import Sample, spread_granules, spread_order
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    import geopandas as gpd
+
+
+def make_granule(name: str, x: float, begin: str) -> Mapping[str, Any]:
+    points = [(x, 0), (x + 1, 0), (x + 1, 1), (x, 1), (x, 0)]
+
+    return {
+        "Granule": {
+            "GranuleUR": name,
+            "Temporal": {"RangeDateTime": {"BeginningDateTime": begin}},
+            "Spatial": {
+                "HorizontalSpatialDomain": {
+                    "Geometry": {
+                        "GPolygon": {
+                            "Boundary": {
+                                "Point": [
+                                    {"PointLongitude": lon, "PointLatitude": lat}
+                                    for lon, lat in points
+                                ]
+                            }
+                        }
+                    }
+                }
+            },
+        }
+    }
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [dict(fraction=0), dict(fraction=1.5), dict(max_rows=-1)],
+)
+def test_sample_invalid(kwargs) -> None:
+    with pytest.raises(ValueError):
+        Sample(**kwargs)
+
+
+def test_sample_select_fraction() -> None:
+    sizes = [10_000, 0, 30_000]
+    groups = Sample(fraction=0.1).select("key", sizes)
+
+    assert [len(group) for group in groups][1] == 0
+    assert 3_600 < sum(map(len, groups)) < 4_400
+    assert all(np.all(np.diff(group) > 0) for group in groups)
+    assert all(np.all(group < size) for group, size in zip(groups, sizes))
+
+
+def test_sample_select_max_rows() -> None:
+    sample = Sample(fraction=0.5, max_rows=100, seed=1)
+    groups = sample.select("key", [1_000, 1_000])
+
+    assert sum(map(len, groups)) == 100
+    # Rows are sampled from all groups, not only the first
+    assert all(len(group) > 0 for group in groups)
+
+
+def test_sample_select_is_reproducible() -> None:
+    sample = Sample(fraction=0.25, max_rows=50)
+
+    def select(sample: Sample, key: str):
+        return [group.tolist() for group in sample.select(key, [300, 300])]
+
+    assert select(sample, "a.h5") == select(sample, "a.h5")
+    assert select(sample, "a.h5") != select(sample, "b.h5")
+    assert select(sample, "a.h5") != select(Sample(0.25, 50, seed=1), "a.h5")
+
+
+def test_spread_order() -> None:
+    points = np.random.default_rng(0).random((100, 3))
+    order = list(spread_order(points))
+
+    assert sorted(order) == list(range(100))
+
+    def min_distance(indices) -> float:
+        selected = points[indices]
+        distances = np.linalg.norm(selected[:, None] - selected[None], axis=-1)
+        return distances[np.triu_indices(len(indices), 1)].min()
+
+    # The first 8 points of the order are farther apart than an arbitrary 8 points
+    assert min_distance(order[:8]) > min_distance(list(range(8)))
+
+
+def test_spread_order_duplicates() -> None:
+    assert sorted(spread_order(np.zeros((4, 2)))) == [0, 1, 2, 3]
+    assert list(spread_order(np.zeros((0, 2)))) == []
+
+
+def test_spread_granules() -> None:
+    granules = [
+        make_granule(f"G{i}", float(i), f"2020-01-{i + 1:02d}T00:00:00Z")
+        for i in range(9)
+    ]
+    names = [g["Granule"]["GranuleUR"] for g in spread_granules(granules)]
+
+    assert sorted(names) == sorted(g["Granule"]["GranuleUR"] for g in granules)
+    assert names[:3] == ["G4", "G0", "G8"]
+
+
+def test_subset_hdf5_sample(h5_path: str, aoi_gdf: gpd.GeoDataFrame) -> None:
+    with h5py.File(h5_path) as hdf5:
+        expected = subset_hdf5(hdf5, aoi_gdf, ["agbd", "rh[50]"], "agbd > 0")
+        gdf = subset_hdf5(
+            hdf5,
+            aoi_gdf,
+            ["agbd", "rh[50]"],
+            "agbd > 0",
+            sample=Sample(max_rows=1),
+        )
+        everything = subset_hdf5(
+            hdf5, aoi_gdf, ["agbd", "rh[50]"], "agbd > 0", sample=Sample()
+        )
+
+    assert len(expected) > 1
+    assert len(gdf) == 1
+    assert gdf.agbd.iat[0] in expected.agbd.to_list()
+    assert everything.drop(columns="rh").equals(expected.drop(columns="rh"))
@@ -0,0 +1,231 @@
+import multiprocessing
+import pathlib
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from typing import List, Tuple
+
+import pytest
+
+from returns.io import IOResultE, IOSuccess, impure_safe
+from returns.pipeline import is_successful
+from returns.unsafe import unsafe_perform_io
+
+from gedi_subset.scheduler import Speculation, run_tasks
+
+Payload = Tuple[int, int]  # (task, attempt)
+
+SPECULATION = Speculation(factor=3.0, min_seconds=0.1, min_samples=3)
+
+
+def identity(payload: Payload, attempt: int) -> Payload:
+    return payload[0], attempt
+
+
+def values(results: List[IOResultE[Payload]]) -> List[Payload]:
+    return sorted(unsafe_perform_io(result.unwrap()) for result in results)
+
+
+def test_run_tasks() -> None:
+    @impure_safe
+    def func(payload: Payload) -> Payload:
+        return payload
+
+    with ThreadPool(3) as pool:
+        results = list(
+            run_tasks(pool, 3, func, [(i, 0) for i in range(10)], identity, print)
+        )
+
+    assert values(results) == [(i, 0) for i in range(10)]
+
+
+def test_run_tasks_speculates_stragglers() -> None:
+    release = threading.Event()
+    discarded: List[Payload] = []
+
+    @impure_safe
+    def func(payload: Payload) -> Payload:
+        task, attempt = payload
+
+        # The first attempt of task 0 straggles until the job is done
+        if task == 0 and attempt == 0:
+            release.wait(10)
+        else:
+            time.sleep(0.01)
+
+        return payload
+
+    with ThreadPool(2) as pool:
+        start = time.monotonic()
+        results = list(
+            run_tasks(
+                pool,
+                2,
+                func,
+                [(i, 0) for i in range(6)],
+                identity,
+                discarded.append,
+                SPECULATION,
+                poll_interval=0.01,
+            )
+        )
+        elapsed = time.monotonic() - start
+        release.set()
+
+    assert elapsed < 5
+    assert values(results) == [(0, 1)] + [(i, 0) for i in range(1, 6)]
+
+
+def test_run_tasks_discards_late_results() -> None:
+    discarded: List[Payload] = []
+
+    @impure_safe
+    def func(payload: Payload) -> Payload:
+        task, attempt = payload
+        # The first attempt of task 0 straggles, but completes (and is discarded)
+        # while task 5 (every attempt of which is slow) is still running
+        time.sleep({(0, 0): 0.3, (5, 0): 1.0, (5, 1): 1.0}.get(payload, 0.01))
+
+        return payload
+
+    with ThreadPool(3) as pool:
+        results = list(
+            run_tasks(
+                pool,
+                3,
+                func,
+                [(i, 0) for i in range(6)],
+                identity,
+                discarded.append,
+                SPECULATION,
+                poll_interval=0.01,
+            )
+        )
+
+    assert values(results) == [(0, 1)] + [(i, 0) for i in range(1, 6)]
+    assert discarded == [(0, 0)]
+
+
+def test_run_tasks_fails_only_when_all_attempts_fail() -> None:
+    @impure_safe
+    def func(payload: Payload) -> Payload:
+        task, attempt = payload
+
+        if task == 0 and attempt == 0:
+            time.sleep(0.5)
+            raise ValueError("first attempt failed")
+
+        if task == 1:
+            raise ValueError("always fails")
+
+        time.sleep(0.01)
+
+        return payload
+
+    with ThreadPool(2) as pool:
+        results = list(
+            run_tasks(
+                pool,
+                2,
+                func,
+                [(i, 0) for i in range(6)],
+                identity,
+                print,
+                SPECULATION,
+                poll_interval=0.01,
+            )
+        )
+
+    failures = [result for result in results if not is_successful(result)]
+
+    assert len(results) == 6
+    assert len(failures) == 1
+    assert IOSuccess((0, 1)) in results
+
+
+def test_run_tasks_exceptions_are_failures() -> None:
+    def func(payload: Payload) -> IOResultE[Payload]:
+        raise RuntimeError("boom")
+
+    with ThreadPool(1) as pool:
+        (result,) = run_tasks(pool, 1, func, [(0, 0)], identity, print)
+
+    assert not is_successful(result)
+    assert isinstance(unsafe_perform_io(result.failure()), RuntimeError)
+
+
+def test_run_tasks_drain_when_closed() -> None:
+    discarded: List[Payload] = []
+
+    @impure_safe
+    def func(payload: Payload) -> Payload:
+        # Task 0 fails fast, while task 1 is still running
+        time.sleep(0.3 if payload[0] == 1 else 0.01)
+
+        if payload[0] == 0:
+            raise ValueError("fail fast")
+
+        return payload
+
+    with ThreadPool(2) as pool:
+        results = run_tasks(
+            pool, 2, func, [(0, 0), (1, 0)], identity, discarded.append, drain=True
+        )
+        assert not is_successful(next(results))
+        results.close()
+
+    assert discarded == [(1, 0)]
+
+
+MarkedPayload = Tuple[int, int, str]  # (task, attempt, directory of markers)
+
+
+@impure_safe
+def straggle(payload: MarkedPayload) -> MarkedPayload:
+    task, attempt, markers = payload
+    # The first attempt of task 0 straggles (long after its speculative attempt)
+    time.sleep(1.0 if (task, attempt) == (0, 0) else 0.01)
+    (pathlib.Path(markers) / f"{task}-{attempt}").touch()
+
+    return payload
+
+
+def test_run_tasks_drain_leaves_pool_idle_for_next_job(tmp_path: pathlib.Path) -> None:
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("fork is not supported on this platform")
+
+    def attempt_payload(payload: MarkedPayload, attempt: int) -> MarkedPayload:
+        return payload[0], attempt, payload[2]
+
+    def job(pool, markers: pathlib.Path, discarded: List[MarkedPayload]) -> None:
+        markers.mkdir()
+        results = run_tasks(
+            pool,
+            2,
+            straggle,
+            [(i, 0, str(markers)) for i in range(6)],
+            attempt_payload,
+            discarded.append,
+            SPECULATION,
+            poll_interval=0.01,
+            drain=True,
+        )
+
+        assert len(list(results)) == 6
+
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        discarded: List[MarkedPayload] = []
+        job(pool, tmp_path / "first", discarded)
+
+        # The losing attempt finished (and was discarded) before the job returned
+        assert (tmp_path / "first" / "0-0").exists()
+        assert [payload[:2] for payload in discarded] == [(0, 0)]
+
+        # So the next job starts on an idle pool, and is likewise drained
+        discarded.clear()
+        job(pool, tmp_path / "second", discarded)
+
+        assert sorted(p.name for p in (tmp_path / "second").iterdir()) == sorted(
+            ["0-0", "0-1"] + [f"{i}-0" for i in range(1, 6)]
+        )
+        assert [payload[:2] for payload in discarded] == [(0, 0)]
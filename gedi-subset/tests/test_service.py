@@ -0,0 +1,94 @@
+import pickle
+import threading
+from typing import Any, Iterator, List
+
+import pytest
+from maap.maap import MAAP
+
+from gedi_subset.maapx import find_collection
+from gedi_subset.service import (
+    SubsetService,
+    WarmMAAP,
+    make_server,
+    request,
+    submit_job,
+)
+from gedi_subset.subset import WarmResources, warm_resources, worker_pool
+
+
+@pytest.fixture
+def url(maap: MAAP) -> Iterator[str]:
+    # Jobs failing argument validation never reach the pool
+    service = SubsetService(WarmResources(maap, None, 1))  # type: ignore
+    runner = threading.Thread(target=service.run, daemon=True)
+    runner.start()
+
+    with make_server(service, port=0) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_port}"
+        server.shutdown()
+
+    service.stop()
+    runner.join()
+
+
+def test_submit_job_failure(url: str, tmp_path) -> None:
+    job = submit_job(url, ["--columns", "agbd"], str(tmp_path), poll_interval=0.05)
+
+    assert job["state"] == "failed"
+    assert "Specify exactly one of --aoi or --batch" in job["error"]
+    assert job["started"] <= job["finished"]
+    assert request(f"{url}/jobs/{job['id']}") == job
+    assert request(f"{url}/jobs") == [job]
+    assert request(f"{url}/health") == dict(workers=1, queued=0)
+
+
+def test_submit_job_invalid_batch(url: str, tmp_path) -> None:
+    (tmp_path / "batch.json").write_text('[{"name": "a"}]')
+    args = ["--batch", "batch.json", "--columns", "agbd"]
+    job = submit_job(url, args, str(tmp_path), poll_interval=0.05)
+
+    # Reported as a usage error, rather than as a traceback
+    assert job["state"] == "failed"
+    assert job["error"].startswith("Invalid value: AOI job 0: missing 'aoi'")
+
+
+def test_submit_job_invalid(url: str) -> None:
+    with pytest.raises(ValueError, match="Invalid job"):
+        request(f"{url}/jobs", "POST", dict(args="--aoi aoi.geojson"))
+
+    with pytest.raises(ValueError, match="Not found"):
+        request(f"{url}/jobs/42")
+
+
+def test_worker_pool_warm(maap: MAAP) -> None:
+    pool = object()
+    token = warm_resources.set(WarmResources(maap, pool, 3))  # type: ignore
+
+    try:
+        with worker_pool(8, None, ()) as (warm_pool, processes):
+            assert warm_pool is pool
+            assert processes == 3
+    finally:
+        warm_resources.reset(token)
+
+
+def test_warm_maap_caches_collections(monkeypatch: pytest.MonkeyPatch) -> None:
+    searches: List[Any] = []
+
+    def search(self, **kwargs: Any) -> List[Any]:
+        searches.append(kwargs)
+        return [{"concept-id": "C1"}] if kwargs.get("doi") == "10.1/a" else []
+
+    monkeypatch.setattr(MAAP, "__init__", lambda self, maap_host: None)
+    monkeypatch.setattr(MAAP, "searchCollection", search)
+    maap = WarmMAAP("maap.host")
+
+    for _ in range(2):
+        assert find_collection(maap, "cmr.host", {"doi": "10.1/a"}).unwrap()
+        assert find_collection(maap, "cmr.host", {"doi": "10.1/b"}).failure()
+
+    # Only non-empty results are cached
+    assert len(searches) == 3
+    assert not pickle.loads(pickle.dumps(maap))._collections
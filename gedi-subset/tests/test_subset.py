@@ -1,21 +1,43 @@
 import os
+import pathlib
+import shutil
+import sys
 
 import geopandas as gpd
+import pytest
+import typer
 from maap.maap import MAAP
 from maap.Result import Granule
-from returns.io import IOSuccess
+from returns.io import IOFailure, IOSuccess
 from returns.maybe import Some
+from returns.pipeline import is_successful
+from shapely.geometry import box
 
-from gedi_subset.subset import SubsetGranuleProps, subset_granule
+from gedi_subset import footprints, subset
+from gedi_subset.batch import AOIJob
+from gedi_subset.benchmarks.load import run_load_test
+from gedi_subset.subset import (
+    SubsetGranuleBatchProps,
+    SubsetGranuleProps,
+    check_fraction,
+    search_footprint_index,
+    subset_granule,
+    subset_granule_batch,
+)
+from gedi_subset.transfer import read_subset
 
 
 def test_subset_granule(
     maap: MAAP,
     h5_path: str,
     aoi_gdf: gpd.GeoDataFrame,
+    tmp_path: pathlib.Path,
 ):
-    output_dir = os.path.dirname(h5_path)
+    # Subsetting removes the "downloaded" granule file, so subset a copy of the
+    # (session-scoped) fixture file.
+    output_dir = str(tmp_path)
     filename = os.path.basename(h5_path)
+    h5_path = shutil.copy(h5_path, tmp_path / filename)
     granule = Granule(
         {
             "Granule": {
@@ -34,11 +56,11 @@ def test_subset_granule(
     # Since we have used a fixture to generate an h5 file, when subset_granule attempts
     # to download the granule, no download will occur since the file already exists,
     # which means we do not need to mock any S3 or HTTP calls.  Therefore, the result
-    # we get should simply match the path of the h5 fixture file, except with a .gpq
+    # we get should simply match the path of the h5 fixture file, except with an .arrow
     # extension, rather than an .h5 extension.
 
     root, _ = os.path.splitext(h5_path)
-    expected_path = f"{root}.gpq"
+    expected_path = f"{root}.arrow"
     io_result = subset_granule(
         SubsetGranuleProps(
             granule,
@@ -51,3 +73,112 @@ def test_subset_granule(
     )
 
     assert io_result == IOSuccess(Some(expected_path))
+
+
+def test_subset_granule_batch(
+    maap: MAAP,
+    h5_path: str,
+    aoi_gdf: gpd.GeoDataFrame,
+    tmp_path: pathlib.Path,
+):
+    # As in test_subset_granule, subset a copy of the fixture file.
+    output_dir = str(tmp_path)
+    filename = os.path.basename(h5_path)
+    root, _ = os.path.splitext(shutil.copy(h5_path, tmp_path / filename))
+    footprint = [
+        {"PointLongitude": str(x), "PointLatitude": str(y)}
+        for x, y in [(8, -10), (15, -10), (15, 3), (8, 3)]
+    ]
+    granule = Granule(
+        {
+            "Granule": {
+                "GranuleUR": "foo",
+                "OnlineAccessURLs": {
+                    "OnlineAccessURL": {"URL": f"s3://mybucket/{filename}"}
+                },
+                "Spatial": {
+                    "HorizontalSpatialDomain": {
+                        "Geometry": {"GPolygon": {"Boundary": {"Point": footprint}}}
+                    }
+                },
+            }
+        },
+        awsAccessKey="",
+        awsAccessSecret="",
+        apiHeader={},
+        cmrFileUrl="",
+    )
+    jobs = [
+        AOIJob("all", aoi_gdf, ["agbd"], "agbd > 0"),
+        AOIJob("quality", aoi_gdf, ["agbd", "rh[50]"], "l2_quality_flag == 1"),
+        AOIJob("none", aoi_gdf, ["agbd"], "agbd < 0"),
+        AOIJob("away", gpd.GeoDataFrame(geometry=[box(0, 0, 1, 1)]), ["agbd"], "True"),
+    ]
+
+    io_result = subset_granule_batch(
+        SubsetGranuleBatchProps(granule, maap, jobs, output_dir)
+    )
+
+    assert io_result == IOSuccess(
+        (("all", f"{root}.all.arrow"), ("quality", f"{root}.quality.arrow"))
+    )
+    assert len(read_subset(f"{root}.all.arrow")) == 4
+    assert read_subset(f"{root}.quality.arrow").columns.tolist() == [
+        "filename",
+        "BEAM",
+        "agbd",
+        "rh",
+        "geometry",
+    ]
+
+
+def test_run_load_test() -> None:
+    # The moto server requires moto's server extras
+    pytest.importorskip("flask")
+
+    result = run_load_test(
+        ["--columns", "agbd,sensitivity", "--query", "sensitivity > 0.95"],
+        granules=24,
+        tracks=3,
+        shots=50,
+    )
+
+    assert 0 < result.granules_subset <= result.granules_found <= 24
+    assert result.bytes_moved["s3"] == result.granules_subset * result.object_bytes
+    assert result.requests["cmr"] >= 2  # Collection and (at least) 1 granule page
+    assert result.requests["credentials"] >= 1
+    assert result.granules_per_minute > 0
+    assert result.output_bytes > 0
+
+    if sys.platform == "linux":
+        assert result.peak_memory_bytes > result.object_bytes
+
+
+@pytest.mark.parametrize("fraction", [0.0, -0.5, 1.5])
+def test_check_fraction_out_of_range(fraction: float) -> None:
+    with pytest.raises(typer.BadParameter, match="0<x<=1"):
+        check_fraction(fraction)
+
+    assert check_fraction(1.0) == 1.0
+
+
+def test_search_footprint_index_falls_back_to_cmr(
+    maap: MAAP,
+    aoi_gdf: gpd.GeoDataFrame,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        subset, "find_collection", lambda *_: IOSuccess({"concept-id": "C1"})
+    )
+    monkeypatch.setattr(
+        footprints,
+        "refresh_index",
+        lambda *_: IOFailure(ValueError("cannot be refreshed")),
+    )
+    monkeypatch.setattr(subset, "search_granules", lambda *_: IOSuccess(["cmr"]))
+    args = (maap, "cmr", "10.1/x", aoi_gdf, 10, None, tmp_path / "index.db")
+
+    assert search_footprint_index(*args, True) == IOSuccess(["cmr"])
+    # Without refreshing, CMR is not accessed at all
+    assert not is_successful(search_footprint_index(*args, False))
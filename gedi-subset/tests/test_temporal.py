@@ -0,0 +1,138 @@
+import datetime as dt
+from typing import Any, Mapping
+
+import numpy as np
+import pytest
+from maap.Result import Granule
+
+from gedi_subset.temporal import Season, granule_overlaps, parse_temporal
+
+
+def make_granule(metadata: Mapping[str, Any]) -> Granule:
+    return Granule(
+        metadata,
+        awsAccessKey="",
+        awsAccessSecret="",
+        apiHeader={},
+        cmrFileUrl="",
+    )
+
+
+def test_mask_delta_time() -> None:
+    temporal = parse_temporal("2019-07-01,2019-07-02", season=Season.jja)
+    assert temporal is not None
+
+    # 2019-06-30T23:59:59, 2019-07-01T00:00:00, 2019-07-02T00:00:00, 2019-07-02T00:00:01
+    delta_time = np.array([47174399.0, 47174400.0, 47260800.0, 47260801.0])
+
+    np.testing.assert_array_equal(temporal.mask(delta_time), [False, True, True, False])
+
+
+@pytest.mark.parametrize(
+    "season, dates",
+    [
+        (Season.djf, ["2020-02-29", "2020-12-01", "2019-12-01"]),
+        (Season.mam, ["2020-03-01", "2020-05-31", "2019-03-01"]),
+        (Season.jja, ["2020-06-01", "2020-08-31", "2019-08-31"]),
+        (Season.son, ["2020-09-01", "2020-11-30", "2019-11-30"]),
+    ],
+)
+def test_mask_season_leap_year(season: Season, dates: list) -> None:
+    temporal = parse_temporal("2019-01-01,2021-01-01", season=season)
+    assert temporal is not None
+
+    epoch = np.datetime64("2018-01-01T00:00:00")
+    times = np.array([np.datetime64(f"{date}T12:00:00") for date in dates])
+    delta_time = (times - epoch).astype("timedelta64[s]").astype(float)
+
+    # Seasons follow month boundaries in leap years (e.g., 2020), too
+    assert temporal.mask(delta_time).all()
+    assert all(
+        temporal.overlaps(
+            dt.datetime.fromisoformat(f"{date}T12:00:00+00:00"),
+            dt.datetime.fromisoformat(f"{date}T13:00:00+00:00"),
+        )
+        for date in dates
+    )
+
+
+@pytest.mark.parametrize(
+    "temporal, day_of_year, begin, end, expected",
+    [
+        ("2019-01-01,2020-01-01", None, "2019-05-01T01:00:00.000Z", None, True),
+        ("2019-01-01,2020-01-01", None, "2020-05-01T01:00:00.000Z", None, False),
+        ("2019-01-01,", "335,59", "2020-01-15T01:00:00.000Z", None, True),
+        ("2019-01-01,", "335,59", "2020-03-15T01:00:00.000Z", None, False),
+        (
+            "2019-01-01,",
+            "152,243",
+            "2020-05-31T23:00:00.000Z",
+            "2020-06-01T01:00:00.000Z",
+            True,
+        ),
+        ("2019-01-01,", "152,243", None, None, True),
+    ],
+)
+def test_granule_overlaps(
+    temporal: str,
+    day_of_year: str,
+    begin: str,
+    end: str,
+    expected: bool,
+) -> None:
+    temporal_filter = parse_temporal(temporal, day_of_year)
+    assert temporal_filter is not None
+
+    range_ = {"BeginningDateTime": begin, "EndingDateTime": end or begin}
+    granule = make_granule(
+        {
+            "Granule": {
+                "GranuleUR": "foo",
+                **({"Temporal": {"RangeDateTime": range_}} if begin else {}),
+            }
+        }
+    )
+
+    assert granule_overlaps(temporal_filter, granule) == expected
+
+
+@pytest.mark.parametrize(
+    "season, date",
+    [
+        (Season.mam, "2020-05-31"),
+        (Season.jja, "2020-08-31"),
+        (Season.son, "2020-11-30"),
+    ],
+)
+def test_cmr_temporal_season_leap_year(season: Season, date: str) -> None:
+    temporal = parse_temporal("2019-01-01,2021-01-01", season=season)
+    assert temporal is not None
+
+    begin = f"{date}T01:00:00.000Z"
+    range_ = {"BeginningDateTime": begin, "EndingDateTime": begin}
+    granule = make_granule(
+        {"Granule": {"GranuleUR": "foo", "Temporal": {"RangeDateTime": range_}}}
+    )
+    first, last = (int(day) for day in temporal.cmr_temporal.split(",")[2:])
+    day = dt.date.fromisoformat(date).timetuple().tm_yday
+
+    # CMR does not shift leap-year days, so its window must cover the last day of
+    # the season in a leap year, too
+    assert first <= day <= last
+    assert granule_overlaps(temporal, granule)
+
+
+def test_parse_temporal_invalid() -> None:
+    with pytest.raises(ValueError, match="not both"):
+        parse_temporal(day_of_year="1,10", season=Season.jja)
+
+    with pytest.raises(ValueError, match="temporal range"):
+        parse_temporal("2019-01-01")
+
+    with pytest.raises(ValueError, match="day-of-year"):
+        parse_temporal(day_of_year="0,400")
+
+    assert parse_temporal(temporal=None) is None
+    assert parse_temporal("2019-01-01,").start == dt.datetime(  # type: ignore
+        2019, 1, 1, tzinfo=dt.timezone.utc
+    )
@@ -0,0 +1,66 @@
+import pathlib
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gedi_subset import transfer
+from gedi_subset.transfer import count_rows, read_subset, write_subset
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    import geopandas as gpd
+
+
+@pytest.fixture
+def gdf() -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(
+        {
+            "filename": "GEDI04_A.h5",
+            "BEAM": ["0000", "0000", "0101"],
+            "agbd": np.array([1.5, 2.5, np.nan], dtype="f4"),
+            "rh": pd.Series(list(np.arange(6.0).reshape(3, 2)), dtype=object),
+        },
+        geometry=gpd.points_from_xy([12.0, 12.1, 12.2], [-1.8, -1.9, -2.0]),
+        crs="EPSG:4326",
+    )
+
+
+def test_write_subset_shared_memory(
+    gdf: gpd.GeoDataFrame, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(transfer, "MIN_FREE_MEMORY", 0)
+    shm_dir = tmp_path / "shm"
+    shm_dir.mkdir()
+    path = write_subset(gdf, tmp_path / "subset.arrow", shm_dir)
+
+    assert pathlib.Path(path).parent == shm_dir
+    assert count_rows(path) == 3
+
+    result = read_subset(path)
+
+    assert result.crs == gdf.crs
+    assert result.columns.tolist() == gdf.columns.tolist()
+    assert result.geometry.equals(gdf.geometry)
+    assert result.drop(columns="rh").equals(gdf.drop(columns="rh"))
+    np.testing.assert_array_equal(np.stack(result.rh), np.stack(gdf.rh))
+
+
+def test_write_subset_spills_under_memory_pressure(
+    gdf: gpd.GeoDataFrame, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(transfer, "MIN_FREE_MEMORY", 1 << 60)
+    shm_dir = tmp_path / "shm"
+    shm_dir.mkdir()
+    path = write_subset(gdf, tmp_path / "subset.arrow", shm_dir)
+
+    assert path == str(tmp_path / "subset.arrow")
+    assert read_subset(path).geometry.equals(gdf.geometry)
+
+
+def test_write_subset_empty(gdf: gpd.GeoDataFrame, tmp_path: pathlib.Path) -> None:
+    path = write_subset(gdf.iloc[:0], tmp_path / "subset.arrow")
+
+    assert count_rows(path) == 0
+    assert read_subset(path).columns.tolist() == gdf.columns.tolist()
@@ -0,0 +1,30 @@
+import multiprocessing
+
+import pytest
+
+from gedi_subset.benchmarks.startup import measure_startup
+from gedi_subset.workers import StartMethod, default_start_method, get_context
+
+
+def test_default_start_method() -> None:
+    assert default_start_method().value in multiprocessing.get_all_start_methods()
+
+
+@pytest.mark.parametrize("start_method", [StartMethod.spawn, StartMethod.forkserver])
+def test_measure_startup(start_method: StartMethod) -> None:
+    if start_method.value not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{start_method.value} is not supported on this platform")
+
+    report = measure_startup(2, start_method, modules=["json", "gedi_subset.fp"])
+
+    assert report.start_method == start_method.value
+    assert report.processes == 2
+    assert len({worker.pid for worker in report.workers}) == 2
+    assert all(
+        set(worker.import_seconds) == {"json", "gedi_subset.fp"}
+        for worker in report.workers
+    )
+
+
+def test_get_context_start_method() -> None:
+    assert get_context(StartMethod.spawn).get_start_method() == "spawn"
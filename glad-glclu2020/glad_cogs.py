@@ -0,0 +1,365 @@
+"""Convert GLAD GLCLU2020 tiles to COGs, in parallel, from one object store to another.
+
+Each tile is streamed from the source store (e.g., an `HTTPStore` of the Google
+bucket) to a temporary file, converted to a COG with `cog_translate`, and
+streamed (with a multipart upload) to the destination store (e.g., an `S3Store`
+of a workspace bucket).  Tiles are converted concurrently by a pool of processes,
+with a bounded number of tiles in flight, so conversion scales with the number of
+cores, and memory use is bounded by the number of processes.
+
+Stores are passed to the worker processes with every tile, so that the
+destination store of every tile is created (by the parent process) with current
+credentials, which are refreshed after a fixed time (see `CredentialRefresher`),
+rather than after a fixed number of tiles.
+
+Converted tiles are recorded in a manifest (a JSON Lines file, see `Manifest`),
+so that re-running the conversion skips them, as it does tiles already present
+in the destination store (listed once, rather than checked one at a time).
+
+Any obstore stores may be used (e.g., `LocalStore` for both stores, in tests).
+
+Example (see `glad_cogs.ipynb`):
+
+    from glad_cogs import CredentialRefresher, convert_tiles, maap_s3_store
+
+    refresher = CredentialRefresher(lambda: maap_s3_store(maap))
+    stats = convert_tiles(orig_store, orig_paths, refresher, "shared/me/hansen")
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
+
+import obstore as obs
+
+logger = logging.getLogger(__name__)
+
+ObjectStore = Any
+
+# GDAL configuration of `cog_translate`, except for the number of threads, which
+# is the number of CPUs divided among the worker processes
+COG_CONFIG = dict(
+    GDAL_TIFF_INTERNAL_MASK=True,
+    GDAL_TIFF_OVR_BLOCKSIZE="128",
+)
+
+# Size of the chunks of tiles streamed from the source store
+CHUNK_SIZE = 8 * 2**20
+
+
+@dataclass
+class TileResult:
+    src_path: str
+    dst_path: str
+    bytes_in: int = 0
+    bytes_out: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class Stats:
+    converted: int = 0
+    skipped: int = 0
+    failed: List[str] = field(default_factory=list)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    seconds: float = 0.0
+
+
+class CredentialRefresher:
+    """Returns a destination store created by `create_store` (e.g., an `S3Store`
+    with temporary workspace credentials), creating a new one once the current
+    one is older than `max_age` seconds (i.e., well before its credentials
+    expire).
+    """
+
+    def __init__(
+        self, create_store: Callable[[], ObjectStore], max_age: float = 30 * 60
+    ):
+        self.create_store = create_store
+        self.max_age = max_age
+        self._store: Optional[ObjectStore] = None
+        self._created = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> ObjectStore:
+        with self._lock:
+            now = time.monotonic()
+
+            if self._store is None or now - self._created >= self.max_age:
+                logger.info("refreshing destination store credentials")
+                self._store = self.create_store()
+                self._created = now
+
+            return self._store
+
+
+class Manifest:
+    """Set of the destination paths of converted tiles, persisted as a JSON Lines
+    file of `TileResult`s, appended to as tiles are converted (so that it survives
+    interrupted runs).
+
+    A run interrupted while appending to the manifest may leave a truncated last
+    line, which is removed (with a warning), as its tile was never recorded.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = Path(path)
+        self.paths: Set[str] = set()
+
+        if self.path.exists():
+            self._load()
+
+    def _load(self) -> None:
+        lines = self.path.read_bytes().splitlines(keepends=True)
+        valid, ended = 0, True
+
+        for i, line in enumerate(lines):
+            try:
+                if line.strip():
+                    self.paths.add(json.loads(line)["dst_path"])
+            except json.JSONDecodeError:
+                if i < len(lines) - 1:
+                    raise
+
+                logger.warning(f"ignoring truncated last line of manifest {self.path}")
+                break
+
+            valid, ended = valid + len(line), line.endswith(b"\n")
+
+        # Remove any truncated last line, and end the last line, so that the next
+        # result is appended to a line of its own
+        with self.path.open("r+b") as f:
+            f.truncate(valid)
+
+            if not ended:
+                f.seek(valid)
+                f.write(b"\n")
+
+    def __contains__(self, dst_path: str) -> bool:
+        return dst_path in self.paths
+
+    def add(self, result: TileResult) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self.path.open("a") as f:
+            f.write(json.dumps(asdict(result)) + "\n")
+
+        self.paths.add(result.dst_path)
+
+
+def maap_s3_store(maap, region: str = "us-west-2") -> ObjectStore:
+    """Return an `S3Store` of the MAAP workspace bucket, with temporary
+    credentials of the workspace.
+    """
+    from obstore.store import S3Store
+
+    creds = maap.aws.workspace_bucket_credentials()
+
+    return S3Store(
+        creds["aws_bucket_name"],
+        access_key_id=creds["aws_access_key_id"],
+        secret_access_key=creds["aws_secret_access_key"],
+        token=creds["aws_session_token"],
+        region=region,
+    )
+
+
+def existing_paths(store: ObjectStore, prefix: str) -> Set[str]:
+    """Return the paths of the objects in a store under a prefix.
+
+    Uploads are multipart, so objects exist only once completely uploaded.
+    """
+    return {
+        obj["path"]
+        for batch in obs.list(store, prefix=prefix, chunk_size=1000)
+        for obj in batch
+    }
+
+
+def convert_to_cog(
+    src_path: str,
+    src_store: ObjectStore,
+    dst_path: str,
+    dst_store: ObjectStore,
+    profile: str = "deflate",
+    num_threads: Union[int, str] = "ALL_CPUS",
+    tmp_dir: Optional[str] = None,
+) -> TileResult:
+    """Stream a file from a store to a temporary file, convert it to a COG (in
+    another temporary file), and upload the COG to another store.
+    """
+    import rasterio
+    from rio_cogeo.cogeo import cog_translate
+    from rio_cogeo.profiles import cog_profiles
+
+    start = time.perf_counter()
+    config = dict(COG_CONFIG, GDAL_NUM_THREADS=str(num_threads))
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as tmp:
+        src_file = Path(tmp) / "src.tif"
+        dst_file = Path(tmp) / "dst.tif"
+
+        with src_file.open("wb") as f:
+            for chunk in obs.get(src_store, src_path).stream(min_chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+
+        with rasterio.open(src_file) as src:
+            cog_translate(
+                src,
+                str(dst_file),
+                cog_profiles.get(profile),
+                in_memory=False,
+                quiet=True,
+                config=config,
+            )
+
+        obs.put(dst_store, dst_path, dst_file)
+
+        return TileResult(
+            src_path,
+            dst_path,
+            src_file.stat().st_size,
+            dst_file.stat().st_size,
+            time.perf_counter() - start,
+        )
+
+
+def _convert_with_retries(retries: int, *args, **kwargs) -> TileResult:
+    attempt = 0
+
+    while True:
+        try:
+            return convert_to_cog(*args, **kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+
+            time.sleep(min(2**attempt, 30))
+            attempt += 1
+
+
+def convert_tiles(
+    src_store: ObjectStore,
+    src_paths: Iterable[str],
+    dst_store: Union[ObjectStore, Callable[[], ObjectStore]],
+    dst_prefix: str = "",
+    manifest: Optional[Union[str, os.PathLike]] = "manifest.jsonl",
+    skip_existing: bool = True,
+    max_workers: Optional[int] = None,
+    retries: int = 2,
+    profile: str = "deflate",
+    tmp_dir: Optional[str] = None,
+    report_interval: float = 30.0,
+) -> Stats:
+    """Convert tiles (by their source paths) to COGs, writing each to the
+    destination path `<dst_prefix><src_path>`, with a pool of `max_workers`
+    processes (by default, the number of CPUs), each converting one tile at a time.
+
+    `dst_store` is either a store or a callable returning a store (such as a
+    `CredentialRefresher`), called for every tile as it is submitted.  Tiles in the
+    manifest (when given), or already in the destination store (when
+    `skip_existing`), are skipped.  Tiles that fail to convert (after `retries`
+    retries) are logged and reported in the returned stats, but are not recorded
+    in the manifest, so that re-running the conversion retries them.
+    """
+    get_dst_store = dst_store if callable(dst_store) else lambda: dst_store
+    done = Manifest(manifest) if manifest else None
+    max_workers = max_workers or os.cpu_count() or 1
+    num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+    stats = Stats()
+    pending = []
+
+    existing = existing_paths(get_dst_store(), dst_prefix) if skip_existing else set()
+
+    for src_path in src_paths:
+        dst_path = f"{dst_prefix}{src_path}"
+
+        if (done is not None and dst_path in done) or dst_path in existing:
+            stats.skipped += 1
+        else:
+            pending.append((src_path, dst_path))
+
+    logger.info(
+        f"converting {len(pending)} tiles with {max_workers} processes"
+        f" ({stats.skipped} already converted)"
+    )
+
+    start = reported = time.perf_counter()
+    in_flight: Dict[Future, str] = {}
+    tasks = iter(pending)
+
+    def report() -> None:
+        elapsed = time.perf_counter() - start
+        rate = max(elapsed, 1e-9)
+        logger.info(
+            f"converted {stats.converted}/{len(pending)} tiles in {elapsed:.0f}s"
+            f" ({stats.converted / rate:.2f} tiles/s,"
+            f" {stats.bytes_in / rate / 1e6:.1f} MB/s in,"
+            f" {stats.bytes_out / rate / 1e6:.1f} MB/s out),"
+            f" {len(stats.failed)} failed"
+        )
+
+    # Worker processes are spawned, rather than forked, as forking a process
+    # running obstore's (multithreaded) runtime is not safe
+    with ProcessPoolExecutor(max_workers, mp_context=get_context("spawn")) as pool:
+        while True:
+            # Keep up to 2 tiles per process in flight, so that each tile's
+            # destination store (and its credentials) is created shortly before
+            # the tile is converted
+            while len(in_flight) < 2 * max_workers:
+                if (task := next(tasks, None)) is None:
+                    break
+
+                src_path, dst_path = task
+                future = pool.submit(
+                    _convert_with_retries,
+                    retries,
+                    src_path,
+                    src_store,
+                    dst_path,
+                    get_dst_store(),
+                    profile,
+                    num_threads,
+                    tmp_dir,
+                )
+                in_flight[future] = src_path
+
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                src_path = in_flight.pop(future)
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"failed to convert {src_path}: {e}")
+                    stats.failed.append(src_path)
+                    continue
+
+                stats.converted += 1
+                stats.bytes_in += result.bytes_in
+                stats.bytes_out += result.bytes_out
+
+                if done is not None:
+                    done.add(result)
+
+            if time.perf_counter() - reported >= report_interval:
+                reported = time.perf_counter()
+                report()
+
+    stats.seconds = time.perf_counter() - start
+    report()
+
+    return stats
@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+import rasterio
+from obstore.store import LocalStore
+from rasterio.transform import from_origin
+
+from glad_cogs import Manifest, TileResult, convert_tiles
+
+TILES = ["2020/50N_010E.tif", "2020/50N_020E.tif"]
+
+
+@pytest.fixture
+def src_store(tmp_path: Path) -> LocalStore:
+    root = tmp_path / "src"
+
+    for i, tile in enumerate(TILES):
+        path = root / tile
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profile = dict(
+            driver="GTiff",
+            width=64,
+            height=64,
+            count=1,
+            dtype="uint8",
+            crs="EPSG:4326",
+            transform=from_origin(10 * (i + 1), 50, 0.01, 0.01),
+        )
+
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(np.full((1, 64, 64), i, dtype="uint8"))
+
+    return LocalStore(root)
+
+
+def test_convert_tiles_resumes(src_store: LocalStore, tmp_path: Path) -> None:
+    (tmp_path / "dst").mkdir()
+    dst_store = LocalStore(tmp_path / "dst")
+    manifest = tmp_path / "manifest.jsonl"
+
+    stats = convert_tiles(
+        src_store, TILES, dst_store, "cogs/", manifest=manifest, max_workers=1
+    )
+
+    assert (stats.converted, stats.skipped, stats.failed) == (2, 0, [])
+    assert Manifest(manifest).paths == {f"cogs/{tile}" for tile in TILES}
+
+    with rasterio.open(tmp_path / "dst" / "cogs" / TILES[1]) as src:
+        assert src.read(1).max() == 1
+
+    stats = convert_tiles(
+        src_store, TILES, dst_store, "cogs/", manifest=manifest, max_workers=1
+    )
+
+    assert (stats.converted, stats.skipped, stats.failed) == (0, 2, [])
+
+
+def test_manifest_truncated_last_line(tmp_path: Path) -> None:
+    path = tmp_path / "manifest.jsonl"
+    first = json.dumps(dict(src_path="a", dst_path="cogs/a")) + "\n\n"
+    path.write_text(first + '{"src_path": "b", "dst_pa')
+
+    manifest = Manifest(path)
+    manifest.add(TileResult("c", "cogs/c"))
+
+    assert manifest.paths == {"cogs/a", "cogs/c"}
+    assert Manifest(path).paths == {"cogs/a", "cogs/c"}
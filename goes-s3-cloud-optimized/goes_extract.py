@@ -0,0 +1,224 @@
+"""Concurrent extraction of AOI time series from GOES netCDF files in S3.
+
+Reading a small window of a variable of a GOES file through GDAL (see the
+notebook) costs a few small range requests, so extracting a time series from many
+files, one file and variable at a time, is dominated by request latency.  This
+module reads the windows of many (key, variable) pairs concurrently, with a
+bounded number of threads (GDAL releases the GIL while reading), and stacks them
+into an `xarray.Dataset` with a time dimension (`t`), which may be written to (or
+appended to) a Zarr store.
+
+The AOI is given as a lon/lat bounding box, and converted to a pixel window of
+each distinct grid (CRS, transform, and shape) only once, rather than once per
+file.
+
+Example:
+
+    from goes_extract import extract, list_keys
+
+    keys = list_keys("noaa-goes16", "ABI-L2-MCMIPF", "2019-09-26T00", "2019-09-28T00")
+    ds = extract("noaa-goes16", keys, ["CMI_C08", "DQF_C08"], (-95, 30, -85, 38))
+    ds.to_zarr("goes.zarr")
+"""
+
+import functools
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+import rasterio.windows
+import xarray as xr
+from rasterio.transform import rowcol
+from rasterio.warp import transform_bounds
+
+# GDAL configuration for reading small windows of public GOES files in S3
+GDAL_ENV = {
+    "AWS_NO_SIGN_REQUEST": "YES",
+    "AWS_REGION": "us-east-1",
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".nc",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "VSI_CACHE": "TRUE",
+}
+
+# Start and end times of a scan, as encoded in GOES file names
+# (e.g., `..._s20192691200244_e20192691209558_...`)
+SCAN_TIME_PATTERN = re.compile(r"_s(\d{13})(\d)_e(\d{13})(\d)_")
+
+Bounds = Tuple[float, float, float, float]
+Grid = Tuple[str, Tuple[float, ...], int, int]
+
+
+def create_vsi_uri(bucket: str, key: str, variable: str) -> str:
+    return f'NETCDF:"/vsis3/{bucket}/{key}":{variable}'
+
+
+def scan_time(key: str) -> np.datetime64:
+    """Return the middle of the scan of a GOES file, from the file's name.
+
+    >>> print(scan_time("OR_ABI-L2-MCMIPF-M6_G16_s20192691200244_e20192691209558_c.nc"))
+    2019-09-26T12:05:10.100
+    """
+    if not (match := SCAN_TIME_PATTERN.search(key)):
+        raise ValueError(f"No scan times in GOES key: {key}")
+
+    start, end = (
+        datetime.strptime(digits, "%Y%j%H%M%S") + timedelta(seconds=int(tenths) / 10)
+        for digits, tenths in (match.group(1, 2), match.group(3, 4))
+    )
+
+    return np.datetime64(start + (end - start) / 2, "ms")
+
+
+@functools.lru_cache(maxsize=None)
+def _grid_window(grid: Grid, aoi: Bounds) -> rasterio.windows.Window:
+    crs, transform_coefficients, width, height = grid
+    transform = rasterio.Affine(*transform_coefficients)
+    left, bottom, right, top = transform_bounds("EPSG:4326", crs, *aoi, densify_pts=21)
+    rows, cols = rowcol(transform, [left, right], [top, bottom])
+    window = rasterio.windows.Window.from_slices(
+        (min(rows), max(rows) + 1), (min(cols), max(cols) + 1)
+    )
+
+    return window.intersection(rasterio.windows.Window(0, 0, width, height))
+
+
+def aoi_window(src, aoi: Bounds) -> rasterio.windows.Window:
+    """Return the pixel window of a dataset's grid covering a lon/lat bounding box
+    (`min_lon, min_lat, max_lon, max_lat`), computed once per distinct grid.
+    """
+    grid = (src.crs.to_wkt(), tuple(src.transform)[:6], src.width, src.height)
+
+    return _grid_window(grid, tuple(aoi))
+
+
+def read_window(uri: str, aoi: Bounds) -> Tuple[np.ndarray, Dict]:
+    """Read the window of a (single band) raster covering an AOI, as float32 in
+    the variable's native units (applying its scale and offset), with nodata
+    values as NaN.  Return the values, along with the profile of the window.
+    """
+    with rasterio.open(uri) as src:
+        window = aoi_window(src, aoi)
+        values = src.read(1, window=window, masked=True).astype(np.float32)
+        scale, offset = src.scales[0], src.offsets[0]
+        profile = dict(
+            crs=src.crs,
+            transform=src.window_transform(window),
+            width=int(window.width),
+            height=int(window.height),
+        )
+
+    values = (values * scale + offset).filled(np.nan).astype(np.float32, copy=False)
+
+    return values, profile
+
+
+def extract(
+    bucket: str,
+    keys: Sequence[str],
+    variables: Sequence[str],
+    aoi: Bounds,
+    max_workers: int = 32,
+    uri: Callable[[str, str, str], str] = create_vsi_uri,
+    time: Callable[[str], np.datetime64] = scan_time,
+    gdal_env: Optional[Dict[str, str]] = None,
+) -> xr.Dataset:
+    """Read the AOI windows of variables of many files concurrently (with at most
+    `max_workers` reads in flight), and stack them into a dataset with `t`, `y`,
+    and `x` dimensions, ordered by time (as given by `time`, from each key).
+
+    All files must have the same grid (as do the files of a GOES product).
+    """
+    env = {**GDAL_ENV, **(gdal_env or {})}
+
+    def read(task: Tuple[str, str]) -> Tuple[np.ndarray, Dict]:
+        key, variable = task
+
+        # GDAL environments are thread-local, so each read enters its own
+        with rasterio.Env(**env):
+            return read_window(uri(bucket, key, variable), aoi)
+
+    keys = sorted(keys, key=time)
+    tasks = [(key, variable) for variable in variables for key in keys]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(read, tasks))
+
+    if not results:
+        raise ValueError("No keys or variables to extract")
+
+    profile = results[0][1]
+    n = len(keys)
+    data_vars = {
+        variable: (
+            ("t", "y", "x"),
+            np.stack([values for values, _ in results[i * n : (i + 1) * n]]),
+        )
+        for i, variable in enumerate(variables)
+    }
+    transform = profile["transform"]
+    x = transform.c + transform.a * (np.arange(profile["width"]) + 0.5)
+    y = transform.f + transform.e * (np.arange(profile["height"]) + 0.5)
+
+    return xr.Dataset(
+        data_vars,
+        coords=dict(t=[time(key) for key in keys], y=y, x=x),
+        attrs=dict(crs=profile["crs"].to_wkt()),
+    )
+
+
+def extract_to_zarr(
+    store,
+    bucket: str,
+    keys: Sequence[str],
+    variables: Sequence[str],
+    aoi: Bounds,
+    batch_size: int = 96,
+    **kwargs,
+) -> None:
+    """Extract (see `extract`) batches of keys in time order, appending each batch
+    to a Zarr store along `t`, so that memory use is bounded by the batch size.
+    """
+    scan_time_of = kwargs.get("time", scan_time)
+    keys = sorted(keys, key=scan_time_of)
+
+    for i in range(0, len(keys), batch_size):
+        ds = extract(bucket, keys[i : i + batch_size], variables, aoi, **kwargs)
+        ds.to_zarr(store, **({"append_dim": "t"} if i else {"mode": "w"}))
+
+
+def list_keys(
+    bucket: str,
+    product: str,
+    start: str,
+    end: str,
+    max_workers: int = 16,
+) -> List[str]:
+    """List the keys of the files of a product within the hours from `start` to
+    `end` (ISO 8601 date-times, e.g., `2019-09-26T12`, end exclusive), listing the
+    hourly prefixes (`<product>/<year>/<doy>/<hour>/`) concurrently.
+    """
+    import obstore
+    from obstore.store import from_url
+
+    store = from_url(f"s3://{bucket}/", region="us-east-1", skip_signature=True)
+    hour = datetime.fromisoformat(start).replace(minute=0, second=0, microsecond=0)
+    prefixes = []
+
+    while hour < datetime.fromisoformat(end):
+        prefixes.append(f"{product}/{hour:%Y/%j/%H}/")
+        hour += timedelta(hours=1)
+
+    def list_prefix(prefix: str) -> List[str]:
+        return [
+            obj["path"]
+            for batch in obstore.list(store, prefix=prefix, chunk_size=1000)
+            for obj in batch
+        ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return [key for keys in pool.map(list_prefix, prefixes) for key in keys]
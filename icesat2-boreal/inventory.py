@@ -0,0 +1,137 @@
+"""Listing of the ICESat-2 Boreal tifs in S3, and the inventory of the tifs that
+items were generated from (used by item-gen.py to regenerate only the items of new
+or changed tifs).
+"""
+
+import itertools
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import boto3
+import smart_open
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class S3Object:
+    url: str
+    etag: str
+
+
+def list_shards(
+    s3_client, bucket: str, prefix: str, depth: int
+) -> Tuple[List[str], List[str]]:
+    """Find the sub-prefixes `depth` levels below prefix (e.g., `agb/0003543/` for
+    depth 2), to list concurrently.
+
+    Return the sub-prefixes (shards), along with the intermediate prefixes visited
+    on the way to them, which must also be listed (non-recursively) to find any
+    objects that are not within any shard.
+    """
+    shards, levels = [prefix], []
+    paginator = s3_client.get_paginator("list_objects_v2")
+
+    for _ in range(depth):
+        next_shards = [
+            common["Prefix"]
+            for shard in shards
+            for page in paginator.paginate(Bucket=bucket, Prefix=shard, Delimiter="/")
+            for common in page.get("CommonPrefixes", [])
+        ]
+        if not next_shards:
+            break
+        levels.extend(shards)
+        shards = next_shards
+
+    return shards, levels
+
+
+def scan_s3_files(
+    bucket: str,
+    prefix: str,
+    filename_regex: str,
+    shard_depth: int = 1,
+    max_workers: int = 32,
+    s3_client=None,
+) -> List[S3Object]:
+    """Scan S3 bucket for files matching the given regex pattern within specified prefix.
+
+    The listing is sharded by the sub-prefixes `shard_depth` levels below `prefix`,
+    which are listed concurrently.
+    """
+    s3_client = s3_client or boto3.client("s3")
+    pattern = re.compile(filename_regex)
+
+    def list_prefix(prefix: str, recursive: bool) -> List[S3Object]:
+        paginator = s3_client.get_paginator("list_objects_v2")
+        delimiter = {} if recursive else {"Delimiter": "/"}
+        return [
+            S3Object(f"s3://{bucket}/{obj['Key']}", obj["ETag"].strip('"'))
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix, **delimiter)
+            for obj in page.get("Contents", [])
+            # Match against filename only
+            if pattern.match(obj["Key"].rsplit("/", 1)[-1])
+        ]
+
+    shards, levels = list_shards(s3_client, bucket, prefix, shard_depth)
+    logger.info(f"listing {len(shards)} shard(s) of s3://{bucket}/{prefix}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        listings = itertools.chain(
+            executor.map(lambda shard: list_prefix(shard, True), shards),
+            executor.map(lambda level: list_prefix(level, False), levels),
+        )
+        return sorted(itertools.chain.from_iterable(listings), key=lambda obj: obj.url)
+
+
+def read_inventory(inventory_key: str, s3_client=None) -> Dict[str, Dict[str, str]]:
+    try:
+        with smart_open.open(
+            inventory_key,
+            "rt",
+            transport_params={"client": s3_client or boto3.client("s3")},
+        ) as fin:
+            return json.load(fin)
+    except (OSError, ClientError):
+        return {}
+
+
+def write_inventory(
+    inventory: Dict[str, Dict[str, str]], inventory_key: str, s3_client=None
+) -> None:
+    with smart_open.open(
+        inventory_key,
+        "wt",
+        transport_params={"client": s3_client or boto3.client("s3")},
+    ) as fout:
+        json.dump(inventory, fout)
+
+
+def diff_inventory(
+    objects: List[S3Object],
+    previous: Dict[str, Dict[str, str]],
+    items: Dict[str, Dict[str, Any]],
+) -> Tuple[List[S3Object], List[Dict[str, Any]]]:
+    """Split an inventory into the objects whose items must be (re)generated and
+    the existing items that can be kept as they are.
+
+    An item is kept only when its tif is still in the inventory with the same ETag
+    as when the item was generated, and the item is still in items.ndjson.  Items
+    of tifs no longer in the inventory are dropped.
+    """
+    changed, unchanged = [], []
+
+    for obj in objects:
+        entry = previous.get(obj.url)
+        if entry and entry["etag"] == obj.etag and entry["id"] in items:
+            unchanged.append(items[entry["id"]])
+        else:
+            changed.append(obj)
+
+    return changed, unchanged
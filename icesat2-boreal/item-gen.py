@@ -4,25 +4,43 @@
 #     "boto3",
 #     "coiled",
 #     "icesat2-boreal-stac",
-#     "smart-open",
+#     "smart-open[s3,zst]",
+#     "stac-geoparquet",
 #     "tqdm",
 # ]
 #
 # [tool.uv.sources]
 # icesat2-boreal-stac = { git = "https://github.com/MAAP-project/icesat2-boreal-stac.git", rev = "0.2.3" }
 # ///
+"""Generate STAC items for the ICESat-2 Boreal tifs in S3, writing them to ndjson.
 
+By default, items are generated only for tifs that are new or changed (by ETag)
+since the previous run, as recorded in an inventory written next to the items.
+"""
+
+import argparse
+import contextlib
+import functools
+import itertools
 import json
 import logging
-import re
-from typing import Any, Dict, List
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 from urllib.parse import urlparse
 
 import boto3
-import coiled
 import smart_open
+import tqdm
+from botocore.exceptions import ClientError
 from icesat2_boreal_stac.stac import create_item
 
+from inventory import diff_inventory, read_inventory, scan_s3_files, write_inventory
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
@@ -32,33 +50,36 @@ logger = logging.getLogger(__name__)
 
 S3_ASSET_PATH = "s3://nasa-maap-data-store/file-staging/nasa-map/icesat2-boreal-v2.1/"
 ITEMS_NDJSON_KEY = (
-    "s3://maap-ops-workspace/henrydevseed/icesat2-boreal-v2.1/items.ndjson"
+    "s3://maap-ops-workspace/henrydevseed/icesat2-boreal-v2.1/items.ndjson.zst"
+)
+# url -> {"etag": ..., "id": ...} for every tif that items.ndjson was generated from
+INVENTORY_KEY = (
+    "s3://maap-ops-workspace/henrydevseed/icesat2-boreal-v2.1/inventory.json"
 )
 
+# GDAL configuration for reading only what item generation needs from a COG: its
+# header (in a single initial range request) and overviews (for statistics), via
+# range requests, without listing "directories" or opening whole objects.
+GDAL_COG_ENV = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
+    "GDAL_INGESTED_BYTES_AT_OPEN": "32768",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "VSI_CACHE": "TRUE",
+}
 
-def scan_s3_files(bucket: str, prefix: str, filename_regex: str) -> List[str]:
-    """Scan S3 bucket for files matching the given regex pattern within specified prefix."""
-    s3_client = boto3.client("s3")
-    matching_files = []
-    paginator = s3_client.get_paginator("list_objects_v2")
-
-    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-        if "Contents" not in page:
-            continue
-
-        # Check each object against the regex pattern
-        for obj in page["Contents"]:
-            key = obj["Key"]
-            if re.match(
-                filename_regex, key.split("/")[-1]
-            ):  # Match against filename only
-                matching_files.append(f"s3://{bucket}/{key}")
 
-    return matching_files
+class Executor(str, Enum):
+    process = "process"
+    thread = "thread"
+    coiled = "coiled"
 
 
-@coiled.function(region="us-west-2", threads_per_worker=-1, n_workers=[0, 100])
 def _create_item(key: str) -> Dict[str, Any]:
+    for name, value in GDAL_COG_ENV.items():
+        os.environ.setdefault(name, value)
+
     item = create_item(key)
     variable = "ht" if item.id.startswith("boreal_ht") else "agb"
     item_dict = item.to_dict()
@@ -67,25 +88,205 @@ def _create_item(key: str) -> Dict[str, Any]:
     return item_dict
 
 
-def write_ndjson(items: List[Dict[str, Any]], ndjson_key: str) -> None:
-    s3_client = boto3.client("s3")
-    with smart_open.open(
-        ndjson_key,
-        "wt",
-        encoding="utf-8",
-        transport_params={"client": s3_client},
-    ) as fout:
-        count = 0
-        for item in items:
-            fout.write(json.dumps(item) + "\n")
-            count += 1
+def _create_item_with_retries(key: str, retries: int) -> Dict[str, Any]:
+    for attempt in range(retries + 1):
+        try:
+            return _create_item(key)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = 2**attempt
+            logger.warning(f"retrying {key} in {delay}s after error: {e}")
+            time.sleep(delay)
+
+    raise AssertionError("unreachable")
+
+
+def create_items(
+    keys: List[str],
+    executor: Executor = Executor.process,
+    max_workers: Optional[int] = None,
+    retries: int = 2,
+) -> Iterator[Dict[str, Any]]:
+    """Create the items of the given keys, in order, yielding them as they are
+    created (with a progress bar).
+
+    Items are created by a local process or thread pool, or by a coiled cluster.
+    Creating an item is retried (with exponential backoff) up to `retries` times.
+    """
+    create = functools.partial(_create_item_with_retries, retries=retries)
+    start = time.perf_counter()
+
+    with contextlib.ExitStack() as stack:
+        if executor is Executor.coiled:
+            import coiled
+
+            function = coiled.function(
+                region="us-west-2", threads_per_worker=-1, n_workers=[0, 100]
+            )(create)
+            results = function.map(keys)
+        else:
+            pool_type = (
+                ProcessPoolExecutor
+                if executor is Executor.process
+                else ThreadPoolExecutor
+            )
+            pool = stack.enter_context(pool_type(max_workers=max_workers))
+            results = pool.map(create, keys)
+
+        yield from tqdm.tqdm(results, total=len(keys), unit="item")
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"created {len(keys)} items in {elapsed:.1f}s"
+        f" ({len(keys) / max(elapsed, 1e-9):.1f} items/s, {executor.value})"
+    )
+
+
+def read_ndjson(ndjson_key: str, s3_client=None) -> Dict[str, Dict[str, Any]]:
+    """Read items previously written by `write_ndjson`, keyed by id (if any)."""
+    try:
+        with smart_open.open(
+            ndjson_key,
+            "rt",
+            encoding="utf-8",
+            transport_params={"client": s3_client or boto3.client("s3")},
+        ) as fin:
+            items = (json.loads(line) for line in fin if line.strip())
+            return {item["id"]: item for item in items}
+    except (OSError, ClientError):
+        logger.info(f"no existing items found at {ndjson_key}")
+        return {}
+
+
+def write_geoparquet(ndjson_path: str, geoparquet_key: str, s3_client=None) -> None:
+    """Convert a local ndjson file of items to STAC-GeoParquet, for bulk loading."""
+    # Imported here, since STAC-GeoParquet output is optional
+    from stac_geoparquet.arrow import parse_stac_ndjson_to_parquet
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        parquet_path = os.path.join(tmpdir, "items.parquet")
+        parse_stac_ndjson_to_parquet(ndjson_path, parquet_path)
+
+        with open(parquet_path, "rb") as fin, smart_open.open(
+            geoparquet_key,
+            "wb",
+            transport_params={"client": s3_client or boto3.client("s3")},
+        ) as fout:
+            shutil.copyfileobj(fin, fout)
+
+    logger.info(f"wrote STAC-GeoParquet items to {geoparquet_key}")
 
-    logger.info(f"wrote {count} items to {ndjson_key}")
+
+def write_ndjson(
+    items: Iterable[Dict[str, Any]],
+    ndjson_key: str,
+    s3_client=None,
+    batch_size: int = 1000,
+    geoparquet_key: Optional[str] = None,
+) -> int:
+    """Write items to ndjson as they are produced, in batches of `batch_size`.
+
+    The file is compressed according to the extension of `ndjson_key` (e.g.,
+    `.zst` or `.gz`), and is uploaded to S3 in parts as it is written, so only a
+    single batch of items is held in memory at once.  When `geoparquet_key` is
+    given, the items are also written to STAC-GeoParquet.
+    """
+    s3_client = s3_client or boto3.client("s3")
+    count = 0
+
+    with contextlib.ExitStack() as stack:
+        # Also spool the items to a local (uncompressed) ndjson file, from which
+        # the GeoParquet file is written (in chunks) once the ndjson is written.
+        spool = (
+            stack.enter_context(
+                tempfile.NamedTemporaryFile("w+t", suffix=".ndjson", encoding="utf-8")
+            )
+            if geoparquet_key
+            else None
+        )
+
+        with smart_open.open(
+            ndjson_key,
+            "wt",
+            encoding="utf-8",
+            transport_params={"client": s3_client},
+        ) as fout:
+            for batch in itertools.batched(items, batch_size):
+                lines = "".join(json.dumps(item) + "\n" for item in batch)
+                fout.write(lines)
+                count += len(batch)
+
+                if spool:
+                    spool.write(lines)
+
+        logger.info(f"wrote {count} items to {ndjson_key}")
+
+        if spool and geoparquet_key:
+            spool.flush()
+            write_geoparquet(spool.name, geoparquet_key, s3_client)
+
+    return count
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="regenerate items for every tif, rather than only for new or changed"
+        " tifs (by ETag) since the previous run",
+    )
+    parser.add_argument(
+        "--shard-depth",
+        type=int,
+        default=1,
+        help="list S3 concurrently by the sub-prefixes this many levels below the"
+        " asset path",
+    )
+    parser.add_argument(
+        "--geoparquet",
+        metavar="KEY",
+        help="also write the items to STAC-GeoParquet at this S3 key (or local path),"
+        " for bulk loading",
+    )
+    parser.add_argument(
+        "--executor",
+        type=Executor,
+        choices=list(Executor),
+        default=Executor.coiled,
+        help="where to create items: a local process pool, a local thread pool, or a"
+        " coiled cluster (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        help="number of local workers (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="number of times to retry creating an item (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--endpoint-url",
+        help="S3 endpoint URL (e.g., of a local S3 stand-in, for benchmarking)",
+    )
+    args = parser.parse_args()
+
+    if args.endpoint_url:
+        # Inherited by local workers: AWS_ENDPOINT_URL for boto3, and the others
+        # for GDAL (which expects the endpoint without its scheme)
+        endpoint = urlparse(args.endpoint_url)
+        os.environ["AWS_ENDPOINT_URL"] = args.endpoint_url
+        os.environ["AWS_S3_ENDPOINT"] = endpoint.netloc
+        os.environ["AWS_HTTPS"] = "YES" if endpoint.scheme == "https" else "NO"
+        os.environ["AWS_VIRTUAL_HOSTING"] = "FALSE"
+
     # Parse S3 path
     s3_url = urlparse(S3_ASSET_PATH)
+    s3_client = boto3.client("s3", endpoint_url=args.endpoint_url)
 
     bucket = s3_url.netloc
     prefix = s3_url.path.lstrip("/")
@@ -94,17 +295,53 @@ def main():
         bucket=bucket,
         prefix=prefix,
         filename_regex=r".*\.tif$",
+        shard_depth=args.shard_depth,
+        s3_client=s3_client,
     )
 
     logger.info(f"found {len(inventory)} files")
     with open("/tmp/inventory.txt", "w") as f:
-        for key in inventory:
-            f.write(key + "\n")
+        for obj in inventory:
+            f.write(obj.url + "\n")
 
-    logger.info("generating item metadata")
-    _items = _create_item.map(inventory)
+    previous = {} if args.full else read_inventory(INVENTORY_KEY, s3_client)
+    items = {} if args.full else read_ndjson(ITEMS_NDJSON_KEY, s3_client)
+    changed, unchanged = diff_inventory(inventory, previous, items)
 
-    write_ndjson(_items, ndjson_key=ITEMS_NDJSON_KEY)
+    logger.info(
+        f"generating item metadata for {len(changed)} new or changed files"
+        f" (keeping {len(unchanged)} unchanged items)"
+    )
+    inventory_entries = {
+        url: previous[url]
+        for url in {obj.url for obj in inventory} - {obj.url for obj in changed}
+    }
+
+    def record(new_items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        # Items are created in the same order as their keys
+        for obj, item in zip(changed, new_items, strict=True):
+            inventory_entries[obj.url] = {"etag": obj.etag, "id": item["id"]}
+            yield item
+
+    # Stream new items to the writer as they are produced, and avoid starting a
+    # cluster when there is nothing to generate
+    new_items = (
+        create_items(
+            [obj.url for obj in changed],
+            args.executor,
+            args.max_workers,
+            args.retries,
+        )
+        if changed
+        else []
+    )
+    write_ndjson(
+        itertools.chain(unchanged, record(new_items)),
+        ITEMS_NDJSON_KEY,
+        s3_client,
+        geoparquet_key=args.geoparquet,
+    )
+    write_inventory(inventory_entries, INVENTORY_KEY, s3_client)
 
 
 if __name__ == "__main__":
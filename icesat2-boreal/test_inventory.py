@@ -0,0 +1,103 @@
+from typing import Iterator
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from inventory import (
+    S3Object,
+    diff_inventory,
+    list_shards,
+    read_inventory,
+    scan_s3_files,
+    write_inventory,
+)
+
+BUCKET = "boreal-bucket"
+
+KEYS = [
+    "boreal/agb/0001/a.tif",
+    "boreal/agb/0001/a.tif.aux.xml",
+    "boreal/agb/0002/deep/b.tif",
+    "boreal/agb/top.tif",
+    "boreal/ht/0001/c.tif",
+    "boreal/root.tif",
+    "boreal/README.md",
+]
+
+
+@pytest.fixture
+def s3_client(monkeypatch: pytest.MonkeyPatch) -> Iterator:
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    # Recent versions of botocore otherwise send checksums of (multipart) uploads
+    # in chunks, which moto stores as part of the objects
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+
+        for key in KEYS:
+            client.put_object(Bucket=BUCKET, Key=key, Body=key.encode())
+
+        yield client
+
+
+def test_list_shards(s3_client) -> None:
+    shards, levels = list_shards(s3_client, BUCKET, "boreal/", 2)
+
+    assert shards == ["boreal/agb/0001/", "boreal/agb/0002/", "boreal/ht/0001/"]
+    assert levels == ["boreal/", "boreal/agb/", "boreal/ht/"]
+
+
+@pytest.mark.parametrize("shard_depth", [1, 2, 5])
+def test_scan_s3_files_sharded(s3_client, shard_depth: int) -> None:
+    def scan(depth: int):
+        return scan_s3_files(
+            BUCKET, "boreal/", r".*\.tif$", shard_depth=depth, s3_client=s3_client
+        )
+
+    unsharded = scan(0)
+
+    # Objects outside of every shard (in intermediate levels) are found, too
+    assert [obj.url.split("/", 3)[-1] for obj in unsharded] == sorted(
+        key for key in KEYS if key.endswith(".tif")
+    )
+    assert scan(shard_depth) == unsharded
+
+
+def url(name: str) -> str:
+    return f"s3://{BUCKET}/boreal/{name}"
+
+
+def test_diff_inventory(s3_client) -> None:
+    previous = {
+        url("same.tif"): {"etag": "1", "id": "same"},
+        url("changed.tif"): {"etag": "1", "id": "changed"},
+        url("missing.tif"): {"etag": "1", "id": "missing"},
+        url("removed.tif"): {"etag": "1", "id": "removed"},
+    }
+    items = {id_: {"id": id_} for id_ in ("same", "changed", "removed")}
+    objects = [
+        S3Object(url("same.tif"), "1"),
+        S3Object(url("changed.tif"), "2"),
+        S3Object(url("missing.tif"), "1"),
+        S3Object(url("new.tif"), "1"),
+    ]
+
+    # The inventory written by a previous run is read back as it was written
+    write_inventory(previous, f"s3://{BUCKET}/inventory.json", s3_client)
+    previous = read_inventory(f"s3://{BUCKET}/inventory.json", s3_client)
+    changed, unchanged = diff_inventory(objects, previous, items)
+
+    # Items of changed tifs, or missing from the items, are regenerated, and the
+    # item of the removed tif is dropped
+    assert [obj.url for obj in changed] == [
+        url("changed.tif"),
+        url("missing.tif"),
+        url("new.tif"),
+    ]
+    assert unchanged == [{"id": "same"}]
+    assert read_inventory(f"s3://{BUCKET}/missing.json", s3_client) == {}
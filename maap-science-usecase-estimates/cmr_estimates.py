@@ -0,0 +1,317 @@
+"""Estimate the number and total size of the granules matching CMR searches.
+
+CMR results are paged with search-after, which is inherently sequential within a
+search, so to page many granules quickly, searches are partitioned and the
+partitions are paged concurrently:
+
+- every search with multiple temporal ranges (`temporal[]`) is split into one
+  search per range, and
+- every (simple) temporal range is split into `splits` consecutive sub-ranges.
+
+Granules that match more than one partition (e.g., granules spanning the boundary
+of two sub-ranges) are counted only once, by keeping a set of the IDs of the
+granules already counted, which may also be shared across calls to `estimate`
+(e.g., to avoid counting granules matching multiple polygons more than once).
+
+Pages of results may be cached on disk (see `estimate`), so that re-running an
+estimate (e.g., re-running a notebook) does not search CMR again.
+
+Example:
+
+    from cmr_estimates import estimate
+
+    atl08 = estimate(
+        {
+            "collection_concept_id": "C1201746153-NASA_MAAP",
+            "temporal": "2019-04-01T00:00:00Z,2019-10-30T23:59:59Z",
+            "bounding_box": "-180,50,180,75",
+        },
+        host="maap",
+        splits=8,
+    )
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HOSTS = {"maap": "cmr.maap-project.org", "nasa": "cmr.earthdata.nasa.gov"}
+
+# Maximum page size supported by CMR
+PAGE_SIZE = 2000
+
+# Multipliers of the size units of UMM-G `ArchiveAndDistributionInformation`
+SIZE_UNITS = {
+    "B": 1,
+    "KB": 2**10,
+    "MB": 2**20,
+    "GB": 2**30,
+    "TB": 2**40,
+    "PB": 2**50,
+}
+
+Query = Mapping[str, Any]
+
+
+@dataclass
+class Estimate:
+    """Total size (in bytes) and count of granules."""
+
+    total_size: float = 0
+    count: int = 0
+
+    def __add__(self, other: "Estimate") -> "Estimate":
+        return Estimate(self.total_size + other.total_size, self.count + other.count)
+
+
+def granule_sizes(page: Mapping[str, Any], format: str) -> Iterator[Tuple[str, float]]:
+    """Return the IDs and sizes (in bytes) of the granules in a page of results in
+    either the `json` or `umm_json` format.
+
+    In the `json` format, sizes come from `granule_size` (in MB).  In the
+    `umm_json` format (required for collections, such as HLS, that do not report
+    `granule_size`), sizes are the sums of the sizes of the files listed in
+    `DataGranule.ArchiveAndDistributionInformation`, given either by
+    `SizeInBytes`, or by `Size` and `SizeUnit`.
+
+    >>> list(granule_sizes({"feed": {"entry": [
+    ...     {"id": "G1", "producer_granule_id": "a.h5", "granule_size": "1.5"},
+    ...     {"id": "G2", "granule_size": "2"},
+    ... ]}}, "json"))
+    [('a.h5', 1572864.0), ('G2', 2097152.0)]
+    >>> list(granule_sizes({"items": [
+    ...     {"meta": {"concept-id": "G1"}, "umm": {"GranuleUR": "b", "DataGranule": {
+    ...         "ArchiveAndDistributionInformation": [
+    ...             {"Name": "b.tif", "SizeInBytes": 1000},
+    ...             {"Name": "b.xml", "Size": 2, "SizeUnit": "KB"},
+    ...         ]}}},
+    ... ]}, "umm_json"))
+    [('b', 3048.0)]
+    """
+    if format == "umm_json":
+        for item in page.get("items", []):
+            umm = item["umm"]
+            files = umm.get("DataGranule", {}).get(
+                "ArchiveAndDistributionInformation", []
+            )
+            size = sum(
+                float(f["SizeInBytes"])
+                if "SizeInBytes" in f
+                else float(f.get("Size", 0)) * SIZE_UNITS.get(f.get("SizeUnit"), 0)
+                for f in files
+            )
+            yield umm.get("GranuleUR") or item["meta"]["concept-id"], size
+    else:
+        for entry in page.get("feed", {}).get("entry", []):
+            size = float(entry.get("granule_size") or 0) * SIZE_UNITS["MB"]
+            yield entry.get("producer_granule_id") or entry["id"], size
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _format_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def split_temporal(temporal: str, splits: int) -> List[str]:
+    """Split a temporal range (`start,end`) into consecutive sub-ranges (sharing
+    their boundaries, as CMR ranges are inclusive).  Ranges of other forms (e.g.,
+    periodic ranges, or ranges open at either end) are not split.
+
+    >>> for sub_range in split_temporal("2019-01-01T00:00:00Z,2019-01-03T00:00:00Z", 2):
+    ...     print(sub_range)
+    2019-01-01T00:00:00Z,2019-01-02T00:00:00Z
+    2019-01-02T00:00:00Z,2019-01-03T00:00:00Z
+    """
+    parts = temporal.split(",")
+
+    if splits <= 1 or len(parts) != 2 or not all(parts):
+        return [temporal]
+
+    start, end = map(_parse_time, parts)
+    step = (end - start) / splits
+    bounds = [start + step * i for i in range(splits)] + [end]
+
+    return [
+        f"{_format_time(lo)},{_format_time(hi)}" for lo, hi in zip(bounds, bounds[1:])
+    ]
+
+
+def partition(query: Query, splits: int = 1) -> List[Dict[str, Any]]:
+    """Partition a query into queries of single temporal ranges, split into the
+    given number of sub-ranges (see `split_temporal`).
+    """
+    temporals = query.get("temporal[]", query.get("temporal"))
+    base = {k: v for k, v in query.items() if k not in ("temporal", "temporal[]")}
+    base.setdefault("pageSize", PAGE_SIZE)
+
+    if temporals is None:
+        return [base]
+
+    if isinstance(temporals, str):
+        temporals = [temporals]
+
+    return [
+        {**base, "temporal": sub_range}
+        for temporal in temporals
+        for sub_range in split_temporal(temporal, splits)
+    ]
+
+
+class ResponseCache:
+    """On-disk cache of pages of search results, keyed by the URL, query, and
+    search-after value of the request for the page.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url: str, query: Query, search_after: Optional[str]) -> Path:
+        key = json.dumps([url, sorted(query.items()), search_after], default=str)
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def get(
+        self, url: str, query: Query, search_after: Optional[str]
+    ) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        try:
+            cached = json.loads(self._path(url, query, search_after).read_text())
+        except (OSError, ValueError):
+            return None
+
+        return cached["page"], cached["search_after"]
+
+    def put(
+        self,
+        url: str,
+        query: Query,
+        search_after: Optional[str],
+        page: Dict[str, Any],
+        next_search_after: Optional[str],
+    ) -> None:
+        path = self._path(url, query, search_after)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"page": page, "search_after": next_search_after}))
+        tmp.replace(path)
+
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    # Sessions are not guaranteed to be thread-safe, so use one per thread
+    if (session := getattr(_local, "session", None)) is None:
+        retry = Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+        )
+        session = _local.session = requests.Session()
+        session.mount("https://", HTTPAdapter(max_retries=retry))
+
+    return session
+
+
+def pages(
+    url: str, query: Query, cache: Optional[ResponseCache] = None
+) -> Iterator[Dict[str, Any]]:
+    """Return the pages of results of a search, using search-after paging."""
+    search_after = None
+
+    while True:
+        if cache and (cached := cache.get(url, query, search_after)):
+            page, next_search_after = cached
+        else:
+            headers = {"CMR-Search-After": search_after} if search_after else {}
+            response = _session().post(url, data=query, headers=headers)
+            response.raise_for_status()
+            page = response.json()
+            next_search_after = response.headers.get("CMR-Search-After")
+
+            if cache:
+                cache.put(url, query, search_after, page, next_search_after)
+
+        yield page
+
+        if not next_search_after:
+            return
+
+        search_after = next_search_after
+
+
+def estimate(
+    queries: Union[Query, Iterable[Query]],
+    host: str = "maap",
+    format: str = "json",
+    seen: Optional[Set[str]] = None,
+    splits: int = 1,
+    max_workers: int = 8,
+    cache_dir: Optional[Union[str, Path]] = None,
+) -> Estimate:
+    """Estimate the total size and count of the granules matching queries (CMR
+    granule search parameters), searching CMR at the given host (`maap` or `nasa`)
+    in the given format (`json` or `umm_json`; see `granule_sizes`).
+
+    Queries are partitioned (see the module documentation) and partitions are
+    paged concurrently by the given number of workers.  Granules with IDs in
+    `seen` are not counted, and the IDs of counted granules are added to `seen`.
+    When `cache_dir` is given, pages of results are cached in that directory.
+    """
+    url = f"https://{HOSTS.get(host, host)}/search/granules.{format}"
+    cache = ResponseCache(cache_dir) if cache_dir else None
+    seen = set() if seen is None else seen
+    lock = threading.Lock()
+
+    if isinstance(queries, Mapping):
+        queries = [queries]
+
+    partitions = [part for query in queries for part in partition(query, splits)]
+
+    def count(query: Query) -> Estimate:
+        result = Estimate()
+
+        for page in pages(url, query, cache):
+            with lock:
+                for granule_id, size in granule_sizes(page, format):
+                    if granule_id not in seen:
+                        seen.add(granule_id)
+                        result.total_size += size
+                        result.count += 1
+
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        total = sum(pool.map(count, partitions), Estimate())
+
+    logger.info(
+        f"{total.count} granules ({total.total_size / 2**30:.1f} GiB)"
+        f" in {len(partitions)} partition(s) of {url}"
+    )
+
+    return total
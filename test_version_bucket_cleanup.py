@@ -0,0 +1,167 @@
+import functools
+import itertools
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List
+
+import boto3
+import moto.s3.models
+import pytest
+from moto import mock_s3
+
+import version_bucket_cleanup as vbc
+from version_bucket_cleanup import Deleter, Version, group_by_key, select_versions
+
+BUCKET = "versioned-bucket"
+
+
+@pytest.fixture
+def s3_client(monkeypatch: pytest.MonkeyPatch) -> Iterator:
+    # Moto's timestamps have a resolution of a second (as do S3's), so advance its
+    # clock a second at a time, for every version to have a distinct timestamp
+    clock = itertools.count()
+    start = datetime(2024, 1, 1)
+    monkeypatch.setattr(
+        moto.s3.models, "utcnow", lambda: start + timedelta(seconds=next(clock))
+    )
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        client.put_bucket_versioning(
+            Bucket=BUCKET, VersioningConfiguration={"Status": "Enabled"}
+        )
+
+        # 2 versions of a and b (sizes 1 and 2, newest last), and of c, which is
+        # then deleted (adding a delete marker as its newest version)
+        for key in ("p/a", "p/b", "p/c"):
+            for size in (1, 2):
+                client.put_object(Bucket=BUCKET, Key=key, Body=b"x" * size)
+
+        client.delete_object(Bucket=BUCKET, Key="p/c")
+
+        yield client
+
+
+@pytest.fixture
+def small_pages(monkeypatch: pytest.MonkeyPatch) -> None:
+    # With 3 versions per page, the versions of p/b and p/c span 2 pages
+    monkeypatch.setattr(
+        vbc,
+        "list_version_pages",
+        functools.partial(vbc.list_version_pages, page_size=3),
+    )
+
+
+def remaining_versions(s3_client) -> List[Version]:
+    pages = vbc.list_version_pages(s3_client, BUCKET, "p/")
+    return [version for page in pages for version in vbc.parse_versions(page)]
+
+
+def make_version(key: str, days_ago: int, size: int = 1) -> Version:
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return Version(key, f"{key}-{days_ago}", now - timedelta(days=days_ago), size)
+
+
+def test_group_by_key_across_pages(s3_client) -> None:
+    pages = list(vbc.list_version_pages(s3_client, BUCKET, "p/", page_size=3))
+    groups = list(group_by_key(map(vbc.parse_versions, pages)))
+
+    assert len(pages) > 1
+    assert [[v.key for v in group] for group in groups] == [
+        ["p/a"] * 2,
+        ["p/b"] * 2,
+        ["p/c"] * 3,
+    ]
+    # Newest first, so the delete marker (of size 0) of c is first
+    assert [v.size for v in groups[1]] == [2, 1]
+    assert [v.size for v in groups[2]] == [0, 2, 1]
+
+
+def test_group_by_key_latest_first() -> None:
+    marker = Version("a", "marker", datetime(2024, 1, 1), is_latest=True)
+    version = Version("a", "version", datetime(2024, 1, 1), size=1)
+
+    # Of versions with equal timestamps, the latest is first
+    assert list(group_by_key([[version, marker]])) == [[marker, version]]
+
+
+def test_select_versions() -> None:
+    groups = [
+        [make_version("a", 1), make_version("a", 10), make_version("a", 20)],
+        [make_version("b", 30, size=0), make_version("b", 40)],
+    ]
+    cutoff = datetime(2024, 1, 1, tzinfo=timezone.utc) - timedelta(days=15)
+
+    def selected(**kwargs) -> List[str]:
+        return [v.version_id for v in select_versions(groups, **kwargs)]
+
+    assert selected() == ["a-1", "a-10", "a-20", "b-30", "b-40"]
+    assert selected(keep_latest=1) == ["a-10", "a-20", "b-40"]
+    assert selected(cutoff=cutoff) == ["a-20", "b-30", "b-40"]
+    assert selected(keep_latest=2, cutoff=cutoff) == ["a-20"]
+
+
+@pytest.mark.usefixtures("small_pages")
+def test_cleanup_keep_latest(s3_client) -> None:
+    stats = vbc.cleanup(s3_client, BUCKET, "p/", shard_depth=0, keep_latest=1)
+    remaining = remaining_versions(s3_client)
+
+    # Only the newest version of each key remains (the delete marker, for c)
+    assert [(v.key, v.size) for v in remaining] == [("p/a", 2), ("p/b", 2), ("p/c", 0)]
+    assert (stats.selected, stats.deleted, stats.failed) == (4, 4, 0)
+    assert stats.bytes == 1 + 1 + 2 + 1
+
+
+@pytest.mark.usefixtures("small_pages")
+def test_cleanup_dry_run(s3_client) -> None:
+    stats = vbc.cleanup(s3_client, BUCKET, "p/", dry_run=True)
+
+    assert (stats.selected, stats.deleted, stats.bytes) == (7, 0, 9)
+    assert len(remaining_versions(s3_client)) == 7
+
+
+def test_deleter_retries_retryable_errors(
+    s3_client, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(vbc.time, "sleep", lambda _: None)
+    versions = [v for v in remaining_versions(s3_client) if v.size]
+    by_key = {v.key: v for v in versions}
+    requests: List[List[str]] = []
+
+    class FlakyClient:
+        """Fails to delete p/a once (retryably), and p/b always (not retryably)."""
+
+        def delete_objects(self, Bucket: str, Delete: dict) -> dict:
+            keys = [o["Key"] for o in Delete["Objects"]]
+            requests.append(keys)
+            errors = [
+                {"Key": key, "VersionId": version_id, "Code": code}
+                for key, code in [("p/a", "SlowDown"), ("p/b", "AccessDenied")]
+                if key in keys and (key == "p/b" or len(requests) == 1)
+                for version_id in [by_key[key].version_id]
+            ]
+            failed = {error["Key"] for error in errors}
+            objects = [o for o in Delete["Objects"] if o["Key"] not in failed]
+            s3_client.delete_objects(
+                Bucket=Bucket, Delete=dict(Delete, Objects=objects)
+            )
+
+            return {"Errors": errors}
+
+    batch = [by_key["p/a"], by_key["p/b"], by_key["p/c"]]
+
+    with Deleter(FlakyClient(), BUCKET, max_workers=1, retries=2) as deleter:
+        deleter.submit(batch)
+
+    remaining = {(v.key, v.version_id) for v in remaining_versions(s3_client)}
+
+    # Only the retryable failure is retried, and the bytes of p/b (which was not
+    # deleted) are not counted
+    assert requests == [["p/a", "p/b", "p/c"], ["p/a"]]
+    assert (by_key["p/b"].key, by_key["p/b"].version_id) in remaining
+    assert (deleter.stats.deleted, deleter.stats.failed) == (2, 1)
+    assert deleter.stats.bytes == by_key["p/a"].size + by_key["p/c"].size
@@ -1,57 +1,456 @@
 """
     Cleanup S3 Bucket Versions Script
 
-    This script deletes all versions of objects in a prefix in an S3 bucket.
+    This script deletes versions of objects (and delete markers) in a prefix in a
+    versioned S3 bucket.  By default, every version is deleted, but versions may be
+    kept by age (--older-than) or recency (--keep-latest).
+
+    Listing is sharded by sub-prefix (--shard-depth), with shards listed
+    concurrently, and each page of versions is pipelined into concurrent
+    `delete_objects` calls of up to 1000 versions each.  Versions that fail to be
+    deleted due to throttling or transient errors are retried with backoff.
+
+    Example (run with --dry-run first, to see what would be deleted):
+
+        python version_bucket_cleanup.py nasa-maap-data-store \\
+            file-staging/nasa-map/BIOMASS/S1_DGM__1S/ --profile mcp --dry-run
 """
 
+import argparse
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
 import boto3
+from botocore.config import Config
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Maximum number of objects per delete_objects request
+MAX_BATCH_SIZE = 1000
+
+# Per-key error codes of delete_objects that are worth retrying
+RETRYABLE_CODES = {
+    "InternalError",
+    "OperationAborted",
+    "RequestTimeout",
+    "ServiceUnavailable",
+    "SlowDown",
+}
+
+
+@dataclass(frozen=True)
+class Version:
+    key: str
+    version_id: str
+    last_modified: datetime
+    size: int = 0  # 0 for delete markers
+    is_latest: bool = False
+
+
+@dataclass
+class Stats:
+    """Counts of versions, and the bytes of the versions deleted (or, in a dry run,
+    selected for deletion).
+    """
+
+    selected: int = 0
+    deleted: int = 0
+    failed: int = 0
+    bytes: int = 0
+
+
+class Deleter:
+    """Deletes batches of versions concurrently, limiting the number of batches in
+    flight (so that listing does not run arbitrarily far ahead of deletion), and
+    periodically logging throughput.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        max_workers: int = 16,
+        retries: int = 5,
+        dry_run: bool = False,
+        report_interval: float = 10.0,
+    ):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.retries = retries
+        self.dry_run = dry_run
+        self.report_interval = report_interval
+        self.stats = Stats()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(2 * max_workers)
+        self._lock = threading.Lock()
+        self._start = self._reported = time.perf_counter()
+
+    def __enter__(self) -> "Deleter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._pool.shutdown(wait=True)
+
+    def submit(self, versions: Sequence[Version]) -> None:
+        self._slots.acquire()
+        future = self._pool.submit(self._delete, versions)
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _delete(self, versions: Sequence[Version]) -> None:
+        if self.dry_run:
+            with self._lock:
+                self.stats.selected += len(versions)
+                self.stats.bytes += sum(version.size for version in versions)
 
-# Set up the S3 client
-session = boto3.Session(profile_name="mcp")
-s3 = session.client('s3')
-
-# Set the bucket name and prefix
-bucket_name = {REPLACE_YOUR_BUCKET} # example: 'nasa-maap-data-store'
-prefix = {REPLACE_YOUR_PREFIX} # example: 'file-staging/nasa-map/BIOMASS/S1_DGM__1S/'
-
-# Verify bucket prefix
-print(f"s3://{bucket_name}/{prefix}")
-
-# Initialize the markers
-next_key_marker = None
-next_version_id_marker = None
-
-# Get the object versions
-count = 0
-while True:
-    # Get the object versions
-    if next_key_marker and next_version_id_marker:
-        response = s3.list_object_versions(
-            Bucket=bucket_name, 
-            Prefix=prefix, 
-            KeyMarker=next_key_marker, 
-            VersionIdMarker=next_version_id_marker,
+            for version in versions:
+                logger.debug(f"would delete {version.key} ({version.version_id})")
+            self._report()
+            return
+
+        pending = {(version.key, version.version_id) for version in versions}
+        failed: Set[Tuple[str, str]] = set()
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={
+                        "Objects": [
+                            {"Key": key, "VersionId": version_id}
+                            for key, version_id in sorted(pending)
+                        ],
+                        "Quiet": True,
+                    },
+                )
+                errors = response.get("Errors", [])
+            except Exception as e:
+                # Throttling of the request itself is already retried by botocore
+                logger.error(f"failed to delete {len(pending)} versions: {e}")
+                failed |= pending
+                break
+
+            retryable = {
+                (error["Key"], error["VersionId"])
+                for error in errors
+                if error.get("Code") in RETRYABLE_CODES
+            }
+
+            for error in errors:
+                if error.get("Code") not in RETRYABLE_CODES:
+                    failed.add((error["Key"], error["VersionId"]))
+                    logger.error(
+                        f"failed to delete {error['Key']} ({error['VersionId']}):"
+                        f" {error.get('Code')}: {error.get('Message')}"
+                    )
+
+            if not retryable:
+                break
+
+            if attempt == self.retries:
+                failed |= retryable
+                logger.error(
+                    f"giving up on {len(retryable)} versions after"
+                    f" {self.retries} retries"
+                )
+                break
+
+            pending = retryable
+            time.sleep(min(2**attempt * 0.5, 30))
+
+        deleted = [v for v in versions if (v.key, v.version_id) not in failed]
+
+        # Only the bytes of versions actually deleted are counted
+        with self._lock:
+            self.stats.selected += len(versions)
+            self.stats.deleted += len(deleted)
+            self.stats.failed += len(versions) - len(deleted)
+            self.stats.bytes += sum(version.size for version in deleted)
+
+        self._report()
+
+    def _report(self, final: bool = False) -> None:
+        now = time.perf_counter()
+
+        with self._lock:
+            if not final and now - self._reported < self.report_interval:
+                return
+
+            self._reported = now
+            stats = self.stats
+
+        elapsed = now - self._start
+        verb = "selected" if self.dry_run else "deleted"
+        done = stats.selected if self.dry_run else stats.deleted
+        logger.info(
+            f"{verb} {done} versions ({stats.bytes / 1e9:.2f} GB)"
+            f" in {elapsed:.0f}s ({done / max(elapsed, 1e-9):.0f} versions/s)"
+            + ("" if self.dry_run else f", {stats.failed} failed")
         )
-    else:
-        response = s3.list_object_versions(
-            Bucket=bucket_name, 
-            Prefix=prefix,
+
+    def report(self) -> None:
+        self._report(final=True)
+
+
+def parse_versions(response: Dict[str, Any]) -> List[Version]:
+    """Return the versions and delete markers of a list_object_versions response,
+    ordered by key.
+    """
+    versions = [
+        Version(
+            v["Key"],
+            v["VersionId"],
+            v["LastModified"],
+            v.get("Size", 0),
+            v.get("IsLatest", False),
         )
+        for v in response.get("Versions", []) + response.get("DeleteMarkers", [])
+    ]
 
-    # Delete versions
-    # There should be be at least one DeleteMarker or Version in the response
-    if delete_markers := [
-        {'Key': version['Key'], 'VersionId': version['VersionId']}
-        for version in (response.get('DeleteMarkers', []) + response.get('Versions', []))
-    ]:
-        count += len(delete_markers)
-        s3.delete_objects(Bucket=bucket_name, Delete={'Objects': delete_markers})
-
-    # Check if there are more versions to retrieve
-    if response['IsTruncated']:
-        next_key_marker = response['NextKeyMarker']
-        next_version_id_marker = response['NextVersionIdMarker']
+    return sorted(versions, key=lambda v: v.key)
+
+
+def list_version_pages(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    delimiter: Optional[str] = None,
+    page_size: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    kwargs: Dict[str, Any] = dict(Bucket=bucket, Prefix=prefix)
+
+    if delimiter:
+        kwargs["Delimiter"] = delimiter
+    if page_size:
+        kwargs["PaginationConfig"] = {"PageSize": page_size}
+
+    for page in s3_client.get_paginator("list_object_versions").paginate(**kwargs):
+        yield page
+
+
+def group_by_key(pages: Iterable[List[Version]]) -> Iterator[List[Version]]:
+    """Group versions by key, across pages (the versions of a key may span pages),
+    ordering the versions of each key from newest to oldest.
+    """
+
+    def newest_first(group: List[Version]) -> List[Version]:
+        # Timestamps have a resolution of a second, so of versions with equal
+        # timestamps, the latest version (which may be a delete marker) is first.
+        # Sorting is stable, so other versions with equal timestamps keep S3's order
+        return sorted(group, key=lambda v: (v.last_modified, v.is_latest), reverse=True)
+
+    group: List[Version] = []
+
+    for page in pages:
+        for version in page:
+            if group and version.key != group[0].key:
+                yield newest_first(group)
+                group = []
+
+            group.append(version)
+
+    if group:
+        yield newest_first(group)
+
+
+def select_versions(
+    groups: Iterable[List[Version]],
+    keep_latest: int = 0,
+    cutoff: Optional[datetime] = None,
+) -> Iterator[Version]:
+    """Select the versions to delete from groups of versions of the same key (from
+    newest to oldest), keeping the `keep_latest` newest versions of each key, and
+    any version modified after the cutoff.
+    """
+    for group in groups:
+        for version in group[keep_latest:]:
+            if cutoff is None or version.last_modified < cutoff:
+                yield version
+
+
+def clean_prefix(
+    s3_client,
+    deleter: Deleter,
+    bucket: str,
+    prefix: str,
+    delimiter: Optional[str] = None,
+    keep_latest: int = 0,
+    cutoff: Optional[datetime] = None,
+) -> List[str]:
+    """Delete the selected versions in a prefix (only those directly in the prefix,
+    when a delimiter is given), returning the prefix's common prefixes.
+    """
+    common_prefixes: List[str] = []
+
+    def pages() -> Iterator[List[Version]]:
+        for response in list_version_pages(s3_client, bucket, prefix, delimiter):
+            common_prefixes.extend(
+                p["Prefix"] for p in response.get("CommonPrefixes", [])
+            )
+            yield parse_versions(response)
+
+    batch: List[Version] = []
+
+    for version in select_versions(group_by_key(pages()), keep_latest, cutoff):
+        batch.append(version)
+
+        if len(batch) == MAX_BATCH_SIZE:
+            deleter.submit(batch)
+            batch = []
+
+    if batch:
+        deleter.submit(batch)
+
+    return common_prefixes
+
+
+def cleanup(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    shard_depth: int = 1,
+    max_workers: int = 16,
+    retries: int = 5,
+    keep_latest: int = 0,
+    older_than: Optional[timedelta] = None,
+    dry_run: bool = False,
+) -> Stats:
+    """Delete the selected versions in a prefix, listing sub-prefixes `shard_depth`
+    levels below the prefix concurrently.  Return statistics of the deletion.
+    """
+    cutoff = datetime.now(timezone.utc) - older_than if older_than else None
+    shards = [prefix]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as listers, Deleter(
+        s3_client, bucket, max_workers, retries, dry_run
+    ) as deleter:
+
+        def clean(shard_and_delimiter: Tuple[str, Optional[str]]) -> List[str]:
+            shard, delimiter = shard_and_delimiter
+            return clean_prefix(
+                s3_client, deleter, bucket, shard, delimiter, keep_latest, cutoff
+            )
+
+        # Intermediate levels are listed non-recursively, deleting only the
+        # versions directly within them, to find the shards of the next level
+        for _ in range(shard_depth):
+            shards = [
+                sub_prefix
+                for sub_prefixes in listers.map(clean, [(s, "/") for s in shards])
+                for sub_prefix in sub_prefixes
+            ]
+
+        logger.info(f"cleaning {len(shards)} shard(s) of s3://{bucket}/{prefix}")
+        list(listers.map(clean, [(s, None) for s in shards]))
+
+    deleter.report()
+
+    return deleter.stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Delete versions of objects in a prefix in a versioned S3 bucket"
+    )
+    parser.add_argument("bucket", help="name of the bucket")
+    parser.add_argument(
+        "prefix",
+        help="prefix of the objects (e.g., file-staging/nasa-map/BIOMASS/S1_DGM__1S/)",
+    )
+    parser.add_argument("--profile", help="AWS profile to use (e.g., mcp)")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report the versions that would be deleted, without deleting them",
+    )
+    parser.add_argument(
+        "--older-than",
+        type=float,
+        metavar="DAYS",
+        help="delete only versions last modified more than this many days ago",
+    )
+    parser.add_argument(
+        "--keep-latest",
+        type=int,
+        default=0,
+        metavar="N",
+        help="keep the N newest versions (including delete markers) of every key"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shard-depth",
+        type=int,
+        default=1,
+        help="number of sub-prefix levels to list concurrently, as separate shards"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=16,
+        help="number of concurrent listing and deletion requests"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="number of times to retry versions that fail to be deleted due to"
+        " throttling or transient errors (default: %(default)s)",
+    )
+    parser.add_argument("--endpoint-url", help="S3 endpoint URL")
+    args = parser.parse_args()
+
+    session = boto3.Session(profile_name=args.profile)
+    s3_client = session.client(
+        "s3",
+        endpoint_url=args.endpoint_url,
+        config=Config(
+            retries={"max_attempts": 10, "mode": "adaptive"},
+            max_pool_connections=2 * args.max_workers,
+        ),
+    )
+
+    # Verify bucket prefix
+    logger.info(f"s3://{args.bucket}/{args.prefix}")
+
+    stats = cleanup(
+        s3_client,
+        args.bucket,
+        args.prefix,
+        shard_depth=args.shard_depth,
+        max_workers=args.max_workers,
+        retries=args.retries,
+        keep_latest=args.keep_latest,
+        older_than=timedelta(days=args.older_than) if args.older_than else None,
+        dry_run=args.dry_run,
+    )
+
+    if args.dry_run:
+        print(f"Would delete {stats.selected} versions")
     else:
-        break
+        print(f"Deleted {stats.deleted} versions ({stats.failed} failed)")
+
+    sys.exit(1 if stats.failed else 0)
+
 
-print(f'Deleted {count} versions')
+if __name__ == "__main__":
+    main()